@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+#
+# ZX Raspberry Keyboard Scanner - sound cue benchmark
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Plays mode change cues through the feedback thread into a WAV file and
+# reports how long each took from being asked for to starting, using the
+# WAV sink's log. Uses the real dings if mpg123 is installed, otherwise a
+# synthesised beep.
+#
+#   python3 benchmarks/bench_audio.py [cues] [out.wav]
+#
+
+import math, os, struct, sys, tempfile, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import zxaudio, zxfeedback
+
+here = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+
+
+# 200ms of a 1 kHz beep
+def beep():
+    samples = []
+    for frame in range(zxaudio.RATE // 5):
+        sample = int(8000 * math.sin(2 * math.pi * 1000 * frame / zxaudio.RATE))
+        samples.append(struct.pack('<hh', sample, sample))
+    return b''.join(samples)
+
+
+def main():
+    cues = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(tempfile.mkdtemp(), 'cues.wav')
+
+    sink = zxaudio.WavSink(path)
+    start = time.perf_counter()
+    player = zxaudio.Player(sink, {'ding1': os.path.join(here, 'ding1.mp3'), 'ding2': os.path.join(here, 'ding2.mp3')})
+    if len(player.sounds) < 2:
+        print('Using a synthesised beep')
+        player.sounds = {'ding1': beep(), 'ding2': beep()}
+    print('Decoded in %.1fms' % ((time.perf_counter() - start) * 1000))
+
+    feedback = zxfeedback.Feedback(sound=player.play, maxAge=10)
+    requested = []
+    for cue in range(cues):
+        requested.append(time.monotonic())
+        feedback.play('ding%d' % (cue % 2 + 1))
+        time.sleep(.5)
+    feedback.close()
+    player.close()
+
+    delays = sorted(started - asked for asked, (started, position, frames) in zip(requested, sink.log))
+    print('%d cues written to %s' % (len(sink.log), path))
+    print('Request to start: median %.2fms, worst %.2fms' % (delays[len(delays) // 2] * 1000, delays[-1] * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+#
+# ZX Raspberry Keyboard Scanner - button gesture benchmark
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Plays scripted button presses, with contact bounce, through
+# ButtonGestures on a virtual nanosecond clock. The loop sleeps exactly as
+# the scanners do: until the pin changes or timeout() runs out. Prints the
+# gestures each script produced against the ones it should have, and how
+# long after the moment it was decided each gesture fired. Exits non-zero if
+# any script produced the wrong gestures.
+#
+#   python3 benchmarks/bench_button.py [runs]
+#
+
+import os, random, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import zxbutton
+
+MS = zxbutton.MS
+LONG_PRESS = 3 * zxbutton.SECOND
+
+# (name, [(down ms, up ms), ...], gestures expected without and with a
+# double tap handler (HOLD left out))
+SCRIPTS = [
+    ('tap', [(0, 120)], ['tap'], ['tap']),
+    ('double tap', [(0, 100), (250, 350)], ['tap', 'tap'], ['double tap']),
+    ('two taps', [(0, 100), (700, 800)], ['tap', 'tap'], ['tap', 'tap']),
+    ('long press', [(0, 4000)], ['long press'], ['long press']),
+    ('just short', [(0, 2900)], ['tap'], ['tap']),
+    ('tap, long', [(0, 100), (1000, 5000)], ['tap', 'long press'], ['tap', 'long press']),
+]
+
+
+class VirtualClock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+# Pin levels over time: a list of (ns, level) with bounce on every edge
+def pinTrace(presses, bounce):
+    trace = []
+    for down, up in presses:
+        for edge, level in ((down, True), (up, False)):
+            t = edge * MS
+            for chatter in range(random.randint(0, bounce)):
+                trace.append((t, level))
+                t += random.randint(MS // 10, 2 * MS)
+                trace.append((t, not level))
+                t += random.randint(MS // 10, 2 * MS)
+            trace.append((t, level))
+    return trace
+
+
+def run(presses, bounce, doubleTaps):
+    clock = VirtualClock()
+    gestures = zxbutton.ButtonGestures(longPress=LONG_PRESS, clock=clock)
+    fired = []
+    for gesture in (zxbutton.TAP, zxbutton.DOUBLE_TAP, zxbutton.LONG_PRESS):
+        if gesture == zxbutton.DOUBLE_TAP and not doubleTaps:
+            continue
+        gestures.on(gesture, lambda held, gesture=gesture: fired.append((zxbutton.GESTURE_NAMES[gesture], clock.now)))
+
+    trace = pinTrace(presses, bounce)
+    level = False
+    wakeups = 0
+    end = trace[-1][0] + 2 * zxbutton.SECOND
+    while clock.now < end:
+        timeout = gestures.timeout()
+        wake = end if timeout is None else clock.now + int(timeout * zxbutton.SECOND)
+        if trace and trace[0][0] <= wake:
+            clock.now, level = trace.pop(0)
+        else:
+            clock.now = wake
+        gestures.update(level)
+        wakeups += 1
+    return fired, wakeups
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    random.seed(1982)
+    failures = 0
+    for doubleTaps in (False, True):
+        print('double taps %s' % ('on' if doubleTaps else 'off'))
+        for name, presses, withoutDoubleTaps, withDoubleTaps in SCRIPTS:
+            expected = withDoubleTaps if doubleTaps else withoutDoubleTaps
+            wrong = 0
+            delays = []
+            wakeups = 0
+            for attempt in range(runs):
+                fired, woken = run(presses, 4, doubleTaps)
+                wakeups += woken
+                if [g for g, t in fired] != expected:
+                    wrong += 1
+                # Gestures decided on release, or at longPress for a long one
+                for gesture, t in fired:
+                    if gesture == 'long press':
+                        decided = presses[-1][0] * MS + LONG_PRESS
+                    else:
+                        decided = max(up for down, up in presses if up * MS <= t) * MS
+                    delays.append(t - decided)
+            delays.sort()
+            print('  %-12s %3d/%d wrong, %5.1f wakeups, fired after p50 %6.1fms max %6.1fms' % (
+                name, wrong, runs, float(wakeups) / runs, delays[len(delays) // 2] / 1e6, delays[-1] / 1e6))
+            failures += wrong
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
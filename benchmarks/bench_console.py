@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+#
+# ZX Raspberry Keyboard Scanner - console mode benchmark
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Checks every entry of the transition table (each state and each set of
+# shift, symbol and key inputs) against the if/continue chain it replaced,
+# then runs a random trace of console mode typing (letters, shifted
+# letters, symbols, extended mode) through both, checks they pick the same
+# layout and the same action on every frame, and times them per frame.
+# Exits non-zero on any difference.
+#
+#   python3 benchmarks/bench_console.py [frames]
+#
+
+import os, random, sys, time
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import zxconsole, zxkeymap, zxmatrix
+
+SHIFT_INDEX = zxkeymap.keyIndex(5, 0)
+SYMBOL_INDEX = zxkeymap.keyIndex(7, 1)
+KEYS_MASK = zxmatrix.keyMask(i for i in range(zxmatrix.KEYS) if i not in (SHIFT_INDEX, SYMBOL_INDEX))
+KEYMAPS = tuple(tuple((state, i) for i in range(zxmatrix.KEYS)) for state in range(4))
+
+
+# The old keyscanner logic, press times and all
+class LegacyConsole(object):
+
+    def __init__(self):
+        self.mode = 0
+        self.modeTime = 0
+        self.extendedPressed = False
+        # Press time of every key, only written when a key goes down
+        self.pressTimes = array('d', [0.0] * zxmatrix.KEYS)
+
+    def update(self, now, matrix, changed):
+        for keyIndex in zxmatrix.keyIndexes(matrix & changed):
+            self.pressTimes[keyIndex] = now
+        listPressed = matrix & KEYS_MASK
+        shiftkey = (matrix >> SHIFT_INDEX) & 1 and self.pressTimes[SHIFT_INDEX]
+        symbolkey = (matrix >> SYMBOL_INDEX) & 1 and self.pressTimes[SYMBOL_INDEX]
+        if shiftkey > self.modeTime or symbolkey > self.modeTime:
+            if shiftkey and symbolkey:
+                self.mode = 0 if self.mode == 3 else 3
+                self.extendedPressed = False
+            elif shiftkey:
+                self.mode = 1
+            elif symbolkey:
+                self.mode = 2
+            self.modeTime = now
+            return zxconsole.SWITCH
+        if self.mode == 3 and (shiftkey or symbolkey):
+            return zxconsole.BLOCK
+        if self.mode == 0 and (shiftkey or symbolkey):
+            return zxconsole.BLOCK
+        if self.mode == 1 and symbolkey:
+            return zxconsole.BLOCK
+        if self.mode == 2 and shiftkey:
+            return zxconsole.BLOCK
+        if (self.mode == 1 and not shiftkey) or (self.mode == 2 and not symbolkey) or \
+                (self.mode == 3 and self.extendedPressed and not listPressed):
+            self.mode = 0
+            self.modeTime = now
+            return zxconsole.SWITCH
+        return zxconsole.TYPE
+
+    def keyTyped(self):
+        self.extendedPressed = True
+
+
+# What the legacy logic does in a state with one frame's inputs: shifts
+# that went down this frame were pressed after the last switch, ones only
+# held were pressed before it
+def legacyTransition(state, inputs):
+    console = LegacyConsole()
+    console.mode = state
+    console.modeTime = 2
+    console.extendedPressed = bool(inputs & zxconsole.TYPED)
+    matrix = 0
+    changed = 0
+    for index, down, held in ((SHIFT_INDEX, zxconsole.SHIFT_DOWN, zxconsole.SHIFT_HELD),
+            (SYMBOL_INDEX, zxconsole.SYMBOL_DOWN, zxconsole.SYMBOL_HELD)):
+        console.pressTimes[index] = 1
+        if inputs & held:
+            matrix |= 1 << index
+        if inputs & down:
+            changed |= 1 << index
+    if inputs & zxconsole.KEYS_HELD:
+        matrix |= KEYS_MASK & -KEYS_MASK
+    action = console.update(3, matrix, changed)
+    return console.mode, action
+
+
+# Table entries that differ from the legacy logic, as (state, inputs)
+def tableMismatches():
+    return [(state, inputs) for state in range(4) for inputs in range(zxconsole.INPUTS)
+        if zxconsole.TRANSITIONS[state << 6 | inputs] != legacyTransition(state, inputs)]
+
+
+# Frames of (matrix, changed), only the ones where something changed
+def typingTrace(frames):
+    trace = []
+    matrix = 0
+    shifts = (1 << SHIFT_INDEX, 1 << SYMBOL_INDEX)
+    while len(trace) < frames:
+        if random.random() < .3:
+            bit = random.choice(shifts + (shifts[0] | shifts[1],))
+        else:
+            bit = 1 << random.choice([i for i in range(zxmatrix.KEYS) if (KEYS_MASK >> i) & 1])
+        if matrix & bit == bit and random.random() < .7:
+            new = matrix & ~bit
+        else:
+            new = matrix | bit
+        if new != matrix:
+            trace.append((new, new ^ matrix))
+            matrix = new
+    return trace
+
+
+def run(trace, console, now=None):
+    actions = []
+    start = time.process_time()
+    for frame, (matrix, changed) in enumerate(trace):
+        if now:
+            action = console.update(frame + 1, matrix, changed)
+        else:
+            action = console.update(matrix, changed)
+        if action == zxconsole.TYPE and matrix & KEYS_MASK:
+            console.keyTyped()
+        state = console.mode if now else console.state
+        actions.append((state, action))
+    return actions, (time.process_time() - start) / len(trace)
+
+
+def main():
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+    entries = tableMismatches()
+    print('%d table entries, %d mismatches' % (len(zxconsole.TRANSITIONS), len(entries)))
+    for state, inputs in entries:
+        print('  %s inputs %#04x: table %r, legacy %r' % (zxconsole.STATE_NAMES[state], inputs,
+            zxconsole.TRANSITIONS[state << 6 | inputs], legacyTransition(state, inputs)))
+
+    random.seed(1982)
+    trace = typingTrace(frames)
+
+    legacy, legacyCost = run(trace, LegacyConsole(), now=True)
+    table, tableCost = run(trace, zxconsole.ConsoleKeyboard(KEYMAPS, SHIFT_INDEX, SYMBOL_INDEX, KEYS_MASK))
+
+    mismatches = sum(1 for a, b in zip(legacy, table) if a != b)
+    print('%d frames, %d mismatches' % (len(trace), mismatches))
+    print('if/continue chain  %.2fus/frame' % (legacyCost * 1e6))
+    print('transition table   %.2fus/frame' % (tableCost * 1e6))
+    if entries or mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
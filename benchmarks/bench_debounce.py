@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+#
+# ZX Raspberry Keyboard Scanner - debounce benchmark
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Plays simulated membrane traces scanned at 1 kHz through the debouncer:
+# every keystroke chatters for up to 5ms when it goes down and again when
+# it comes up, and there's the odd single scan glitch in between. Counts
+# the press/release events that come out against the keystrokes that went
+# in, with and without debouncing, and the cost per scan. Exits non-zero if
+# any spurious events get through the debouncer.
+#
+#   python3 benchmarks/bench_debounce.py [keystrokes] [press] [release]
+#
+
+import os, random, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import zxmatrix
+
+# Scans per millisecond at 1 kHz
+SCAN = 1
+
+
+# A trace of raw matrix values with the given number of keystrokes
+def bounceTrace(keystrokes, maxBounce=5 * SCAN):
+    trace = []
+    for keystroke in range(keystrokes):
+        bit = 1 << random.randrange(zxmatrix.KEYS)
+        trace += [0] * random.randint(20 * SCAN, 150 * SCAN)
+        if random.random() < .2:
+            trace[-random.randint(1, 10)] |= bit        # glitch
+        trace += [bit * random.randint(0, 1) for scan in range(random.randint(0, maxBounce))]
+        trace += [bit] * random.randint(30 * SCAN, 200 * SCAN)
+        trace += [bit * random.randint(0, 1) for scan in range(random.randint(0, maxBounce))]
+    trace += [0] * 20 * SCAN
+    return trace
+
+
+def countEvents(trace, debouncer):
+    state = events = 0
+    start = time.process_time()
+    for raw in trace:
+        matrix = debouncer.update(raw) if debouncer else raw
+        events += bin(matrix ^ state).count('1')
+        state = matrix
+    return events, (time.process_time() - start) / len(trace)
+
+
+def main():
+    keystrokes = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    press = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    release = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    random.seed(1982)
+    trace = bounceTrace(keystrokes)
+    expected = keystrokes * 2
+
+    for name, debouncer in (('raw', None), ('debounced %d/%d' % (press, release), zxmatrix.Debouncer(press, release))):
+        events, cost = countEvents(trace, debouncer)
+        spurious = events - expected
+        print('%-16s %6d events for %d keystrokes, %5d spurious, %.2fus/scan' % (name, events, keystrokes, spurious, cost * 1e6))
+    # The last run is the debounced one
+    if spurious != 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+#
+# ZX Raspberry Keyboard Scanner - uinput emission benchmark
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Time and write() calls to send a 10 key rollover burst (ten presses in
+# one scan, then ten releases in the next) three ways: emit() with a sync
+# per event as before, an EventBatch using syn=False and one syn(), and an
+# EventBatch writing packed input_events. The device is a stand-in that
+# writes to /dev/null the way python-uinput writes to /dev/uinput.
+#
+#   python3 benchmarks/bench_emit.py [bursts]
+#
+
+import os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import zxoutput
+
+EV_KEY = 0x01
+KEYS = [(EV_KEY, code) for code in range(16, 26)]
+
+
+# Behaves like uinput.Device: one write() per event and per sync
+class NullDevice(object):
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.writes = 0
+
+    def emit(self, event, value, syn=True):
+        os.write(self.fd, zxoutput.INPUT_EVENT.pack(0, 0, event[0], event[1], value))
+        self.writes += 1
+        if syn:
+            self.syn()
+
+    def syn(self):
+        os.write(self.fd, zxoutput.SYN_EVENT)
+        self.writes += 1
+
+
+def perEvent(fd, bursts):
+    device = NullDevice(fd)
+    start = time.perf_counter()
+    for burst in range(bursts):
+        for value in (1, 0):
+            for event in KEYS:
+                device.emit(event, value)
+    return (time.perf_counter() - start) / bursts, device.writes / (bursts * 2.0)
+
+
+def batched(fd, bursts, packed):
+    device = NullDevice(fd)
+    batch = zxoutput.EventBatch(device, fd if packed else None)
+    start = time.perf_counter()
+    for burst in range(bursts):
+        for event in KEYS:
+            batch.press(event)
+        batch.flush()
+        for event in KEYS:
+            batch.release(event)
+        batch.flush()
+    writes = device.writes if not packed else batch.writes
+    return (time.perf_counter() - start) / bursts, writes / (bursts * 2.0)
+
+
+def main():
+    bursts = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    fd = os.open(os.devnull, os.O_WRONLY)
+    print('                     us/burst   writes/frame')
+    for name, run in (('emit + sync', lambda: perEvent(fd, bursts)),
+                      ('batch syn=False', lambda: batched(fd, bursts, False)),
+                      ('batch packed', lambda: batched(fd, bursts, True))):
+        cost, writes = run()
+        print('%-18s %10.1f %14.1f' % (name, cost * 1e6, writes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+#
+# ZX Raspberry Keyboard Scanner - feedback benchmark
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Runs the frame scheduler at 500 Hz with a key click every 20 frames and
+# a mode change beep every 250: first with no beeps at all for a baseline,
+# then beeping inline like the old bip() and then through the feedback
+# thread, and reports the frame period and overruns for each.
+#
+# Through the feedback thread the frame period should stay as flat as the
+# baseline's: the run exits non-zero if its p99 is more than P99_FACTOR
+# times the baseline's or its worst frame more than MAX_SLACK seconds over
+# the baseline's. Both are loose, as a busy machine's own hiccups are
+# easily a few frames, but a beep played inline (200ms) is well over.
+#
+#   python3 benchmarks/bench_feedback.py [frames]
+#
+
+import os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import zxfeedback, zxscheduler
+
+RATE = 500
+P99_FACTOR = 2
+MAX_SLACK = .05
+
+
+def tone(frequency):
+    pass
+
+
+def noBip(frequency, length):
+    pass
+
+
+def inlineBip(frequency, length):
+    tone(frequency)
+    time.sleep(length / 1000.0)
+    tone(0)
+
+
+def run(frames, bip):
+    scheduler = zxscheduler.FrameScheduler(RATE)
+    periods = []
+    last = None
+    for frame in range(frames):
+        scheduler.waitNextFrame()
+        now = time.perf_counter()
+        if last is not None:
+            periods.append(now - last)
+        last = now
+        if frame % 250 == 0:
+            bip(1000, 200)
+        elif frame % 20 == 0:
+            bip(3000, 1)
+    periods.sort()
+    return periods[len(periods) // 2], periods[int(len(periods) * .99)], periods[-1], scheduler.overruns
+
+
+def main():
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    feedback = zxfeedback.Feedback(tone=tone)
+    print('                 median     p99        max  overruns')
+    results = {}
+    for name, bip in (('no bip', noBip), ('inline bip', inlineBip), ('feedback', feedback.bip)):
+        median, p99, worst, overruns = results[name] = run(frames, bip)
+        print('%-12s %8.3fms %8.3fms %8.3fms %9d' % (name, median * 1000, p99 * 1000, worst * 1000, overruns))
+    feedback.close()
+    print('feedback played %d, dropped %d' % (feedback.played, feedback.dropped))
+
+    baseline = results['no bip']
+    queued = results['feedback']
+    if queued[1] > baseline[1] * P99_FACTOR or queued[2] > baseline[2] + MAX_SLACK:
+        print('feedback frame period not flat: p99 over %.3fms or max over %.3fms' % (
+            baseline[1] * P99_FACTOR * 1000, (baseline[2] + MAX_SLACK) * 1000))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
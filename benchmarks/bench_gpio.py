@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+#
+# ZX Raspberry Keyboard Scanner - matrix read benchmark
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Compares full 8x5 matrix scans per second for the memory mapped GPIO
+# path and the wiringpi path. Off a Pi the memory mapped path runs against
+# a file standing in for /dev/gpiomem and the wiringpi path is skipped.
+#
+#   python3 benchmarks/bench_gpio.py [scans] [/dev/gpiomem]
+#
+
+import os, sys, tempfile, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import zxgpio
+
+# MagPi Article Mappings
+dataLines = [26,19,13,6,5]
+addressLines = [25,24,23,22,27,18,17,4]
+
+
+def scansPerSecond(lines, scans):
+    start = time.perf_counter()
+    for scan in range(scans):
+        for addressLine in range(8):
+            lines.selectRow(addressLine)
+            lines.readRow()
+            lines.releaseRow(addressLine)
+    return scans / (time.perf_counter() - start)
+
+
+def main():
+    scans = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    path = sys.argv[2] if len(sys.argv) > 2 else None
+
+    if path is None:
+        path = zxgpio.createRegisterFile(os.path.join(tempfile.mkdtemp(), 'gpiomem'))
+        print('Using register file %s' % path)
+
+    rate = scansPerSecond(zxgpio.GpioMemLines(addressLines, dataLines, path), scans)
+    print('gpiomem:  %10.0f scans/sec' % rate)
+
+    try:
+        import wiringpi
+    except ImportError:
+        print('wiringpi: not installed, skipped')
+        return
+    wiringpi.wiringPiSetupGpio()
+    rate = scansPerSecond(zxgpio.WiringPiLines(addressLines, dataLines), scans)
+    print('wiringpi: %10.0f scans/sec' % rate)
+
+
+if __name__ == '__main__':
+    main()
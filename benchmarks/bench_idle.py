@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+#
+# ZX Raspberry Keyboard Scanner - idle mode benchmark
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Lets the scan engine go idle on a simulated edge source, then presses a
+# key from another thread and measures how long until a frame containing
+# it comes back, plus the CPU used while idle and while scanning flat out.
+#
+#   python3 benchmarks/bench_idle.py [presses] [scan rate]
+#
+
+import os, sys, threading, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import zxengine, zxidle, zxscheduler
+
+
+# Matrix lines with one key (address line 0, data line 0) that can be held
+class SimulatedLines(object):
+
+    def __init__(self):
+        self.held = False
+        self.selected = set()
+
+    def selectRow(self, row):
+        self.selected.add(row)
+
+    def releaseRow(self, row):
+        self.selected.discard(row)
+
+    def selectAll(self):
+        self.selected = set(range(8))
+
+    def releaseAll(self):
+        self.selected = set()
+
+    def readRow(self):
+        return 1 if self.held and 0 in self.selected else 0
+
+
+def main():
+    presses = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    rate = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    lines = SimulatedLines()
+    source = zxidle.SimulatedEdgeSource()
+    idle = zxidle.IdleMode(source, quietFrames=rate // 10)
+    engine = zxengine.ScanEngine(lines, zxscheduler.FrameScheduler(rate), idle)
+    pressedAt = [0.0]
+
+    def typist():
+        for press in range(presses):
+            # Wait until the engine is asleep, then press and let go
+            while not source.armed:
+                time.sleep(.001)
+            time.sleep(.05)
+            pressedAt[0] = time.perf_counter()
+            lines.held = True
+            source.trigger(0)
+            time.sleep(.02)
+            lines.held = False
+
+    thread = threading.Thread(target=typist)
+    thread.daemon = True
+    thread.start()
+
+    latencies = []
+    wasDown = False
+    activeCpu = activeTime = 0.0
+    while thread.is_alive() or wasDown:
+        beforeCpu, before = time.process_time(), time.perf_counter()
+        idleBefore = idle.idleTime
+        matrix = engine.nextFrame()
+        if matrix and not wasDown:
+            latencies.append(time.perf_counter() - pressedAt[0])
+        wasDown = bool(matrix)
+        if idle.idleTime == idleBefore:
+            activeCpu += time.process_time() - beforeCpu
+            activeTime += time.perf_counter() - before
+
+    latencies.sort()
+    print('Presses from idle:   %d' % len(latencies))
+    print('Press latency:       median %.3fms, worst %.3fms' % (latencies[len(latencies) // 2] * 1000, latencies[-1] * 1000))
+    print('Edge to wake:        worst %.3fms' % (idle.worstWakeLatency * 1000))
+    print('CPU while idle:      %.2f%% over %.2fs' % (idle.cpuUse() * 100, idle.idleTime))
+    print('CPU while scanning:  %.2f%% at %d Hz' % (activeCpu / activeTime * 100, rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+#
+# ZX Raspberry Keyboard Scanner - keymap file benchmark
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Times loading each scanner's keymap file (in a scratch copy) the three
+# ways zxkeyfile can:
+#
+#   compile   parse and compile the text, writing the cache
+#   cached    straight from the cache (mtime and size match)
+#   touched   mtime changed but not the text, so hashed and then cached
+#
+# then saves changed copies of keyscanner's file, by writing in place and
+# by writing a new file and renaming it over the old one, and reports how
+# long KeymapWatcher takes to hand over the new keymaps (from the save to
+# onChange, less the settle time it waits for a save to finish), and that
+# a broken save is rejected.
+#
+#   python3 benchmarks/bench_keyfile.py [runs]
+#
+
+import os, shutil, sys, tempfile, threading, time
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+import zxkeycodes, zxkeyfile
+
+K = zxkeyfile.KEYS
+C = zxkeyfile.CHORDS
+FILES = [
+    ('zxscanner.keymap', {'keys': K, 'funcKeys': K}),
+    ('keyscanner.keymap', {'keys': K, 'funcKeys': K, 'normalKeys': C, 'shiftKeys': C, 'symbolKeys': C, 'extendedKeys': C}),
+]
+CAPABILITIES = [value for name, value in vars(zxkeycodes).items() if name.startswith('KEY_')]
+
+
+def timeLoads(path, tables, runs):
+    times = {}
+
+    start = time.perf_counter()
+    for run in range(runs):
+        os.utime(path)
+        shutil.rmtree(os.path.dirname(zxkeyfile.cachePath(path)), ignore_errors=True)
+        zxkeyfile.loadKeymaps(path, tables, CAPABILITIES, zxkeycodes)
+    times['compile'] = (time.perf_counter() - start) / runs
+
+    start = time.perf_counter()
+    for run in range(runs):
+        keymaps = zxkeyfile.loadKeymaps(path, tables, CAPABILITIES, zxkeycodes)
+    times['cached'] = (time.perf_counter() - start) / runs
+    assert keymaps.cached
+
+    start = time.perf_counter()
+    for run in range(runs):
+        os.utime(path, ns=(run, run))
+        keymaps = zxkeyfile.loadKeymaps(path, tables, CAPABILITIES, zxkeycodes)
+    times['touched'] = (time.perf_counter() - start) / runs
+    assert keymaps.cached
+    return times
+
+
+def watch(path, tables, saves):
+    changed = threading.Event()
+    results = []
+
+    def load():
+        return zxkeyfile.loadKeymaps(path, tables, CAPABILITIES, zxkeycodes)
+
+    def onChange(keymaps):
+        results.append((time.perf_counter(), keymaps))
+        changed.set()
+
+    def onError(error):
+        results.append((time.perf_counter(), error))
+        changed.set()
+
+    watcher = zxkeyfile.KeymapWatcher(path, load, onChange, onError)
+    source = open(path).read()
+    latencies = {'in place': [], 'rename': []}
+    for save in range(saves):
+        # Swap two console keys back and forth
+        if save % 2:
+            text = source
+        else:
+            text = source.replace('LEFTCTRL+1      LEFTCTRL+2', 'LEFTCTRL+2      LEFTCTRL+1', 1)
+        how = 'rename' if save % 4 >= 2 else 'in place'
+        changed.clear()
+        start = time.perf_counter()
+        if how == 'rename':
+            with open(path + '.new', 'w') as f:
+                f.write(text)
+            os.replace(path + '.new', path)
+        else:
+            with open(path, 'w') as f:
+                f.write(text)
+        if not changed.wait(2):
+            print('  no reload after save %d' % save)
+            continue
+        when, keymaps = results[-1]
+        assert keymaps.names['extendedKeys'][0] == (('LEFTCTRL', '1') if save % 2 else ('LEFTCTRL', '2'))
+        latencies[how].append((when - start - watcher.settle) * 1000)
+        time.sleep(.02)
+
+    changed.clear()
+    with open(path, 'a') as f:
+        f.write('\n[keymap nonsense]\n')
+    changed.wait(2)
+    rejected = results and isinstance(results[-1][1], ValueError)
+    watcher.close()
+    return latencies, watcher, rejected
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    scratch = tempfile.mkdtemp()
+    try:
+        print('%-18s %10s %10s %10s' % ('loading', 'compile', 'cached', 'touched'))
+        for name, tables in FILES:
+            path = os.path.join(scratch, name)
+            shutil.copy(os.path.join(HERE, '..', 'keymaps', name), path)
+            times = timeLoads(path, tables, runs)
+            print('%-18s %8.3fms %8.3fms %8.3fms' % (name, times['compile'] * 1000, times['cached'] * 1000, times['touched'] * 1000))
+
+        name, tables = FILES[1]
+        latencies, watcher, rejected = watch(os.path.join(scratch, name), tables, 40)
+        print('KeymapWatcher (%s, settle %.0fms not counted)' % ('inotify' if watcher.fd is not None else 'polling', watcher.settle * 1000))
+        for how, values in sorted(latencies.items()):
+            values.sort()
+            if values:
+                print('  %-9s %d saves, reloaded in p50 %.2fms, max %.2fms' % (how, len(values), values[len(values) // 2], values[-1]))
+        print('  broken save %s, %d reloads, %d errors' % ('rejected' if rejected else 'NOT REJECTED', watcher.reloads, watcher.errors))
+    finally:
+        shutil.rmtree(scratch)
+
+
+if __name__ == '__main__':
+    main()
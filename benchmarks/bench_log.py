@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+#
+# ZX Raspberry Keyboard Scanner - logging benchmark
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Logs a press and a release per simulated scan into a pipe whose reader
+# only takes 64 bytes every 10ms, like a journald that has fallen behind,
+# and times each scan's logging:
+#
+#   print        what the scanners used to do
+#   logger off   zxlog.Logger at INFO, so the per key messages are ignored
+#   logger on    zxlog.Logger at DEBUG, so they go through the ring
+#
+#   python3 benchmarks/bench_log.py [scans]
+#
+# Reports the time per scan and the worst stall; the logger should never
+# stall, at the price of dropping messages the pipe had no room for.
+#
+
+import fcntl, os, sys, threading, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import zxlog
+
+F_SETPIPE_SZ = 1031
+
+
+# A pipe with a small buffer and a slow reader, returned as a text file
+def slowPipe(chunk=64, interval=.01):
+    readFd, writeFd = os.pipe()
+    try:
+        fcntl.fcntl(writeFd, F_SETPIPE_SZ, 4096)
+    except OSError:
+        pass
+    running = [True]
+
+    def drain():
+        while running[0]:
+            try:
+                if not os.read(readFd, chunk):
+                    break
+            except OSError:
+                break
+            time.sleep(interval)
+
+    thread = threading.Thread(target=drain)
+    thread.daemon = True
+    thread.start()
+    out = os.fdopen(writeFd, 'w')
+
+    def close():
+        running[0] = False
+        out.close()
+        thread.join()
+        os.close(readFd)
+    return out, close
+
+
+NAMES = ['KEY_%d' % key for key in range(40)]
+
+
+def run(scans, name, log):
+    times = []
+    for scan in range(scans):
+        start = time.perf_counter()
+        log('Pressing %s', NAMES[scan % 40])
+        log('Releasing %s', NAMES[scan % 40])
+        times.append(time.perf_counter() - start)
+        # the rest of a 2ms frame
+        time.sleep(.002)
+    times.sort()
+    print('  %-10s %7.2fus mean, p99 %8.2fus, worst %9.2fus' % (name,
+        sum(times) / len(times) * 1e6, times[int(len(times) * .99)] * 1e6, times[-1] * 1e6))
+
+
+def main():
+    scans = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    print('%d scans, 2 messages a scan, into a slow pipe' % scans)
+
+    out, close = slowPipe()
+    run(scans, 'print', lambda format, *args: print(format % args, file=out, flush=True))
+    close()
+
+    for name, level in (('logger off', zxlog.INFO), ('logger on', zxlog.DEBUG)):
+        out, close = slowPipe()
+        logger = zxlog.Logger(level, out=out)
+        run(scans, name, logger.debug)
+        logger.close()
+        print('  %-10s %d written, %d dropped' % ('', logger.written, logger.dropped))
+        close()
+
+
+if __name__ == '__main__':
+    main()
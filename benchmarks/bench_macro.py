@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+#
+# ZX Raspberry Keyboard Scanner - macro benchmark
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Types a macro through an EventBatch into a RecordingDevice with
+# MacroPlayer, on the real clock the way the scanners' main loops drive it,
+# for a few hold and gap settings, and reports:
+#
+#   chars/s   chords typed a second
+#   lost      worst case, over frame phases, of chords an emulated Spectrum
+#             missed or took twice (should be 0)
+#
+# The emulated Spectrum looks at the recorded key state once every 20ms
+# frame, starting at PHASES different offsets, and works its keyboard the
+# way the 48K ROM does: a key is taken in when it goes down in a frame
+# while one of its two key slots is free, and stays in its slot until it
+# has been up for 5 frames, so a key that comes back sooner is taken for
+# the same key still held. The console setting presses and releases each
+# chord in one report and is checked report by report instead.
+#
+#   python3 benchmarks/bench_macro.py [macro]
+#
+
+import os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import zxhardware, zxkeycodes, zxkeymap, zxmacro, zxoutput
+
+KEYS = [
+    ['1', '2', '3', '4', '5'],
+    ['Q', 'W', 'E', 'R', 'T'],
+    ['A', 'S', 'D', 'F', 'G'],
+    ['0', '9', '8', '7', '6'],
+    ['P', 'O', 'I', 'U', 'Y'],
+    ['LEFTSHIFT', 'Z', 'X', 'C', 'V'],
+    ['ENTER', 'L', 'K', 'J', 'H'],
+    ['SPACE', 'LEFTCTRL', 'M', 'N', 'B'],
+]
+SHIFT = zxkeymap.keyIndex(5, 0)
+SYMBOL = zxkeymap.keyIndex(7, 1)
+
+MACRO = '{J}{SS+P}{SS+P}{ENTER}10 print "hello, world": go to 10{ENTER}'
+
+# name: (hold, gap, repeatGap) in seconds
+CONFIGS = [
+    ('20/20/20ms', .02, .02, .02),
+    ('40/40/40ms', .04, .04, .04),
+    ('40/40/120ms', .04, .04, .12),
+    ('60/60/120ms', .06, .06, .12),
+    ('console', 0, .005, .005),
+]
+
+FRAME = .02
+PHASES = 20
+
+
+# Play steps as the main loops do: wait for the next step to be due, take it
+def play(steps, hold, gap, repeatGap):
+    device = zxhardware.RecordingDevice([])
+    batch = zxoutput.EventBatch(device)
+    macro = zxmacro.MacroPlayer(batch, hold, gap, repeatGap)
+    macro.play(steps)
+    while True:
+        timeout = macro.timeout()
+        if timeout:
+            time.sleep(timeout)
+        if not macro.poll():
+            break
+    return device.events, macro
+
+
+# Key indexes down after each report, as (time, frozenset)
+def keyStates(events, keyCodes):
+    indexes = dict((code[1], index) for index, code in enumerate(keyCodes))
+    down = set()
+    states = []
+    for when, kind, code, value in events:
+        if kind == zxoutput.EV_SYN:
+            states.append((when, frozenset(down)))
+        elif value:
+            down.add(indexes[code])
+        else:
+            down.discard(indexes[code])
+    return states
+
+
+# What the ROM takes in, looking at states every frame from start
+def spectrumKeys(states, start, end):
+    slots = [None, None]
+    counters = [0, 0]
+    typed = []
+    state = frozenset()
+    position = 0
+    frame = start
+    while frame < end:
+        while position < len(states) and states[position][0] <= frame:
+            state = states[position][1]
+            position += 1
+        for slot in range(2):
+            if slots[slot] is not None:
+                counters[slot] -= 1
+                if not counters[slot]:
+                    slots[slot] = None
+        keys = state - set((SHIFT, SYMBOL))
+        if len(keys) == 1:
+            key = next(iter(keys))
+            if key in slots:
+                counters[slots.index(key)] = 5
+            elif None in slots:
+                slot = slots.index(None)
+                slots[slot] = key
+                counters[slot] = 5
+                typed.append(tuple(sorted(state)))
+        frame += FRAME
+    return typed
+
+
+# Chords each report pressed, for a reader that takes in every report
+def reportedKeys(events, keyCodes):
+    indexes = dict((code[1], index) for index, code in enumerate(keyCodes))
+    typed = []
+    pressed = []
+    for when, kind, code, value in events:
+        if kind == zxoutput.EV_SYN:
+            if pressed:
+                typed.append(tuple(sorted(pressed)))
+            pressed = []
+        elif value:
+            pressed.append(indexes[code])
+    return typed
+
+
+# Chords that went missing or turned up extra, by a line up of the two
+def lost(expected, typed):
+    rows = len(expected) + 1
+    columns = len(typed) + 1
+    distance = [[0] * columns for row in range(rows)]
+    for row in range(rows):
+        distance[row][0] = row
+    for column in range(columns):
+        distance[0][column] = column
+    for row in range(1, rows):
+        for column in range(1, columns):
+            distance[row][column] = min(distance[row - 1][column] + 1, distance[row][column - 1] + 1,
+                distance[row - 1][column - 1] + (expected[row - 1] != typed[column - 1]) * 2)
+    return distance[-1][-1]
+
+
+def main():
+    script = sys.argv[1] if len(sys.argv) > 1 else MACRO
+    keyNames = zxkeymap.flattenKeys(KEYS)
+    capabilities = [getattr(zxkeycodes, 'KEY_' + name) for name in keyNames]
+    keyCodes = zxkeymap.compileKeys(KEYS, capabilities, zxkeycodes)
+    chords = zxmacro.compileMacro(script, zxmacro.spectrumCharacters(keyNames, SHIFT, SYMBOL),
+        zxmacro.keyIndexNames(keyNames, SHIFT, SYMBOL))
+    steps = zxmacro.renderMacro(chords, zxmacro.spectrumRenderer(keyCodes))
+    expected = [tuple(sorted(chord)) for chord in chords if not isinstance(chord, float)]
+
+    print('%r: %d chords' % (script, len(expected)))
+    print('%-12s %8s %6s  %s' % ('hold/gap/rep', 'chars/s', 'lost', 'reader'))
+    for name, hold, gap, repeatGap in CONFIGS:
+        events, macro = play(steps, hold, gap, repeatGap)
+        states = keyStates(events, keyCodes)
+        if hold:
+            start = states[0][0]
+            end = states[-1][0] + 6 * FRAME
+            worst = max(lost(expected, spectrumKeys(states, start + FRAME * phase / PHASES, end))
+                for phase in range(PHASES))
+            reader = '50Hz Spectrum, %d phases' % PHASES
+        else:
+            worst = lost(expected, reportedKeys(events, keyCodes))
+            reader = 'every report'
+        print('%-12s %8.1f %6d  %s' % (name, macro.typed / macro.elapsed, worst, reader))
+
+
+if __name__ == '__main__':
+    main()
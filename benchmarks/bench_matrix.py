@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+#
+# ZX Raspberry Keyboard Scanner - matrix state benchmark
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# CPU time per scan for the 40 bit matrix state with XOR change detection
+# against the old 8x5 keyTrack lists, with 0, 1, 5 and 10 keys held. The
+# matrix lines are faked so this measures the bookkeeping only.
+#
+#   python3 benchmarks/bench_matrix.py [scans]
+#
+
+import os, random, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import zxmatrix
+
+
+# Matrix lines that always read the same keys
+class HeldLines(object):
+
+    def __init__(self, held):
+        self.rows = [0] * zxmatrix.ROWS
+        for keyIndex in held:
+            self.rows[keyIndex // zxmatrix.COLUMNS] |= 1 << (keyIndex % zxmatrix.COLUMNS)
+        self.row = 0
+
+    def selectRow(self, row):
+        self.row = row
+
+    def readRow(self):
+        return self.rows[self.row]
+
+    def releaseRow(self, row):
+        pass
+
+
+def emit(keyIndex, value):
+    pass
+
+
+def bitmaskScan(lines, scans):
+    keyState = 0
+    start = time.process_time()
+    for scan in range(scans):
+        matrix = zxmatrix.scanMatrix(lines)
+        changed = matrix ^ keyState
+        keyState = matrix
+        for keyIndex in zxmatrix.keyIndexes(changed):
+            emit(keyIndex, (matrix >> keyIndex) & 1)
+    return (time.process_time() - start) / scans
+
+
+def keyTrackScan(lines, scans):
+    keyTrack = [[False] * 5 for addressLine in range(8)]
+    start = time.process_time()
+    for scan in range(scans):
+        for addressLine in range(8):
+            lines.selectRow(addressLine)
+            pressedLines = lines.readRow()
+            for dataLine in range(5):
+                isFree = not (pressedLines >> dataLine) & 1
+                if(isFree == False and keyTrack[addressLine][dataLine] == False):
+                    emit(addressLine * 5 + dataLine, 1)
+                    keyTrack[addressLine][dataLine] = time.time()
+                elif(isFree == True and keyTrack[addressLine][dataLine]):
+                    emit(addressLine * 5 + dataLine, 0)
+                    keyTrack[addressLine][dataLine] = False
+            lines.releaseRow(addressLine)
+    return (time.process_time() - start) / scans
+
+
+def main():
+    scans = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    random.seed(1982)
+    print('keys held   bitmask us/scan   keyTrack us/scan')
+    for held in (0, 1, 5, 10):
+        lines = HeldLines(random.sample(range(zxmatrix.KEYS), held))
+        print('%9d   %15.2f   %16.2f' % (held, bitmaskScan(lines, scans) * 1e6, keyTrackScan(lines, scans) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+#
+# ZX Raspberry Keyboard Scanner - multi-matrix benchmark
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Time to scan one frame of one, two and three matrices through the memory
+# mapped GPIO path, each way the scanners could do it:
+#
+#   group       zxgpio.GpioMemMatrices: all of them interleaved in one
+#               frame, one GPLEV0 read per step
+#   copies      a GpioMemLines scan per matrix, one after the other, as
+#               running a copy of the scanner for each would (less the
+#               second process)
+#
+# for the Spectrum's matrix plus a 4x4 keypad on pins of its own, the same
+# keypad wired across the Spectrum's data lines, and the Spectrum's, the
+# keypad and a Spectrum+ style 2x5 extra keys membrane sharing the
+# Spectrum's data lines. Frames are timed with the scanners' 10us settle
+# after each address line (the settle column) and without it (raw CPU).
+# Off a Pi the GPIO registers are a file standing in for /dev/gpiomem.
+#
+#   python3 benchmarks/bench_multimatrix.py [frames] [/dev/gpiomem]
+#
+
+import os, sys, tempfile, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import zxgpio, zxmatrix, zxscheduler
+
+# MagPi article mappings
+SPECTRUM = ([25, 24, 23, 22, 27, 18, 17, 4], [26, 19, 13, 6, 5])
+KEYPAD = ([20, 21, 16, 7], [8, 9, 10, 11])
+SHARED_KEYPAD = ([20, 21, 16, 7], [26, 19, 13, 6])
+EXTRA_KEYS = ([14, 15], [26, 19, 13, 6, 5])
+
+SETUPS = [
+    ('1 matrix', [SPECTRUM]),
+    ('2, own data lines', [SPECTRUM, KEYPAD]),
+    ('2, shared data lines', [SPECTRUM, SHARED_KEYPAD]),
+    ('3 matrices', [SPECTRUM, KEYPAD, EXTRA_KEYS]),
+]
+
+
+# Frame times in microseconds, as (p50, mean), the best of a few rounds so
+# a busy machine shows less
+def frameTimes(scan, frames, rounds=5):
+    best = None
+    clock = time.perf_counter
+    for round in range(rounds):
+        times = []
+        for frame in range(frames // rounds):
+            start = clock()
+            scan()
+            times.append(clock() - start)
+        times.sort()
+        result = (times[len(times) // 2] * 1e6, sum(times) / len(times) * 1e6)
+        best = result if best is None else min(best, result)
+    return best
+
+
+def main():
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    path = sys.argv[2] if len(sys.argv) > 2 else None
+    if path is None:
+        path = zxgpio.createRegisterFile(os.path.join(tempfile.mkdtemp(), 'gpiomem'))
+        print('Using register file %s' % path)
+    settle = zxscheduler.FrameScheduler(1000, 10e-6).settle
+
+    print('%-22s %-7s %5s %18s %18s' % ('matrices', 'scan', 'steps', 'p50/mean us', 'settle p50/mean'))
+    for name, matrices in SETUPS:
+        group = zxgpio.GpioMemMatrices(matrices, path)
+        copies = [zxgpio.GpioMemLines(addressLines, dataLines, path) for addressLines, dataLines in matrices]
+
+        def scanGroup(settle=None):
+            return zxmatrix.scanMatrices(group, settle)
+
+        # A copy only scans as many address lines as its matrix has
+        def scanCopies(settle=None):
+            matrix = 0
+            for offset, lines in enumerate(copies):
+                for row in range(len(matrices[offset][0])):
+                    lines.selectRow(row)
+                    if settle:
+                        settle()
+                    matrix |= lines.readRow() << (offset * zxmatrix.KEYS + row * zxmatrix.COLUMNS)
+                    lines.releaseRow(row)
+            return matrix
+
+        ways = [('group', scanGroup, len(group.steps)), ('copies', scanCopies, sum(len(a) for a, d in matrices))]
+        if len(matrices) == 1:
+            single = copies[0]
+            ways.insert(0, ('lines', lambda settle=None: zxmatrix.scanMatrix(single, settle), zxmatrix.ROWS))
+            ways.pop()
+        for way, scan, steps in ways:
+            raw = frameTimes(scan, frames)
+            settled = frameTimes(lambda: scan(settle), frames)
+            print('%-22s %-7s %5d %8.2f /%8.2f %8.2f /%8.2f' % (name, way, steps, raw[0], raw[1], settled[0], settled[1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+#
+# ZX Raspberry Keyboard Scanner - adaptive scan rate benchmark
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Runs a ScanThread on the simulated matrix through cycles of a quiet spell
+# followed by a burst of typing, with fixed rates and with zxrate's adaptive
+# rate (idle mode off, so the rate is all that's saving CPU), and reports
+# for each:
+#
+#   cpu       CPU use over the whole run
+#   first     latency from the first key of a burst going down (after the
+#             quiet spell) to the scan thread passing it on
+#   others    the same for the rest of the burst
+#   dwell     share of the time spent at each rate
+#
+#   python3 benchmarks/bench_rate.py [cycles]
+#
+
+import os, random, sys, threading, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import zxengine, zxhardware, zxmatrix, zxrate, zxscheduler
+
+ADDRESS_LINES = [24, 25, 8, 7, 1, 12, 16, 20]
+DATA_LINES = [4, 17, 27, 22, 23]
+
+# name: (fastest rate, slowest rate)
+CONFIGS = [
+    ('fixed 500', 500, 500),
+    ('fixed 1000', 1000, 1000),
+    ('1000-250', 1000, 250),
+    ('1000-100', 1000, 100),
+]
+
+QUIET = 1.5
+BURST = 10
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(fast, slow, cycles):
+    hardware = zxhardware.SimulatedBackend()
+    lines = hardware.matrixLines(ADDRESS_LINES, DATA_LINES)
+    scheduler = zxscheduler.FrameScheduler(fast)
+    rate = zxrate.AdaptiveRate(scheduler, zxrate.rateLadder(fast, slow)) if slow < fast else None
+    engine = zxengine.ScanEngine(lines, scheduler, None, zxmatrix.Debouncer(), rate=rate)
+    scanThread = zxengine.ScanThread(engine)
+
+    # Frame times at which keys were passed on as pressed
+    pressed = []
+    running = [True]
+
+    def consume():
+        while running[0]:
+            frame = scanThread.ring.pop(.1)
+            if frame and frame[2] & frame[1]:
+                pressed.append(frame[0])
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    scanThread.start()
+
+    random.seed(1982)
+    firsts = []
+    others = []
+    cpu = time.process_time()
+    start = time.monotonic()
+    for cycle in range(cycles):
+        time.sleep(QUIET)
+        for keystroke in range(BURST):
+            down = time.monotonic()
+            hardware.setMatrix(1 << random.randrange(zxmatrix.KEYS))
+            time.sleep(random.uniform(.05, .08))
+            hardware.setMatrix(0)
+            time.sleep(random.uniform(.04, .1))
+            seen = [t for t in pressed if t >= down]
+            if seen:
+                (others if keystroke else firsts).append((seen[0] - down) * 1000)
+    wall = time.monotonic() - start
+    cpu = time.process_time() - cpu
+    scanThread.stop()
+    running[0] = False
+    consumer.join()
+
+    if rate:
+        total = sum(rate.dwell.values())
+        dwell = ', '.join('%gHz %.0f%%' % (r, t * 100 / total) for r, t in rate.dwell.items())
+    else:
+        dwell = '%gHz 100%%' % fast
+    return cpu / wall, firsts, others, dwell
+
+
+def main():
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print('%d cycles of %.1fs quiet then %d keys, idle mode off' % (cycles, QUIET, BURST))
+    print('%-11s %6s %17s %17s  %s' % ('rate', 'cpu', 'first p50/max', 'others p50/max', 'dwell'))
+    for name, fast, slow in CONFIGS:
+        cpu, firsts, others, dwell = run(fast, slow, cycles)
+        print('%-11s %5.1f%% %7.2f/%6.2fms %7.2f/%6.2fms  %s' % (name, cpu * 100,
+            percentile(firsts, .5), max(firsts), percentile(others, .5), max(others), dwell))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+#
+# ZX Raspberry Keyboard Scanner - low jitter mode benchmark
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Scans the simulated matrix at 500Hz on a thread of its own, as the
+# scanners do, with a Pi Zero's worth of trouble around it:
+#
+#   - a large heap built at startup (modules, keymaps, a FUSE sized pile of
+#     objects) for the garbage collector to walk
+#   - another thread appending records to a growing list, which keeps
+#     setting the collector off
+#   - a busy process on the same CPU (--no-hog to leave it out)
+#
+# then does it again with zxrealtime.RealtimeMode applied, each in a fresh
+# process, and compares the frame periods:
+#
+#   python3 benchmarks/bench_realtime.py [--seconds 5] [--no-hog]
+#
+
+import argparse, array, gc, json, os, subprocess, sys, threading, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import zxengine, zxhardware, zxmatrix, zxrealtime, zxscheduler
+
+RATE = 500
+ADDRESS_LINES = [24, 25, 8, 7, 1, 12, 16, 20]
+DATA_LINES = [4, 17, 27, 22, 23]
+
+
+def load(running):
+    records = []
+    while running[0]:
+        for burst in range(200):
+            records.append((time.monotonic(), burst))
+        time.sleep(.001)
+
+
+def child(realtime, seconds):
+    heap = [{'index': i, 'names': ['object %d' % i]} for i in range(150000)]
+    hardware = zxhardware.SimulatedBackend()
+    lines = hardware.matrixLines(ADDRESS_LINES, DATA_LINES)
+    engine = zxengine.ScanEngine(lines, zxscheduler.FrameScheduler(RATE), None, zxmatrix.Debouncer())
+    times = array.array('d', [0.0] * int(seconds * RATE * 2))
+    collections = [0]
+    gc.callbacks.append(lambda phase, info: phase == 'stop' and collections.__setitem__(0, collections[0] + 1))
+
+    running = [True]
+    loader = threading.Thread(target=load, args=(running,))
+    loader.daemon = True
+    loader.start()
+
+    mode = None
+    if realtime:
+        mode = zxrealtime.RealtimeMode(cpus={0})
+        mode.schedule()
+        mode.lockMemory()
+
+    def scan():
+        if mode:
+            mode.scheduleThread()
+        frame = 0
+        clock = time.monotonic
+        end = clock() + seconds
+        while frame < len(times):
+            engine.nextFrame()
+            times[frame] = clock()
+            frame += 1
+            if times[frame - 1] > end:
+                break
+        running[0] = False
+
+    scanner = threading.Thread(target=scan)
+    if mode:
+        mode.freezeHeap()
+    scanner.start()
+    scanner.join()
+    loader.join()
+
+    periods = sorted(b - a for a, b in zip(times, times[1:]) if a and b)
+    mean = sum(periods) / len(periods)
+    return {
+        'frames': len(periods) + 1,
+        'meanMs': mean * 1000,
+        'stdevMs': (sum((p - mean) ** 2 for p in periods) / len(periods)) ** .5 * 1000,
+        'p99Ms': periods[int(len(periods) * .99)] * 1000,
+        'maxMs': periods[-1] * 1000,
+        'late': sum(1 for p in periods if p > 1.5 / RATE),
+        'collections': collections[0],
+        'report': mode.report() if mode else None,
+        'heap': len(heap),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Frame period jitter with the low jitter mode off and on')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--no-hog', action='store_true', help='leave out the busy process')
+    parser.add_argument('--child', choices=('off', 'on'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        json.dump(child(args.child == 'on', args.seconds), sys.stdout)
+        return
+
+    hog = None
+    if not args.no_hog:
+        hog = subprocess.Popen([sys.executable, '-c', 'while True: pass'])
+    try:
+        print('%d Hz for %gs each, %s' % (RATE, args.seconds, 'no busy process' if args.no_hog else 'busy process alongside'))
+        print('%-4s %8s %8s %8s %8s %6s %5s' % ('mode', 'mean', 'stdev', 'p99', 'max', 'late', 'GCs'))
+        for mode in ('off', 'on'):
+            out = subprocess.run([sys.executable, os.path.realpath(__file__), '--seconds', str(args.seconds), '--child', mode],
+                stdout=subprocess.PIPE, check=True).stdout
+            run = json.loads(out.decode())
+            print('%-4s %6.3fms %6.3fms %6.3fms %6.3fms %6d %5d' % (mode, run['meanMs'], run['stdevMs'],
+                run['p99Ms'], run['maxMs'], run['late'], run['collections']))
+            if run['report']:
+                print('     ' + run['report'])
+    finally:
+        if hog:
+            hog.kill()
+            hog.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+#
+# ZX Raspberry Keyboard Scanner - autorepeat benchmark
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Holds a key down for a while on a virtual clock and compares when the
+# repeats come out against when they should: the old loop (wake every 10ms,
+# repeat once time.time() is past the last repeat plus the delay) against
+# Autorepeat (sleep until the next repeat is due). Every wakeup is held up
+# by a random amount of load, with the odd long stall, so the numbers show
+# jitter and drift under load rather than on an idle machine.
+#
+# Exits non-zero unless Autorepeat loses no repeats, is late by no more
+# than P50_LOADS times the mean load at p50 (it's only ever late by the
+# load on the wakeup that fires it) and is never a whole period late (it
+# doesn't drift).
+#
+#   python3 benchmarks/bench_repeat.py [holds] [hold seconds] [mean load ms]
+#
+
+import os, random, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import zxrepeat
+
+DELAY = .7
+PERIOD = .2
+P50_LOADS = 5
+
+
+class VirtualClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+# How long the loop takes to get going after it should have woken up
+def load(meanLoad):
+    if random.random() < .01:
+        return random.uniform(.02, .05)     # stall
+    return random.expovariate(1 / meanLoad)
+
+
+# Repeat times of the old loop for one hold starting at start
+def legacyHold(clock, start, length, meanLoad):
+    times = []
+    t = start
+    n = 1
+    clock.now = start
+    while clock.now < start + length:
+        clock.now += .01 + load(meanLoad)
+        if clock.now >= start + length:
+            break
+        if (n == 1 and clock.now > t + DELAY) or (n > 1 and clock.now > t + PERIOD):
+            t = clock.now
+            n += 1
+            times.append(clock.now)
+    return times
+
+
+def autorepeatHold(clock, start, length, meanLoad, repeater):
+    times = []
+    clock.now = start
+    repeater.start('A')
+    wakeups = 0
+    while True:
+        clock.now += repeater.timeout() + load(meanLoad)
+        if clock.now >= start + length:
+            break
+        wakeups += 1
+        if repeater.poll() is not None:
+            times.append(clock.now)
+    repeater.stop()
+    return times, wakeups
+
+
+def report(name, holds, wakeups, length):
+    late = []
+    missing = 0
+    for start, times in holds:
+        ideal = [start + DELAY + n * PERIOD for n in range(int((length - DELAY) / PERIOD) + 1)]
+        ideal = [t for t in ideal if t < start + length]
+        missing += len(ideal) - len(times)
+        late += [actual - wanted for actual, wanted in zip(times, ideal)]
+    late.sort()
+    print('%-12s %6d wakeups/hold, lateness p50 %5.1fms p99 %5.1fms max %6.1fms, %.2f repeats lost/hold' % (
+        name, wakeups, late[len(late) // 2] * 1000, late[int(len(late) * .99)] * 1000,
+        late[-1] * 1000, float(missing) / len(holds)))
+    return late[len(late) // 2], late[-1], missing
+
+
+def main():
+    holds = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    length = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    meanLoad = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else .002
+    random.seed(1982)
+    clock = VirtualClock()
+
+    legacy = []
+    for hold in range(holds):
+        start = hold * (length + 1)
+        legacy.append((start, legacyHold(clock, start, length, meanLoad)))
+    report('time.time()', legacy, length / (.01 + meanLoad), length)
+
+    clock.now = 0.0
+    repeater = zxrepeat.Autorepeat(DELAY, PERIOD, clock=clock)
+    wheel = []
+    wakeups = 0
+    for hold in range(holds):
+        start = hold * (length + 1)
+        times, woken = autorepeatHold(clock, start, length, meanLoad, repeater)
+        wheel.append((start, times))
+        wakeups += woken
+    p50, worst, missing = report('timer wheel', wheel, float(wakeups) / holds, length)
+    if missing or p50 > meanLoad * P50_LOADS or worst >= PERIOD:
+        print('timer wheel out of bounds: lost repeats, p50 over %.1fms or max over %.1fms' % (
+            meanLoad * P50_LOADS * 1000, PERIOD * 1000))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
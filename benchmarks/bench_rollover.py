@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+#
+# ZX Raspberry Keyboard Scanner - ghost key benchmark
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Holds down every combination of 3 and of 4 keys on the simulated matrix
+# with ghosting on (a membrane with no diodes on its keys), scans it as the
+# scanners do and checks zxrollover against what is really down:
+#
+#   ghosts    combinations that read with keys that aren't really down
+#   missed    of those, ones where a ghost wasn't among the ambiguous keys
+#             (should always be 0)
+#   flagged   combinations with ambiguous keys (all the ghosted ones, plus
+#             real rectangles, which read the same as three corners)
+#   leaked    combinations where SUPPRESS, with the keys going down one
+#             scan at a time, passed a ghost on (should always be 0)
+#   held      real keys SUPPRESS held back, the price of leaking none
+#   unnamed   combinations where, once the keys are let go, the scanners'
+#             "Possible ghost keys" line wouldn't name the keys of the
+#             rectangle that formed (should always be 0)
+#
+# then times RolloverFilter.update against the number of keys down. Exits
+# non-zero if anything was missed, leaked or left unnamed.
+#
+#   python3 benchmarks/bench_rollover.py
+#
+
+import itertools, os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import zxhardware, zxkeycodes, zxkeyfile, zxmatrix, zxrollover
+
+ADDRESS_LINES = [24, 25, 8, 7, 1, 12, 16, 20]
+DATA_LINES = [4, 17, 27, 22, 23]
+KEYMAP = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'keymaps', 'zxscanner.keymap')
+
+
+# Key names for a mask, as the scanners log them
+def logNames(names, mask):
+    return ' '.join(str(names[i]) for i in zxmatrix.keyIndexes(mask))
+
+
+# Returns how many combinations missed a ghost, leaked one or left it
+# unnamed
+def check(keys, names):
+    hardware = zxhardware.SimulatedBackend(ghosting=True)
+    lines = hardware.matrixLines(ADDRESS_LINES, DATA_LINES)
+    ghosts = missed = flagged = leaked = held = unnamed = combinations = 0
+    for combination in itertools.combinations(range(zxmatrix.KEYS), keys):
+        combinations += 1
+        physical = zxmatrix.keyMask(combination)
+        hardware.setMatrix(physical)
+        raw = zxmatrix.scanMatrix(lines)
+        ambiguous = zxrollover.ambiguousKeys(raw)
+        if ambiguous:
+            flagged += 1
+        if raw != physical:
+            ghosts += 1
+            if raw & ~physical & ~ambiguous:
+                missed += 1
+
+        # Press them one scan at a time, in order
+        rollover = zxrollover.RolloverFilter(zxrollover.SUPPRESS)
+        down = 0
+        formed = 0
+        for key in combination:
+            down |= 1 << key
+            hardware.setMatrix(down)
+            scan = zxmatrix.scanMatrix(lines)
+            passed = rollover.update(scan)
+            if not formed:
+                formed = zxrollover.ambiguousKeys(scan)
+        if passed & ~physical:
+            leaked += 1
+        held += bin(physical & ~passed).count('1')
+
+        # The main loop only hears of it after the rectangle is broken
+        hardware.setMatrix(0)
+        rollover.update(zxmatrix.scanMatrix(lines))
+        if formed and (rollover.rectangles != 1 or logNames(names, rollover.rectangle) != logNames(names, formed)):
+            unnamed += 1
+    print('%d keys: %6d combinations, %6d ghosts, %d missed, %6d flagged, %d leaked, %6d real keys held, %d unnamed' % (
+        keys, combinations, ghosts, missed, flagged, leaked, held, unnamed))
+    return missed + leaked + unnamed
+
+
+def timing(runs=200000):
+    for keys in (0, 1, 2, 3, 4, 6):
+        matrix = zxmatrix.keyMask(range(keys))
+        rollover = zxrollover.RolloverFilter(zxrollover.SUPPRESS)
+        start = time.perf_counter()
+        for run in range(runs):
+            rollover.last = None
+            rollover.update(matrix)
+        elapsed = time.perf_counter() - start
+        print('  %d keys down: %.2fus a changed scan' % (keys, elapsed / runs * 1e6))
+
+
+def main():
+    capabilities = [value for name, value in vars(zxkeycodes).items() if name.startswith('KEY_')]
+    names = zxkeyfile.loadKeymaps(KEYMAP, {'keys': zxkeyfile.KEYS, 'funcKeys': zxkeyfile.KEYS}, capabilities, zxkeycodes, cache=False).names['keys']
+    failures = check(3, names) + check(4, names)
+    print('RolloverFilter.update')
+    timing()
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
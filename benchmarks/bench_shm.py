@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+#
+# ZX Raspberry Keyboard Scanner - shared memory export benchmark
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Runs a zxshm.MatrixExport writer and several MatrixReaders in separate
+# processes at the same time. The writer publishes a different matrix every
+# frame, worked out from the frame number, so a reader can tell from the
+# sequence number exactly what it should have got:
+#
+#   paced     a reader polling at the writer's rate, as an emulator would
+#   flat out  a reader polling as fast as it can, to catch the writer
+#             part way through as often as possible
+#   naive     the same, ignoring the sequence number, to show what the
+#             seqlock is there for
+#
+# For each it reports snapshots taken, retries, torn snapshots (wrong half
+# rows for their sequence number, which should only ever happen to the
+# naive reader), frames missed and how old snapshots were when read. Exits
+# non-zero if either seqlock reader got a torn snapshot.
+#
+#   python3 benchmarks/bench_shm.py [--rate 1000] [--seconds 5]
+#
+
+import argparse, multiprocessing, os, sys, tempfile, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import zxscheduler, zxshm
+
+READERS = ('paced', 'flat out', 'naive')
+# Readers that go through the seqlock and must never tear
+SEQLOCK_READERS = ('paced', 'flat out')
+
+
+def pattern(frame):
+    return (frame * 0x9E3779B97F) & ((1 << 40) - 1)
+
+
+def halfRows(matrix):
+    rows = bytearray(8)
+    for line, halfRow in enumerate(zxshm.HALF_ROWS):
+        rows[halfRow] = 0xFF ^ ((matrix >> line * 5) & 0x1F)
+    return bytes(rows)
+
+
+def writer(path, rate, seconds, ready, results):
+    export = zxshm.MatrixExport(path)
+    scheduler = zxscheduler.FrameScheduler(rate, 0)
+    ready.set()
+    frame = 0
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        scheduler.waitNextFrame()
+        export.publish(pattern(frame), time.monotonic())
+        frame += 1
+    results.put(('writer', {'frames': frame, 'overruns': scheduler.overruns}))
+
+
+def reader(name, path, rate, seconds, ready, results):
+    ready.wait()
+    shm = zxshm.MatrixReader(path)
+    scheduler = zxscheduler.FrameScheduler(rate, 0) if name == 'paced' else None
+    reads = torn = missed = 0
+    ages = []
+    last = None
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        if scheduler:
+            scheduler.waitNextFrame()
+        if name == 'naive':
+            sequence, frameTime, rows = shm.words[2], shm.doubles[2], shm.mem[24:32]
+            sequence &= ~1
+        else:
+            sequence, frameTime, rows = shm.read()
+        reads += 1
+        if not sequence:
+            continue
+        frame = sequence // 2 - 1
+        if rows != halfRows(pattern(frame)):
+            torn += 1
+        if last is not None and frame > last + 1:
+            missed += frame - last - 1
+        last = frame
+        ages.append(time.monotonic() - frameTime)
+    ages.sort()
+    results.put((name, {'reads': reads, 'retries': shm.retries, 'torn': torn, 'missed': missed,
+        'p50': ages[len(ages) // 2], 'p99': ages[int(len(ages) * .99)], 'max': ages[-1]}))
+    shm.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent shared memory export writer and readers')
+    parser.add_argument('--rate', type=float, default=1000, help='writer frames a second')
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.gettempdir(), 'zxkeyboard-bench')
+    ready = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=writer, args=(path, args.rate, args.seconds + .5, ready, results))]
+    processes += [multiprocessing.Process(target=reader, args=(name, path, args.rate, args.seconds, ready, results))
+        for name in READERS]
+    for process in processes:
+        process.start()
+    got = dict(results.get() for process in processes)
+    for process in processes:
+        process.join()
+    if os.path.exists(path):
+        os.unlink(path)
+
+    written = got['writer']
+    print('writer: %d frames at %gHz, %d overruns' % (written['frames'], args.rate, written['overruns']))
+    print('%-9s %8s %8s %6s %8s %9s %9s %9s' % ('reader', 'reads', 'retries', 'torn', 'missed', 'age p50', 'p99', 'max'))
+    for name in READERS:
+        run = got[name]
+        print('%-9s %8d %8d %6d %8d %7.3fms %7.3fms %7.3fms' % (name, run['reads'], run['retries'], run['torn'],
+            run['missed'], run['p50'] * 1000, run['p99'] * 1000, run['max'] * 1000))
+    if any(got[name]['torn'] for name in SEQLOCK_READERS):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+#
+# ZX Raspberry Keyboard Scanner - statistics overhead benchmark
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# What keeping live statistics costs: a single histogram sample, and a
+# whole scan of the simulated matrix with and without the engine timing
+# frames and row reads.
+#
+#   python3 benchmarks/bench_stats.py [frames]
+#
+
+import os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import zxengine, zxhardware, zxmatrix, zxscheduler, zxstats
+
+ADDRESS_LINES = [11, 5, 6, 26, 19, 16, 20, 21]
+DATA_LINES = [17, 4, 27, 22, 9]
+
+
+def frameCost(frames, stats):
+    backend = zxhardware.SimulatedBackend()
+    lines = backend.matrixLines(ADDRESS_LINES, DATA_LINES)
+    backend.setMatrix(zxmatrix.keyMask([3, 17, 29]))
+    # A rate no scan can keep up with, so nothing ever waits
+    scheduler = zxscheduler.FrameScheduler(1e9, 0)
+    engine = zxengine.ScanEngine(lines, scheduler, None, zxmatrix.Debouncer(), stats)
+    start = time.process_time()
+    for frame in range(frames):
+        engine.nextFrame()
+    return (time.process_time() - start) / frames
+
+
+def main():
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+
+    histogram = zxstats.Histogram()
+    samples = [(i % 997) * 3e-6 for i in range(frames)]
+    start = time.process_time()
+    for sample in samples:
+        histogram.add(sample)
+    print('Histogram.add     %.3fus' % ((time.process_time() - start) / frames * 1e6))
+
+    plain = frameCost(frames, None)
+    timed = frameCost(frames, zxstats.ScanStats())
+    print('scan, no stats    %.2fus' % (plain * 1e6))
+    print('scan, with stats  %.2fus (%+.1f%%)' % (timed * 1e6, (timed - plain) * 100 / plain))
+
+
+if __name__ == '__main__':
+    main()
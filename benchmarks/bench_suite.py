@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+#
+# ZX Raspberry Keyboard Scanner - trace driven benchmark suite
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Runs the scanners themselves (zxscanner.py for Spectrum and function
+# keys, keyscanner.py for console mode) on the simulated backend and plays
+# keystroke traces into the simulated matrix in real time:
+#
+#   typing    bursts of single keys
+#   rollover  ten keys going down one after another, then coming up
+#   holds     keys held for a couple of seconds (autorepeat in console mode)
+#   chords    caps shift / symbol shift + key
+#   gamepad   joystick moves and fire, on a joystick sent as a gamepad
+#   sinclair  the same on a joystick standing in for keys 6-0
+#
+# Every run happens in a fresh process so threads left over from one run
+# can't slow the next. For each mode and trace it reports scans a second,
+# CPU time per scan (all threads), press to emit latency (from the matrix
+# changing to the first key down or axis moved off centre that any of the
+# devices records after it) and events a second, and writes the lot as
+# JSON:
+#
+#   python3 benchmarks/bench_suite.py [-o results.json] [--baseline old.json]
+#                                     [--repo DIR] [--trace FILE ...]
+#
+# --repo runs the scanners from another checkout (so two versions can be
+# compared with --baseline), --trace adds recorded traces: JSON files of
+# {"name": ..., "steps": [[seconds, matrix], ...]} with matrix a zxmatrix
+# bitmask, and --save-traces writes the built in ones out in that format.
+# Bits from 40 up are joystick 1's switches (up, down, left, right, fire);
+# traces with those run against a scratch copy of the scanners with a
+# joystick added to their keymap files.
+#
+
+import argparse, contextlib, glob, json, os, random, shutil, signal, subprocess, sys, tempfile, threading, time
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+import zxjoystick, zxkeymap, zxmatrix
+
+# mode: (script, button taps to get there from startup)
+MODES = {
+    'spectrum': ('zxscanner.py', 0),
+    'function': ('zxscanner.py', 1),
+    'console': ('keyscanner.py', 2),
+}
+
+BUTTON_GPIO = 12
+SHIFT = 1 << zxkeymap.keyIndex(5, 0)
+SYMBOL = 1 << zxkeymap.keyIndex(7, 1)
+LETTERS = [i for i in range(zxmatrix.KEYS) if (1 << i) not in (SHIFT, SYMBOL)]
+
+# Joystick 1's pins (up, down, left, right, fire), free in both wirings,
+# and its keys setting for each joystick trace (others are gamepads)
+JOYSTICK_PINS = (2, 3, 7, 8, 10)
+JOYSTICK_TRACES = {'gamepad': zxjoystick.GAMEPAD, 'sinclair': 'sinclair1'}
+DIRECTIONS = (zxjoystick.UP, zxjoystick.DOWN, zxjoystick.LEFT, zxjoystick.RIGHT)
+
+
+# Traces are lists of (seconds from the start, matrix)
+def typingTrace():
+    steps = []
+    t = 0.0
+    for keystroke in range(150):
+        bit = 1 << random.choice(LETTERS)
+        steps.append((t, bit))
+        t += random.uniform(.04, .12)
+        steps.append((t, 0))
+        t += random.uniform(.03, .15)
+    return steps
+
+
+def rolloverTrace():
+    steps = []
+    t = 0.0
+    for chord in range(15):
+        matrix = 0
+        keys = random.sample(LETTERS, 10)
+        for key in keys:
+            matrix |= 1 << key
+            steps.append((t, matrix))
+            t += .025
+        t += .2
+        for key in keys:
+            matrix &= ~(1 << key)
+            steps.append((t, matrix))
+            t += .025
+        t += .1
+    return steps
+
+
+def holdsTrace():
+    steps = []
+    t = 0.0
+    for hold in range(5):
+        steps.append((t, 1 << random.choice(LETTERS)))
+        t += random.uniform(1.5, 2.5)
+        steps.append((t, 0))
+        t += .3
+    return steps
+
+
+def chordsTrace():
+    steps = []
+    t = 0.0
+    for chord in range(60):
+        shift = random.choice((SHIFT, SYMBOL))
+        steps.append((t, shift))
+        t += .04
+        steps.append((t, shift | 1 << random.choice(LETTERS)))
+        t += .08
+        steps.append((t, shift))
+        t += .03
+        steps.append((t, 0))
+        t += .12
+    return steps
+
+
+# Pushes in one direction with fire now and then, as a game would get
+def joystickTrace():
+    steps = []
+    t = 0.0
+    for move in range(120):
+        switches = 1 << random.choice(DIRECTIONS)
+        steps.append((t, switches << zxmatrix.KEYS))
+        t += random.uniform(.05, .2)
+        if random.random() < .3:
+            steps.append((t, (switches | 1 << zxjoystick.FIRE) << zxmatrix.KEYS))
+            t += random.uniform(.03, .08)
+        steps.append((t, 0))
+        t += random.uniform(.03, .1)
+    return steps
+
+
+def builtinTraces():
+    random.seed(1982)
+    traces = [(name, trace()) for name, trace in (
+        ('typing', typingTrace), ('rollover', rolloverTrace), ('holds', holdsTrace), ('chords', chordsTrace))]
+    moves = joystickTrace()
+    return traces + [('gamepad', moves), ('sinclair', moves)]
+
+
+# The scanners and their keymap files in a scratch directory, with joystick
+# 1 on JOYSTICK_PINS
+def joystickRepo(repo, keys):
+    scratch = tempfile.mkdtemp()
+    for path in glob.glob(os.path.join(repo, '*.py')) + glob.glob(os.path.join(repo, '*.mp3')):
+        shutil.copy(path, scratch)
+    os.mkdir(os.path.join(scratch, 'keymaps'))
+    for path in glob.glob(os.path.join(repo, 'keymaps', '*.keymap')):
+        with open(path) as f:
+            text = f.read()
+        with open(os.path.join(scratch, 'keymaps', os.path.basename(path)), 'w') as f:
+            f.write(text + '\n[joystick 1]\npins = %s\nkeys = %s\n' % (' '.join(map(str, JOYSTICK_PINS)), keys))
+    return scratch
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+# In the child: play taps then the trace into backend, then stop the scanner
+def drive(backend, taps, steps, result):
+    while backend.device is None or not backend.rowPins:
+        time.sleep(.01)
+    time.sleep(.5)
+    for tap in range(taps):
+        backend.setButton(BUTTON_GPIO, True)
+        time.sleep(.08)
+        backend.setButton(BUTTON_GPIO, False)
+        time.sleep(.3)
+
+    scans = backend.scans
+    cpu = time.process_time()
+    start = time.monotonic()
+    marks = []
+    switches = 0
+    for offset, matrix in steps:
+        time.sleep(max(0, start + offset - time.monotonic()))
+        marks.append(time.monotonic())
+        backend.setMatrix(matrix & zxmatrix.MASK)
+        for switch, pin in enumerate(JOYSTICK_PINS):
+            down = (matrix >> (zxmatrix.KEYS + switch)) & 1
+            if down != (switches >> switch) & 1:
+                backend.setButton(pin, down)
+        switches = matrix >> zxmatrix.KEYS
+    time.sleep(.5)
+    result.update(start=start, end=time.monotonic(), marks=marks,
+        scans=backend.scans - scans, cpu=time.process_time() - cpu)
+    os.kill(os.getpid(), signal.SIGINT)
+
+
+# In the child: run one scanner with one trace, return the measurements
+def runOne(repo, mode, name, steps):
+    import zxhardware
+    script, taps = MODES[mode]
+    scratch = None
+    if any(matrix >> zxmatrix.KEYS for offset, matrix in steps):
+        repo = scratch = joystickRepo(repo, JOYSTICK_TRACES.get(name, zxjoystick.GAMEPAD))
+    backend = zxhardware.SimulatedBackend()
+    zxhardware.override = backend
+    result = {}
+    driver = threading.Thread(target=drive, args=(backend, taps, steps, result))
+    driver.daemon = True
+    driver.start()
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            import runpy
+            runpy.run_path(os.path.join(repo, script), run_name='__main__')
+        except (SystemExit, KeyboardInterrupt):
+            pass
+    if scratch:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    # Latency from each change of the matrix to the first key going down
+    # or axis moving off centre after it (changes that send nothing, like
+    # pressing shift, are skipped)
+    marks = result['marks']
+    recorded = sorted(e for device in backend.devices for e in device.events if e[0] >= result['start'])
+    downs = [e[0] for e in recorded if (e[1] == zxjoystick.EV_KEY and e[3] == 1) or (e[1] == zxjoystick.EV_ABS and e[3])]
+    events = [e for e in recorded if e[1] in (zxjoystick.EV_KEY, zxjoystick.EV_ABS)]
+    latencies = []
+    d = 0
+    for i, mark in enumerate(marks):
+        following = marks[i + 1] if i + 1 < len(marks) else result['end']
+        while d < len(downs) and downs[d] < mark:
+            d += 1
+        if d < len(downs) and downs[d] < following:
+            latencies.append((downs[d] - mark) * 1000)
+    latencies.sort()
+    duration = result['end'] - result['start']
+    return {
+        'scansPerSecond': result['scans'] / duration,
+        'cpuPerScanUs': result['cpu'] / max(1, result['scans']) * 1e6,
+        'latencyMs': {
+            'p50': percentile(latencies, .5),
+            'p99': percentile(latencies, .99),
+            'max': percentile(latencies, 1),
+            'samples': len(latencies),
+        },
+        'eventsPerSecond': len(events) / duration,
+        'events': len(events),
+        'seconds': duration,
+    }
+
+
+def gitVersion(repo):
+    try:
+        return subprocess.check_output(['git', '-C', repo, 'describe', '--always', '--dirty'],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def fmt(value, form):
+    return form % value if value is not None else '-'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Trace driven scanner benchmarks')
+    parser.add_argument('-o', '--output', help='write results as JSON here')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--repo', default=os.path.join(HERE, '..'), help='checkout to take the scanners from')
+    parser.add_argument('--trace', action='append', default=[], help='recorded trace (JSON) to play as well')
+    parser.add_argument('--save-traces', help='write the built in traces to this directory')
+    parser.add_argument('--modes', default=','.join(sorted(MODES)), help='comma separated modes to run')
+    parser.add_argument('--child', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # One run, trace on stdin, result on stdout
+    if args.child:
+        # The scanner's own modules, not the ones imported above
+        sys.path.insert(0, os.path.realpath(args.repo))
+        for name in [name for name in sys.modules if name.startswith('zx')]:
+            del sys.modules[name]
+        steps = json.load(sys.stdin)
+        json.dump(runOne(os.path.realpath(args.repo), args.child[0], args.child[1], steps), sys.stdout)
+        sys.stdout.flush()
+        # without waiting for the scanner's threads
+        os._exit(0)
+
+    traces = builtinTraces()
+    if args.save_traces:
+        for name, steps in traces:
+            with open(os.path.join(args.save_traces, name + '.json'), 'w') as f:
+                json.dump({'name': name, 'steps': steps}, f)
+    for path in args.trace:
+        with open(path) as f:
+            recorded = json.load(f)
+        traces.append((recorded.get('name', os.path.basename(path)), recorded['steps']))
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            for run in json.load(f)['results']:
+                baseline[(run['mode'], run['trace'])] = run
+
+    results = []
+    env = dict(os.environ, ZXSCANNER_BACKEND='simulated')
+    print('%-9s %-9s %8s %9s %8s %8s %8s %8s' % ('mode', 'trace', 'scans/s', 'cpu/scan', 'p50', 'p99', 'max', 'events/s'))
+    for mode in args.modes.split(','):
+        for name, steps in traces:
+            child = subprocess.run([sys.executable, os.path.realpath(__file__), '--repo', args.repo, '--child', mode, name],
+                input=json.dumps(steps).encode(), stdout=subprocess.PIPE, env=env, check=True)
+            run = json.loads(child.stdout.decode())
+            run.update(mode=mode, trace=name)
+            results.append(run)
+            latency = run['latencyMs']
+            print('%-9s %-9s %8.0f %7.1fus %6sms %6sms %6sms %8.1f' % (mode, name, run['scansPerSecond'], run['cpuPerScanUs'],
+                fmt(latency['p50'], '%.1f'), fmt(latency['p99'], '%.1f'), fmt(latency['max'], '%.1f'), run['eventsPerSecond']))
+            old = baseline.get((mode, name))
+            if old:
+                print('  vs baseline: scans/s %+.1f%%, cpu/scan %+.1f%%, p99 %+.1fms' % (percentChange(old['scansPerSecond'], run['scansPerSecond']),
+                    percentChange(old['cpuPerScanUs'], run['cpuPerScanUs']),
+                    (latency['p99'] or 0) - (old['latencyMs']['p99'] or 0)))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'version': gitVersion(args.repo), 'python': sys.version.split()[0],
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}, f, indent=1)
+
+
+def percentChange(old, new):
+    return (new - old) * 100.0 / old if old else 0.0
+
+
+if __name__ == '__main__':
+    main()
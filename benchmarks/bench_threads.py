@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+#
+# ZX Raspberry Keyboard Scanner - scan thread benchmark
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Runs the scan thread at 1 kHz over simulated lines with a key going
+# up and down every few frames, once with a consumer that keeps up and
+# once with one that takes 20ms over every frame, and reports the scan
+# period each time along with ring overflows and high water mark.
+#
+# Exits non-zero if the fast consumer ever lets the ring overflow, if
+# either run's median scan period is more than MEDIAN_SLACK off 1ms, or if
+# the slow consumer's p99 period is over P99_FACTOR times the fast one's
+# plus a frame: a consumer falling behind loses old frames from the ring,
+# it mustn't hold up scanning. (The slow run's overflows are expected.)
+#
+#   python3 benchmarks/bench_threads.py [seconds]
+#
+
+import os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import zxengine, zxscheduler
+
+RATE = 1000
+MEDIAN_SLACK = .05
+P99_FACTOR = 2
+
+
+# Matrix lines where key 0 toggles every `every` scans
+class TypingLines(object):
+
+    def __init__(self, every=7):
+        self.every = every
+        self.scans = 0
+
+    def selectRow(self, row):
+        if row == 0:
+            self.scans += 1
+
+    def releaseRow(self, row):
+        pass
+
+    def readRow(self):
+        return (self.scans // self.every) & 1
+
+
+# ScanEngine that notes when each frame was scanned
+class TimedEngine(zxengine.ScanEngine):
+
+    def nextFrame(self, busy=False):
+        matrix = zxengine.ScanEngine.nextFrame(self, busy)
+        self.frameTimes.append(time.perf_counter())
+        return matrix
+
+
+def run(seconds, emitTime):
+    engine = TimedEngine(TypingLines(), zxscheduler.FrameScheduler(RATE))
+    engine.frameTimes = []
+    scanThread = zxengine.ScanThread(engine, ringSize=64)
+    scanThread.start()
+    end = time.monotonic() + seconds
+    consumed = 0
+    while time.monotonic() < end:
+        if scanThread.ring.pop(.1):
+            consumed += 1
+            time.sleep(emitTime)
+    scanThread.stop()
+    scanThread.thread.join()
+
+    times = engine.frameTimes
+    periods = sorted(b - a for a, b in zip(times, times[1:]))
+    return (periods[len(periods) // 2], periods[int(len(periods) * .99)], periods[-1],
+        consumed, scanThread.ring.overflows, scanThread.ring.highWater)
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 2
+    period = 1.0 / RATE
+    print('consumer      median     p99       max   frames  overflows  high water')
+    results = {}
+    for name, emitTime in (('fast', 0), ('slow 20ms', .02)):
+        median, p99, worst, consumed, overflows, highWater = results[name] = run(seconds, emitTime)
+        print('%-10s %7.3fms %7.3fms %7.3fms %7d %10d %11d' % (name, median * 1000, p99 * 1000, worst * 1000, consumed, overflows, highWater))
+
+    fast = results['fast']
+    slow = results['slow 20ms']
+    failures = []
+    if fast[4]:
+        failures.append('the fast consumer overflowed the ring')
+    for name, result in sorted(results.items()):
+        if abs(result[0] - period) > period * MEDIAN_SLACK:
+            failures.append('%s median period off 1ms' % name)
+    if slow[1] > fast[1] * P99_FACTOR + period:
+        failures.append('slow consumer p99 period over %.3fms' % ((fast[1] * P99_FACTOR + period) * 1000))
+    if failures:
+        print('; '.join(failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
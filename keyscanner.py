@@ -1,4 +1,4 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 #
 # ZX Raspberry Keyboard Scanner v4.1
 # @mrpjevans mrpjevans.com 2017
@@ -53,18 +53,20 @@
 #
 # consoleMode supports autorepeat
 #
-# keyTrack stores False for not pressed or time of keypressed
+# consoleMode is a state machine (see zxconsole.py)
+#
+# matrix is a bitmask of pressed keys
+#
+# the keymaps and the wiring are in keymaps/keyscanner.keymap (see zxkeyfile.py)
 #
 # replaced TABs with SPACEs in the entire code. sorry.
 
 
-import time, sys, wiringpi, uinput, os
-
-# KB1 (BCOM GPIO pins)
-dataLines = [17,4,27,22,9]
+import sys, os, zxhardware, zxkeycodes, zxkeymap, zxmatrix, zxscheduler, zxidle, zxengine, zxoutput, zxfeedback, zxconsole, zxrepeat, zxbutton, zxstats, zxlog, zxrealtime, zxshm, zxrate, zxrollover, zxmacro, zxkeyfile, zxjoystick
 
-# KB1 (BCOM GPIO pins)
-addressLines = [11,5,6,26,19,16,20,21]
+# Keymaps and GPIO wiring (see zxkeyfile.py), relative to this script
+keymapFile = 'keymaps/keyscanner.keymap'
+watchKeymaps = True  # pick up changes to the keymaps without restarting
 
 # Button PIN BCM
 buttonGPIO = 12
@@ -78,551 +80,741 @@ ledB = 24
 # buzzer PIN BCM
 buzzerPIN = 18 # support PWM
 
-# The ZX Spectrum Keyboard Matrix (Mapped to modern keyboard )
-keys = [
-    ['1','2','3','4','5'],
-    ['Q','W','E','R','T'],
-    ['A','S','D','F','G'],
-    ['0','9','8','7','6'],
-    ['P','O','I','U','Y'],
-    ['LEFTSHIFT','Z','X','C','V'],
-    ['ENTER','L','K','J','H'],
-    ['SPACE','LEFTCTRL','M','N','B']
-]
-
-# Function key mode
-funcKeys = [
-    ['F1','F2','F3','F4','LEFT'],
-    ['Q','W','E','R','T'],
-    ['A','S','D','F','G'],
-    ['ESC','TAB','RIGHT','UP','DOWN'],
-    ['P','O','I','U','Y'],
-    ['LEFTSHIFT','Z','X','C','V'],
-    ['ENTER','L','K','J','H'],
-    ['SPACE','LEFTCTRL','M','N','B']
-]
-
-# Track keypresses so we can support multiple keys
-keyTrack = [
-    [False, False, False, False, False],
-    [False, False, False, False, False],
-    [False, False, False, False, False],
-    [False, False, False, False, False],
-    [False, False, False, False, False],
-    [False, False, False, False, False],
-    [False, False, False, False, False],
-    [False, False, False, False, False]
-]
+# shift and symbol positions on the matrix
+shiftIndex = zxkeymap.keyIndex(5,0)
+symbolIndex = zxkeymap.keyIndex(7,1)
 
 # Keyboard mode and reset button
-buttonPressed = -1
-buttonTime = 0
 
 # 0 = Spectrum, 1 = Function Keys
 keyboardMode = 0
 
+# Scan timing
+scanRate = 1000      # full matrix scans per second while the keyboard is in use
+slowScanRate = 250   # scans per second once nothing has been pressed for a while (scanRate = never slow down)
+rateQuietTime = 0.1  # seconds with nothing pressed before halving the rate, down to slowScanRate
+rowSettle = 10e-6    # seconds between setting an address line low and reading it
+idleFrames = 250     # scans with nothing pressed before waiting for a key (0 = never)
+debouncePress = 2    # scans a key must read down before it counts as pressed
+debounceRelease = 5  # scans a key must read up before it counts as released
+# What to do with keys that might be ghosts, for each keyboardMode (Spectrum, Function Keys, Console):
+# zxrollover.SUPPRESS, FLAG (pass them on and log them) or PASS (see zxrollover.py)
+ghostPolicies = [zxrollover.SUPPRESS, zxrollover.SUPPRESS, zxrollover.FLAG]
+statsSocket = zxstats.socketPath(__file__)  # where zxstats.py can ask for timings and counts (None = nowhere)
+logLevel = zxlog.INFO         # zxlog.DEBUG to log every key press and release
+matrixExport = None           # file to publish the matrix to for emulators, e.g. zxshm.PATH (see zxshm.py)
+
+# Macros (see zxmacro.py for the script syntax)
+macros = {
+    'load': '{J}{SS+P}{SS+P}{ENTER}',  # LOAD "" (types j"" in console mode)
+}
+macroHold = 0.04         # seconds each key of a macro is held (FUSE looks at the keyboard once a frame)
+macroGap = 0.04          # seconds with nothing down between keys
+macroRepeatGap = 0.12    # seconds with nothing down before the same key again (the ROM needs it up for 5 frames)
+macroConsoleGap = 0.005  # seconds between keys in console mode (each key goes down and up in one report)
+gestureMacros = {}       # button gesture: macro, e.g. {zxbutton.DOUBLE_TAP: 'load'} (makes taps wait to see if they're double)
+functionMacros = {}      # Spectrum key: macro to type when it's pressed in Function Keys mode, e.g. {'J': 'load'}
+
+# Low jitter mode (see zxrealtime.py)
+lowJitter = False      # real-time priority, locked memory and no garbage collector pauses
+realtimePriority = 50  # SCHED_FIFO priority for the scan loops (1-99)
+realtimeCpus = None    # CPUs to keep the scanner on, e.g. {0} (None = any)
+
+# Console autorepeat
+repeatDelay = 0.7    # seconds a key is held before it starts repeating
+repeatPeriod = 0.2   # seconds between repeats
+kernelRepeat = True  # hold single keys down and let the kernel repeat them (chords always repeat here)
+
 # Local path
 myDir = os.path.dirname(os.path.realpath(__file__));
 
-# 102+ keyboard
-#
-# ESC  F1 F2 F3 F4  F5 F6 F7 F8  F9 F10 F11 F2          PRINT SCRLCK PAUSE
-# `~ 1! 2@ 3# 4$ 5% 6^ 7& 8* 9( 0) -_ =+ BACKSPACE      INS   HOME PGUP       NUM / * -
-# TAB qQ wW eE rR tT yY uU iI oO pP [{ ]}  ENTER        CANC  END  PGDOW        7 8 9 +
-# CAPS aA sS dD fF gG hH jJ kK lL ;: '" \|                                      4 5 6 
-# SHIFT <> zZ xX cC vV bB nN mM ,< .> /? SHIFT                UP                1 2 3 
-# CTRL WIN ALT          SPACE       ALTGR MENU CTRL     LEFT DOWN RIGHT         0 . ENTER
-
-# zx spectrum keyboard
-#
-# 1!edit 2@caps 3#truev 4$invv 5%left 6&down 7'up 8(right 9)gr 0_del
-# Q<=    W<>    E>=     R<     T>     Y[     U]   I       O;   P"
-# A~     S|     D`      F{     G}     H^     J-   K+      L=   enter
-# sh/cap Z:     X       C?     V/     B*     N,   M.      sym  sp/brk
-
-# keys are tuple; ('SHIFT','A') sends press SHIFT press A release A release SHIFT
-# ZX keys in normal mode
-normalKeys = [
-    [('1',),('2',),('3',),('4',),('5',)],
-    [('Q',),('W',),('E',),('R',),('T',)],
-    [('A',),('S',),('D',),('F',),('G',)],
-    [('0',),('9',),('8',),('7',),('6',)],
-    [('P',),('O',),('I',),('U',),('Y',)],
-    ['shift',('Z',),('X',),('C',),('V',)],
-    [('ENTER',),('L',),('K',),('J',),('H',)],
-    [('SPACE',),'symbol',('M',),('N',),('B',)]
-]
 
-# ZX keys in shift mode
-# all [A-Z] are mapped as 'SHIFT' [A-Z]
-# 1 ( EDIT ) as ESC
-# 2 ( CAPS LOCK ) as CAPSLOCK key
-# 3 ( TRUE VIDEO ) as ???
-# 4 ( INV VIDEO ) as ???
-# 5 6 7 8 as LEFT DOWN UP RIGHT
-# 9 ( GRAPHICS ) as ???
-# 0 ( DELETE) as BACKSPACE
-# SPACE (break) as CTRL+C
-shiftKeys = [
-    [('ESC',),('CAPSLOCK',),False,False,('LEFT',)], # edit as esc, capslock as capslock, truevideo, invvideo, left 
-    [('LEFTSHIFT','Q'),('LEFTSHIFT','W'),('LEFTSHIFT','E'),('LEFTSHIFT','R'),('LEFTSHIFT','T')],
-    [('LEFTSHIFT','A'),('LEFTSHIFT','S'),('LEFTSHIFT','D'),('LEFTSHIFT','F'),('LEFTSHIFT','G')],
-    [('BACKSPACE',),False,('RIGHT',),('UP',),('DOWN',)], # delete graphics right up down
-    [('LEFTSHIFT','P'),('LEFTSHIFT','O'),('LEFTSHIFT','I'),('LEFTSHIFT','U'),('LEFTSHIFT','Y')],
-    ['shift',('LEFTSHIFT','Z'),('LEFTSHIFT','X'),('LEFTSHIFT','C'),('LEFTSHIFT','V')],
-    [('ENTER',),('LEFTSHIFT','L'),('LEFTSHIFT','K'),('LEFTSHIFT','J'),('LEFTSHIFT','H')],
-    [('LEFTCTRL','C'),'symbol',('LEFTSHIFT','M'),('LEFTSHIFT','N'),('LEFTSHIFT','B')] # sh+space == ctrl+c
-]
+# Messages are written out by a thread of their own so a slow journal can't
+# hold up the scan loop
+log = zxlog.Logger(logLevel)
 
-# ZX keys with 'symbol' pressed
-# all ascii utf7 symbols matched (all but pound over X and copyright under P), under or below the key (example the key 'D' match '\' and not 'TO')
-# all other are mapped:
-#    Q ( <= ) as PAGEDOWN
-#    W ( <> ) as HOME
-#    E ( => ) as PAGEUP
-#    I ( IN/INPUT) as INSERT
-#    LEFTSHIFT switch to extended mode (as 'E' cursor)
-#    X ( CLEAR) as DELETE
-#    SPACE as TAB
-#    ENTER as normal ENTER
-symbolKeys = [
-    [('LEFTSHIFT','1'),('LEFTSHIFT','2'),('LEFTSHIFT','3'),('LEFTSHIFT','4'),('LEFTSHIFT','5')], # ! @ # $ %
-    [('PAGEDOWN',),('HOME',),('PAGEUP',),('LEFTSHIFT','COMMA',),('LEFTSHIFT','DOT')], # (<= as pgdown) (<> as home) (>= as pgup) < >
-    [('LEFTSHIFT','GRAVE'),('LEFTSHIFT','BACKSLASH'),('GRAVE',),('LEFTSHIFT','LEFTBRACE'),('LEFTSHIFT','RIGHTBRACE')], # ~ | ` { }
-    [('LEFTSHIFT','MINUS'),('LEFTSHIFT','0'),('LEFTSHIFT','9'),('APOSTROPHE',),('LEFTSHIFT','7')], # _ ) ( ' &
-    [('LEFTSHIFT','APOSTROPHE'),('SEMICOLON',),('LEFTSHIFT','INSERT'),('RIGHTBRACE',),('LEFTBRACE',)], # " ; (in as insert) ] [
-    ['extended',('LEFTSHIFT','SEMICOLON'),('LEFTSHIFT','DELETE'),('LEFTSHIFT','SLASH'),('SLASH',)], # extended : (clear) ? /
-    [('ENTER',),('EQUAL',),('LEFTSHIFT','EQUAL'),('MINUS',),('LEFTSHIFT','6')], # enter = + - ^
-    [('TAB',),'symbol',('DOT',),('COMMA',),('LEFTSHIFT','8')] # (space as tab) symbol . , *
-]
+# GPIO and the uinput device, or a simulation of them (see zxhardware.py)
+hardware = zxhardware.openBackend()
 
-# ZX keys in extended mode
-# all keys are mapped as 'LEFTCTRL'
-extendedKeys = [
-    [('LEFTCTRL','1'),('LEFTCTRL','2'),('LEFTCTRL','3'),('LEFTCTRL','4'),('LEFTCTRL','5')], 
-    [('LEFTCTRL','Q'),('LEFTCTRL','W'),('LEFTCTRL','E'),('LEFTCTRL','R'),('LEFTCTRL','T')],
-    [('LEFTCTRL','A'),('LEFTCTRL','S'),('LEFTCTRL','D'),('LEFTCTRL','F'),('LEFTCTRL','G')],
-    [('LEFTCTRL','0'),('LEFTCTRL','9'),('LEFTCTRL','8'),('LEFTCTRL','7'),('LEFTCTRL','6')],
-    [('LEFTCTRL','P'),('LEFTCTRL','O'),('LEFTCTRL','I'),('LEFTCTRL','U'),('LEFTCTRL','Y')],
-    ['shift',('LEFTCTRL','Z'),('LEFTCTRL','X'),('LEFTCTRL','C'),('LEFTCTRL','V')],
-    [('LEFTCTRL','ENTER'),('LEFTCTRL','L'),('LEFTCTRL','K'),('LEFTCTRL','J'),('LEFTCTRL','H')],
-    [('LEFTCTRL','SPACE'),'symbol',('LEFTCTRL','M'),('LEFTCTRL','N'),('LEFTCTRL','B')]
+# Well this is annoying
+deviceEvents = [
+
+    zxkeycodes.KEY_ESC,
+    zxkeycodes.KEY_F1,
+    zxkeycodes.KEY_F2,
+    zxkeycodes.KEY_F3,
+    zxkeycodes.KEY_F4,
+    zxkeycodes.KEY_F5,
+    zxkeycodes.KEY_F6,
+    zxkeycodes.KEY_F7,
+    zxkeycodes.KEY_F8,
+    zxkeycodes.KEY_F9,
+    zxkeycodes.KEY_F10,
+    # zxkeycodes.KEY_F11,
+    # zxkeycodes.KEY_F12,
+
+    zxkeycodes.KEY_GRAVE,   # ` ~
+    zxkeycodes.KEY_1,       # 1 !
+    zxkeycodes.KEY_2,       # 2 @
+    zxkeycodes.KEY_3,       # 3 #
+    zxkeycodes.KEY_4,       # 4 $
+    zxkeycodes.KEY_5,       # 5 %
+    zxkeycodes.KEY_6,       # 6 ^
+    zxkeycodes.KEY_7,       # 7 &
+    zxkeycodes.KEY_8,       # 8 *
+    zxkeycodes.KEY_9,       # 9 (
+    zxkeycodes.KEY_0,       # 0 )
+    zxkeycodes.KEY_MINUS,   # - _
+    zxkeycodes.KEY_EQUAL,   # = +
+    zxkeycodes.KEY_BACKSPACE,
+
+    zxkeycodes.KEY_TAB,
+    zxkeycodes.KEY_Q,       
+    zxkeycodes.KEY_W,
+    zxkeycodes.KEY_E,
+    zxkeycodes.KEY_R,
+    zxkeycodes.KEY_T,
+    zxkeycodes.KEY_Y,
+    zxkeycodes.KEY_U,
+    zxkeycodes.KEY_I,
+    zxkeycodes.KEY_O,
+    zxkeycodes.KEY_P,
+    zxkeycodes.KEY_LEFTBRACE,  # [ {
+    zxkeycodes.KEY_RIGHTBRACE, # ] }
+    zxkeycodes.KEY_ENTER,
+
+    zxkeycodes.KEY_CAPSLOCK,
+    zxkeycodes.KEY_A,
+    zxkeycodes.KEY_S,
+    zxkeycodes.KEY_D,
+    zxkeycodes.KEY_F,
+    zxkeycodes.KEY_G,
+    zxkeycodes.KEY_H,
+    zxkeycodes.KEY_J,
+    zxkeycodes.KEY_K,
+    zxkeycodes.KEY_L,
+    zxkeycodes.KEY_SEMICOLON,  # ; :
+    zxkeycodes.KEY_APOSTROPHE, # ' "
+    zxkeycodes.KEY_BACKSLASH,  # \ |
+
+    zxkeycodes.KEY_LEFTSHIFT,
+    #zxkeycodes.KEY_102ND,      # < > on most querty 102+key layouts
+    zxkeycodes.KEY_Z,
+    zxkeycodes.KEY_X,
+    zxkeycodes.KEY_C,
+    zxkeycodes.KEY_V,
+    zxkeycodes.KEY_B,
+    zxkeycodes.KEY_N,
+    zxkeycodes.KEY_M,
+    zxkeycodes.KEY_COMMA, # , <
+    zxkeycodes.KEY_DOT, # . <
+    zxkeycodes.KEY_SLASH, # / ?
+    zxkeycodes.KEY_RIGHTSHIFT,
+
+    zxkeycodes.KEY_LEFTCTRL,
+    zxkeycodes.KEY_LEFTALT,
+    zxkeycodes.KEY_SPACE,
+    zxkeycodes.KEY_RIGHTALT,
+    zxkeycodes.KEY_RIGHTCTRL,
+
+    # zxkeycodes.KEY_SYSRQ,
+    # zxkeycodes.KEY_SCROLLLOCK,
+    # zxkeycodes.KEY_PAUSE,
+    zxkeycodes.KEY_INSERT,
+    zxkeycodes.KEY_HOME,
+    zxkeycodes.KEY_PAGEUP,
+    zxkeycodes.KEY_DELETE,
+    zxkeycodes.KEY_END,
+    zxkeycodes.KEY_PAGEDOWN,
+
+    zxkeycodes.KEY_UP,
+    zxkeycodes.KEY_LEFT,
+    zxkeycodes.KEY_RIGHT,
+    zxkeycodes.KEY_DOWN,
+
+    # zxkeycodes.KEY_NUMLOCK,
+    # zxkeycodes.KEY_KPSLASH,
+    # zxkeycodes.KEY_KPASTERISK,     # KEYPAD *
+    # zxkeycodes.KEY_KPMINUS,
+    # zxkeycodes.KEY_KP7,
+    # zxkeycodes.KEY_KP8,
+    # zxkeycodes.KEY_KP9,
+    # zxkeycodes.KEY_KPPLUS,
+    # zxkeycodes.KEY_KP4,
+    # zxkeycodes.KEY_KP5,
+    # zxkeycodes.KEY_KP6,
+    # zxkeycodes.KEY_KP1,
+    # zxkeycodes.KEY_KP2,
+    # zxkeycodes.KEY_KP3,
+    # zxkeycodes.KEY_KP0,
+    # zxkeycodes.KEY_KPDOT,
+    # zxkeycodes.KEY_KPENTER,
 ]
+device, deviceFd = hardware.openDevice(deviceEvents, kernelRepeat)
+
+# Timings and counts for zxstats.py
+stats = zxstats.ScanStats()
+
+# Key events for a whole scan go out together with one sync
+batch = zxoutput.EventBatch(device, deviceFd, stats)
+
+# Kernel autorepeat needs the uinput file descriptor, and stays off
+# outside console mode
+kernelRepeat = kernelRepeat and deviceFd is not None
+if kernelRepeat:
+    batch.setRepeat(0, 0)
+    batch.flush()
+
+# Keymaps and wiring from the keymap file, resolved to uinput events
+# indexed by addressLine * 5 + dataLine (or straight from its cache)
+keymapPath = os.path.join(myDir, keymapFile)
+consoleTables = ('normalKeys', 'shiftKeys', 'symbolKeys', 'extendedKeys')
+keymapTables = dict([('keys', zxkeyfile.KEYS), ('funcKeys', zxkeyfile.KEYS)] + [(t, zxkeyfile.CHORDS) for t in consoleTables])
+
+def loadKeymaps():
+    return zxkeyfile.loadKeymaps(keymapPath, keymapTables, deviceEvents, zxkeycodes, matrixCapabilities=zxkeycodes.KEYS)
+
+keymaps = loadKeymaps()
+dataLines = keymaps.dataLines
+addressLines = keymaps.addressLines
+
+# Other keyboards in the keymap file ([matrix name]), scanned along with
+# the Spectrum's, each sending its keys through a uinput device of its own
+extraMatrices = keymaps.matrices
+extraBatches = []
+for matrixName, matrixAddressLines, matrixDataLines in extraMatrices:
+    extraDevice, extraDeviceFd = hardware.openDevice(zxkeycodes.KEYS, name='ZX %s' % matrixName)
+    extraBatches.append(zxoutput.EventBatch(extraDevice, extraDeviceFd, stats))
+extraMask = ((1 << (zxmatrix.KEYS * len(extraMatrices))) - 1) << zxmatrix.KEYS
+
+# Joysticks in the keymap file ([joystick name]), read with every scan, their
+# switches following on from the matrices' keys. Those that aren't on
+# Spectrum keys get a gamepad device each.
+joystickPins = [pin for joystickName, switchPins, joystickKeys in keymaps.joysticks for pin in switchPins]
+joystickShift = zxmatrix.KEYS * (1 + len(extraMatrices))
+gamepadBatches = []
+for joystickName, switchPins, joystickKeys in keymaps.joysticks:
+    if joystickKeys is None:
+        gamepadDevice, gamepadDeviceFd = hardware.openDevice(zxjoystick.GAMEPAD_EVENTS, name='ZX joystick %s' % joystickName)
+        gamepadBatches.append(zxoutput.EventBatch(gamepadDevice, gamepadDeviceFd, stats))
+    else:
+        gamepadBatches.append(None)
+gamepads = zxjoystick.GamepadOutput(gamepadBatches, joystickShift)
+
+# Take a set of keymaps into use, compiling the macros against them so a
+# bad one shows up now
+def useKeymaps(new):
+    global keymaps, keyNames, keyCodes, funcKeyNames, funcKeyCodes, extraNames, extraCodes, consoleKeyNames, consoleKeyCodes, chordKeysMask, macroSteps, functionMacroKeys
+    keymaps = new
+    keyNames = new.names['keys']
+    keyCodes = new.codes['keys']
+    funcKeyNames = new.names['funcKeys']
+    funcKeyCodes = new.codes['funcKeys']
+
+    # Other matrices' keys, 40 a matrix, following on from the Spectrum's
+    extraNames = sum((new.names[matrixName] for matrixName, matrixAddressLines, matrixDataLines in extraMatrices), ())
+    extraCodes = sum((new.codes[matrixName] for matrixName, matrixAddressLines, matrixDataLines in extraMatrices), ())
+
+    # Console keymaps, one per console state
+    consoleKeyNames = tuple(new.names[t] for t in consoleTables)
+    consoleKeyCodes = tuple(new.codes[t] for t in consoleTables)
+
+    # Keys that type something in console mode (everything but shift and symbol)
+    chordKeysMask = zxmatrix.keyMask(i for i, c in enumerate(consoleKeyCodes[0]) if c is not None)
+
+    # Macros for FUSE and for the console
+    macroKeyIndexes = zxmacro.keyIndexNames(keyNames, shiftIndex, symbolIndex)
+    macroTargets = (
+        (zxmacro.spectrumCharacters(keyNames, shiftIndex, symbolIndex), zxmacro.spectrumRenderer(keyCodes)),
+        (zxmacro.consoleCharacters(consoleKeyNames[:3], shiftIndex, symbolIndex), zxmacro.consoleRenderer(consoleKeyCodes[:3], shiftIndex, symbolIndex)),
+    )
+    macroSteps = {}
+    for macroName, script in macros.items():
+        macroSteps[macroName] = []
+        for characters, renderer in macroTargets:
+            try:
+                macroSteps[macroName].append(zxmacro.renderMacro(zxmacro.compileMacro(script, characters, macroKeyIndexes), renderer))
+            except ValueError as e:
+                log.warning('Macro %s: %s', macroName, e)
+                macroSteps[macroName].append(None)
+
+    # Function Keys mode keys that type macros instead, by key index
+    functionMacroKeys, unknownKeys = zxmacro.bindKeys(functionMacros, macroKeyIndexes)
+    for key in unknownKeys:
+        log.warning('Function macro %s: the keymap has no key %s', functionMacros[key], key)
+
+useKeymaps(keymaps)
+
+# Load the keymap file again whenever it changes, for the main loop to
+# swap in between frames
+pendingKeymaps = keymaps
+keymapDevices = keymaps.devices()
+
+# functionMacros keys a set of keymaps has no key for
+def unboundMacroKeys(keymaps):
+    return zxmacro.bindKeys(functionMacros, zxmacro.keyIndexNames(keymaps.names['keys'], shiftIndex, symbolIndex))[1]
+
+def keymapsChanged(new):
+    global pendingKeymaps
+    if new.devices() != keymapDevices:
+        log.warning('Keeping the keymaps in use: other matrices and joysticks only change on restart')
+        return
+    lostKeys = [key for key in unboundMacroKeys(new) if key not in unboundMacroKeys(pendingKeymaps)]
+    if lostKeys:
+        log.warning('Keeping the keymaps in use: they have no key %s for functionMacros', ', '.join(lostKeys))
+        return
+    pendingKeymaps = new
+
+def keymapsFailed(error):
+    log.warning('Keeping the keymaps in use: %s', error)
+
+keymapWatcher = None
+if watchKeymaps:
+    keymapWatcher = zxkeyfile.KeymapWatcher(keymapPath, loadKeymaps, keymapsChanged, keymapsFailed)
+
+# rgb colour for each console state
+consoleLeds = ((0,0,1), (0,1,1), (1,0,1), (1,1,1))
+
+def consoleStateChanged(state):
+    log.info('console mode switched to %s', zxconsole.STATE_NAMES[state])
+    setled(*consoleLeds[state])
+
+console = zxconsole.ConsoleKeyboard(consoleKeyCodes, shiftIndex, symbolIndex, chordKeysMask, consoleStateChanged)
+
+# Chords typed in console mode repeat from here, on the scan loop's clock
+repeater = zxrepeat.Autorepeat(repeatDelay, repeatPeriod)
+
+# Key held down for the kernel to repeat
+heldCode = None
+
+# Type the key at keyIndex in the current console layout, then keep
+# repeating it until stopTyping()
+def typeKey(keyIndex, repeat):
+    global heldCode
+    keyPressed = consoleKeyNames[console.state][keyIndex]
+    chordCodes = console.keymap[keyIndex]
+    if not chordCodes:
+        # key not implemented
+        return
+    console.keyTyped()
+    bip(3000,1)
+    if kernelRepeat and len(chordCodes) == 1:
+        batch.press(chordCodes[0])
+        heldCode = chordCodes[0]
+    else:
+        # whole chord goes out with one sync
+        batch.tap(chordCodes)
+        if not repeat:
+            repeater.start(keyIndex)
+    batch.flush(None if repeat else frameTime)
+    for keyName in keyPressed:
+        log.debug('press %s %s', keyName, 'repeat' if repeat else 'down')
+
+def stopTyping():
+    global heldCode
+    repeater.stop()
+    if heldCode:
+        batch.release(heldCode)
+        batch.flush()
+        heldCode = None
 
+# Setup GPIO
 
-def getKey(k):
-    # k is a tuple
-    if   (consoleMode == 0): modeKeys = normalKeys
-    elif (consoleMode == 1): modeKeys = shiftKeys
-    elif (consoleMode == 2): modeKeys = symbolKeys
-    elif (consoleMode == 3): modeKeys = extendedKeys
-    return modeKeys[k[0]][k[1]]
-
+# These run on the feedback thread
+def toneWrite(f):
+    hardware.softToneWrite(buzzerPIN,f)
 
-# Well this is annoying
-device = uinput.Device([
-
-    uinput.KEY_ESC,
-    uinput.KEY_F1,
-    uinput.KEY_F2,
-    uinput.KEY_F3,
-    uinput.KEY_F4,
-    uinput.KEY_F5,
-    uinput.KEY_F6,
-    uinput.KEY_F7,
-    uinput.KEY_F8,
-    uinput.KEY_F9,
-    uinput.KEY_F10,
-    # uinput.KEY_F11,
-    # uinput.KEY_F12,
-
-    uinput.KEY_GRAVE,   # ` ~
-    uinput.KEY_1,       # 1 !
-    uinput.KEY_2,       # 2 @
-    uinput.KEY_3,       # 3 #
-    uinput.KEY_4,       # 4 $
-    uinput.KEY_5,       # 5 %
-    uinput.KEY_6,       # 6 ^
-    uinput.KEY_7,       # 7 &
-    uinput.KEY_8,       # 8 *
-    uinput.KEY_9,       # 9 (
-    uinput.KEY_0,       # 0 )
-    uinput.KEY_MINUS,   # - _
-    uinput.KEY_EQUAL,   # = +
-    uinput.KEY_BACKSPACE,
-
-    uinput.KEY_TAB,
-    uinput.KEY_Q,       
-    uinput.KEY_W,
-    uinput.KEY_E,
-    uinput.KEY_R,
-    uinput.KEY_T,
-    uinput.KEY_Y,
-    uinput.KEY_U,
-    uinput.KEY_I,
-    uinput.KEY_O,
-    uinput.KEY_P,
-    uinput.KEY_LEFTBRACE,  # [ {
-    uinput.KEY_RIGHTBRACE, # ] }
-    uinput.KEY_ENTER,
-
-    uinput.KEY_CAPSLOCK,
-    uinput.KEY_A,
-    uinput.KEY_S,
-    uinput.KEY_D,
-    uinput.KEY_F,
-    uinput.KEY_G,
-    uinput.KEY_H,
-    uinput.KEY_J,
-    uinput.KEY_K,
-    uinput.KEY_L,
-    uinput.KEY_SEMICOLON,  # ; :
-    uinput.KEY_APOSTROPHE, # ' "
-    uinput.KEY_BACKSLASH,  # \ |
-
-    uinput.KEY_LEFTSHIFT,
-    #uinput.KEY_102ND,      # < > on most querty 102+key layouts
-    uinput.KEY_Z,
-    uinput.KEY_X,
-    uinput.KEY_C,
-    uinput.KEY_V,
-    uinput.KEY_B,
-    uinput.KEY_N,
-    uinput.KEY_M,
-    uinput.KEY_COMMA, # , <
-    uinput.KEY_DOT, # . <
-    uinput.KEY_SLASH, # / ?
-    uinput.KEY_RIGHTSHIFT,
-
-    uinput.KEY_LEFTCTRL,
-    uinput.KEY_LEFTALT,
-    uinput.KEY_SPACE,
-    uinput.KEY_RIGHTALT,
-    uinput.KEY_RIGHTCTRL,
-
-    # uinput.KEY_SYSRQ,
-    # uinput.KEY_SCROLLLOCK,
-    # uinput.KEY_PAUSE,
-    uinput.KEY_INSERT,
-    uinput.KEY_HOME,
-    uinput.KEY_PAGEUP,
-    uinput.KEY_DELETE,
-    uinput.KEY_END,
-    uinput.KEY_PAGEDOWN,
-
-    uinput.KEY_UP,
-    uinput.KEY_LEFT,
-    uinput.KEY_RIGHT,
-    uinput.KEY_DOWN,
-
-    # uinput.KEY_NUMLOCK,
-    # uinput.KEY_KPSLASH,
-    # uinput.KEY_KPASTERISK,     # KEYPAD *
-    # uinput.KEY_KPMINUS,
-    # uinput.KEY_KP7,
-    # uinput.KEY_KP8,
-    # uinput.KEY_KP9,
-    # uinput.KEY_KPPLUS,
-    # uinput.KEY_KP4,
-    # uinput.KEY_KP5,
-    # uinput.KEY_KP6,
-    # uinput.KEY_KP1,
-    # uinput.KEY_KP2,
-    # uinput.KEY_KP3,
-    # uinput.KEY_KP0,
-    # uinput.KEY_KPDOT,
-    # uinput.KEY_KPENTER,
-])
-
-# Setup GPIO
+def ledWrite(r,g,b):
+    hardware.digitalWrite(ledR,r)
+    hardware.digitalWrite(ledG,g)
+    hardware.digitalWrite(ledB,b)
 
+# These only queue the request so they never hold up scanning
 def bip(f,l):
-    wiringpi.softToneWrite(buzzerPIN,f)
-    time.sleep(l/1000.0)
-    wiringpi.softToneWrite(buzzerPIN,0)
+    feedback.bip(f,l)
 
 def setled(r,g,b):
-    wiringpi.digitalWrite(ledR,r)
-    wiringpi.digitalWrite(ledG,g)
-    wiringpi.digitalWrite(ledB,b)
+    feedback.setled(r,g,b)
 
 def getled():
-    return ( wiringpi.digitalRead(ledR), wiringpi.digitalRead(ledG), wiringpi.digitalRead(ledB) )
+    return ( hardware.digitalRead(ledR), hardware.digitalRead(ledG), hardware.digitalRead(ledB) )
 
-wiringpi.wiringPiSetupGpio()
 
-wiringpi.softToneCreate(buzzerPIN)
+hardware.softToneCreate(buzzerPIN)
 
-wiringpi.pinMode(buttonLED, 1)
-wiringpi.digitalWrite(buttonLED, 1)
+hardware.pinMode(buttonLED, 1)
+hardware.digitalWrite(buttonLED, 1)
 for led in [ledR,ledG,ledB]:
-    wiringpi.pinMode(led, 1)
+    hardware.pinMode(led, 1)
+
+# Buzzer and LEDs are driven from a background thread
+feedback = zxfeedback.Feedback(tone=toneWrite, led=ledWrite)
 
 setled(1,0,0)
 
 
+# Every matrix's address and data lines (matrices can share data lines)
+allAddressLines = list(addressLines)
+allDataLines = list(dataLines)
+for matrixName, matrixAddressLines, matrixDataLines in extraMatrices:
+    allAddressLines += matrixAddressLines
+    allDataLines += [dataLine for dataLine in matrixDataLines if dataLine not in allDataLines]
+
 # Set all address lines high
-for addressLine in addressLines:
-    wiringpi.pinMode(addressLine, 1)
-    wiringpi.digitalWrite(addressLine, 1)
+for addressLine in allAddressLines:
+    hardware.pinMode(addressLine, 1)
+    hardware.digitalWrite(addressLine, 1)
 
 # Set all data lines for input
-for dataLine in dataLines:
-    wiringpi.pullUpDnControl(dataLine, 2)
+for dataLine in allDataLines:
+    hardware.pullUpDnControl(dataLine, 2)
+
+# Joystick switches pull their pins low
+for pin in joystickPins:
+    hardware.pinMode(pin, 0)
+    hardware.pullUpDnControl(pin, 2)
 
 # Setup Button
-wiringpi.pinMode(buttonGPIO, 0)
-wiringpi.pullUpDnControl(buttonGPIO, 2)
+hardware.pinMode(buttonGPIO, 0)
+hardware.pullUpDnControl(buttonGPIO, 2)
+
+# Fast access to the matrix lines, all the matrices' in one scan if there
+# are others
+if extraMatrices:
+    matrixLines = hardware.matrixGroup([(addressLines, dataLines)] + [(matrixAddressLines, matrixDataLines) for matrixName, matrixAddressLines, matrixDataLines in extraMatrices])
+else:
+    matrixLines = hardware.matrixLines(addressLines, dataLines)
+
+# Report frames that miss their deadline, a line a second at most
+scheduler = zxscheduler.FrameScheduler(scanRate, rowSettle, zxscheduler.OverrunLog(log))
+
+# Report how long we slept and how quickly we woke up
+def reportWake(idleTime, latency):
+    log.info('Waking after %.1fs idle: %.2fms to wake, %.2f%% CPU while idle', idleTime, latency * 1000, idle.cpuUse() * 100)
+
+# Stop scanning when nothing is pressed and wait for an edge on a data line or the button
+idle = None
+if idleFrames:
+    idle = zxidle.IdleMode(hardware.edgeSource(allDataLines + joystickPins + [buttonGPIO]), idleFrames, onWake=reportWake)
+
+# Ignore contact bounce
+debouncer = zxmatrix.Debouncer(debouncePress, debounceRelease)
+
+# Scan fast while keys are in use and slow down when they aren't
+rate = None
+if slowScanRate < scanRate:
+    rate = zxrate.AdaptiveRate(scheduler, zxrate.rateLadder(scanRate, slowScanRate), rateQuietTime)
+
+# Keep ghost keys out (the membrane has no diodes)
+rollover = zxrollover.RolloverFilter(ghostPolicies[keyboardMode])
+
+# Read the joysticks in the same frame, debounced with the keys
+joysticks = None
+if joystickPins:
+    joysticks = zxjoystick.Joysticks(hardware.switchLines(joystickPins), joystickShift, [joystickKeys for joystickName, switchPins, joystickKeys in keymaps.joysticks])
+
+engine = zxengine.ScanEngine(matrixLines, scheduler, idle, debouncer, stats, rate, rollover, joysticks)
+
+# In low jitter mode the scan thread and this one run at real-time
+# priority (the scan thread takes it on itself; no other thread, like the
+# log writer or the stats server, inherits it)
+realtime = None
+if lowJitter:
+    realtime = zxrealtime.RealtimeMode(realtimePriority, cpus=realtimeCpus)
+    realtime.schedule()
+    realtime.lockMemory()
+
+# Scan in a thread of its own so nothing below can hold it up
+def buttonDown():
+    return hardware.digitalRead(buttonGPIO) == False
+
+# Emulators can read the keyboard straight from shared memory as well
+export = None
+if matrixExport:
+    export = zxshm.MatrixExport(matrixExport)
+
+scanThread = zxengine.ScanThread(engine, buttonDown, export=export, realtime=realtime)
+scanThread.start()
+
+stats.gauge('overruns', lambda: scheduler.overruns)
+stats.gauge('ringOverflows', lambda: scanThread.ring.overflows)
+stats.gauge('maxRollover', lambda: rollover.maxRollover)
+stats.gauge('ghostRectangles', lambda: rollover.rectangles)
+stats.gauge('ghostsSuppressed', lambda: rollover.suppressed)
+stats.gauge('joystickMoves', lambda: gamepads.moves)
+if rate:
+    for dwellRate in rate.rates:
+        stats.gauge('dwell%gHz' % dwellRate, lambda dwellRate=dwellRate: rate.dwell[dwellRate])
+statsServer = None
+if statsSocket:
+    statsServer = zxstats.StatsServer(stats, statsSocket)
+
+# Tap the button to cycle keyboard modes, hold it for 3 seconds to kill
+# FUSE (or shut down if it isn't running)
+def switchMode(held):
+    global keyboardMode
+    stats.modeSwitches += 1
+    if(keyboardMode == 0):
+        log.info('Switching to Function Keys')
+        keyboardMode = 1;
+        bip(1000,200)
+        setled(0,1,0)
+    elif(keyboardMode == 1):
+        log.info('Switching to Console Keys')
+        keyboardMode = 2;
+        # Keys held from Function Keys mode come up now; console mode
+        # types its own way and would never release them
+        releasePressed(False)
+        bip(2000,200)
+        setled(0,0,1)
+        console.reset()
+        if kernelRepeat:
+            batch.setRepeat(repeatDelay, repeatPeriod)
+            batch.flush()
+    elif(keyboardMode == 2):
+        log.info('Switching to Spectrum Keys')
+        keyboardMode = 0;
+        stopTyping()
+        if kernelRepeat:
+            batch.setRepeat(0, 0)
+            batch.flush()
+        bip(3000,200)
+        setled(1,0,0)
+    rollover.setPolicy(ghostPolicies[keyboardMode])
+    macro.stop()
+
+def killFuse(held):
+    log.info('Killing FUSE or shutdown')
+    os.system('if pgrep fuse; then killall fuse; else halt;fi')
+
+# bip every second until the long press fires
+def buttonHeld(held):
+    if(held == 0):
+        log.info('Button pressed')
+        bip(3000,20)
+    elif(held < gestures.longPress):
+        bip(3000,10)
+
+# Type macros a key at a time from the main loop
+macro = zxmacro.MacroPlayer(batch, macroHold, macroGap, macroRepeatGap)
+stats.gauge('macroKeys', lambda: macro.typed)
+
+def startMacro(name):
+    steps = macroSteps.get(name)
+    if not steps or not steps[keyboardMode == 2]:
+        log.warning('No macro %s for this mode', name)
+        return
+    log.info('Typing macro %s', name)
+    if keyboardMode == 2:
+        stopTyping()
+        macro.play(steps[1], 0, macroConsoleGap, macroConsoleGap)
+    else:
+        macro.play(steps[0])
+
+gestures = zxbutton.ButtonGestures()
+gestures.on(zxbutton.TAP, switchMode)
+gestures.on(zxbutton.LONG_PRESS, killFuse)
+gestures.on(zxbutton.HOLD, buttonHeld)
+for gesture, name in gestureMacros.items():
+    gestures.on(gesture, lambda held, name=name: startMacro(name))
+
+# Ghost key rectangles logged so far
+rectangles = 0
+
+# Event sent for each key that's down, released whatever the keymap is by
+# the time it comes up
+pressedCodes = {}
+
+# Release the keys in pressedCodes: the Spectrum's, and the other
+# matrices' too if extras
+def releasePressed(extras):
+    for keyIndex in sorted(pressedCodes):
+        if keyIndex < zxmatrix.KEYS:
+            batch.release(pressedCodes.pop(keyIndex))
+        elif extras:
+            extraBatches[keyIndex // zxmatrix.KEYS - 1].release(pressedCodes.pop(keyIndex))
+        else:
+            continue
+        stats.releases += 1
+    for pressedBatch in [batch] + extraBatches:
+        pressedBatch.flush()
+
+# Last frame from the scan thread
+matrix = 0
+button = False
+frameTime = 0
+
+# Startup is over: take everything built so far out of the garbage
+# collector's way
+if realtime:
+    realtime.freezeHeap()
+    log.info('%s', realtime.report())
 
 # Announce
-print("Running")
+log.info('Running')
 bip(1000,100)
 
 try:
 
     # Loop forever
     while True:
-        # Button check
-        if(wiringpi.digitalRead(buttonGPIO) == False):
-            # Record time the button was pressed
-            if(buttonPressed == -1):
-                buttonPressed = time.time()
-                print('Button pressed')
-                bip(3000,20)
-                buttonBip=time.time()
-            else:
-                # bip 3 times before act
-                if(time.time() > buttonBip+1):
-                    buttonBip=time.time()
-                    bip(3000,10)
-
-        elif(buttonPressed != -1):
-            # Button released - but how long was it pressed for?
-            buttonTime = time.time() - buttonPressed
-
-            # If over 3 secs, switch keyboard mode
-            if(buttonTime < 3):
-
-                # Switch modes
-                if(keyboardMode == 0):
-                    print("Switching to Function Keys")
-                    keyboardMode = 1;
-                    bip(1000,200)
-                    setled(0,1,0)
-                elif(keyboardMode == 1):
-                    print("Switching to Console Keys")
-                    keyboardMode = 2;
-                    bip(2000,200)
-                    setled(0,0,1)
-                    consoleMode = 0
-                    consoleModeTime = time.time()
-                    autorepeatKey = None
-                elif(keyboardMode == 2):
-                    print("Switching to Spectrum Keys")
-                    keyboardMode = 0;
-                    bip(3000,200)
-                    setled(1,0,0)
-            else:
-                print('Killing FUSE or shutdown')
-                os.system('if pgrep fuse; then killall fuse; else halt;fi')
+        # Wait for the scan thread to see something change (or for the
+        # button, a repeating key or a macro's next key to be due)
+        timeouts = [t for t in (gestures.timeout(), repeater.timeout(), macro.timeout()) if t is not None]
+        frame = scanThread.ring.pop(min(timeouts) if timeouts else None)
+        if frame:
+            frameTime, matrix, changed, button = frame
+            gestures.update(button, int(frameTime * zxbutton.SECOND))
+        else:
+            changed = 0
+            gestures.update(button)
+
+        # New keymaps from the watcher
+        newKeymaps = pendingKeymaps
+        if newKeymaps is not keymaps:
+            log.info('Keymaps reloaded from %s', keymapPath)
+            if newKeymaps.dataLines != dataLines or newKeymaps.addressLines != addressLines:
+                log.warning('Wiring %s takes effect on restart', newKeymaps.wiring)
+            useKeymaps(newKeymaps)
+            if joysticks:
+                joysticks.setKeys([joystickKeys for joystickName, switchPins, joystickKeys in newKeymaps.joysticks])
+            console.setKeymaps(consoleKeyCodes, chordKeysMask)
+
+        # Say when keys might be ghosts
+        if rollover.rectangles != rectangles:
+            rectangles = rollover.rectangles
+            allNames = keyNames + extraNames
+            log.info('Possible ghost keys: %s', ' '.join(str(allNames[i]) for i in zxmatrix.keyIndexes(rollover.rectangle)))
+
+        # Next key of a macro, once real key presses have caught up
+        if macro.playing() and not len(scanThread.ring):
+            if not macro.poll():
+                log.info('Macro typed %d keys in %.2fs', macro.typed, macro.elapsed)
+
+        # Other matrices' keys go straight out through their own devices,
+        # whatever the mode
+        if changed & extraMask:
+            for keyIndex in zxmatrix.keyIndexes(changed & extraMask):
+                extraIndex = keyIndex - zxmatrix.KEYS
+                extraBatch = extraBatches[extraIndex // zxmatrix.KEYS]
+                if((matrix >> keyIndex) & 1):
+                    if extraCodes[extraIndex] is None:
+                        continue
+                    log.debug('Pressing %s', extraNames[extraIndex])
+                    stats.presses += 1
+                    pressedCodes[keyIndex] = extraCodes[extraIndex]
+                    extraBatch.press(extraCodes[extraIndex])
+                elif keyIndex in pressedCodes:
+                    log.debug('Releasing %s', extraNames[extraIndex])
+                    stats.releases += 1
+                    extraBatch.release(pressedCodes.pop(keyIndex))
+            for extraBatch in extraBatches:
+                extraBatch.flush(frameTime)
+
+        # Joysticks not on keys go out through their gamepad devices
+        gamepads.update(matrix, changed, frameTime)
+        changed &= zxmatrix.MASK
 
-            # Reset
-            buttonPressed = -1
-                        
         if(keyboardMode < 2):
             # Keyboard(s) for fuse
 
-            # Individually set each address line low
-            for addressLine in range(8):
-                
-                # Set low
-                wiringpi.digitalWrite(addressLines[addressLine], 0)
-                
-                # Scan data lines
-                for dataLine in range(5):
-
-                    # Get state and details for this button
-                    isFree = wiringpi.digitalRead(dataLines[dataLine])
-                    if(keyboardMode == 0):
-                        keyPressed = keys[addressLine][dataLine]
-                    else:
-                        keyPressed = funcKeys[addressLine][dataLine]
-                    keyCode = getattr(uinput, 'KEY_' + keyPressed)
-
-                    # If pressed for the first time
-                    if(isFree == False and keyTrack[addressLine][dataLine] == False):
-
-                        # Press the key and make a note
-                        print('Pressing ' + keyPressed)
-                        device.emit(keyCode, 1)
-                        keyTrack[addressLine][dataLine] = time.time()
-                        bip(3000,1)
-
-                    # If not pressed now but was pressed on last check
-                    elif(isFree == True and keyTrack[addressLine][dataLine]):
-                            
-                        # Release the key and make a note
-                        print('Releasing ' + keyPressed)
-                        device.emit(keyCode, 0)
-                        keyTrack[addressLine][dataLine] = False
-
-                # Set high
-                wiringpi.digitalWrite(addressLines[addressLine], 1)
-
-                # Have a quick snooze (suggested by Keef)
-                time.sleep(.01)
+            # Keymap for this pass
+            if(keyboardMode == 0):
+                modeNames = keyNames
+                modeCodes = keyCodes
+            else:
+                modeNames = funcKeyNames
+                modeCodes = funcKeyCodes
+
+            for keyIndex in zxmatrix.keyIndexes(changed):
+
+                # Pressed since the last check
+                if((matrix >> keyIndex) & 1):
+
+                    # Keys bound to macros in Function Keys mode type them instead
+                    if(keyboardMode == 1 and keyIndex in functionMacroKeys):
+                        startMacro(functionMacroKeys[keyIndex])
+                        continue
+
+                    # Keys the keymap leaves out (-)
+                    if modeCodes[keyIndex] is None:
+                        continue
+
+                    # Press the key and make a note
+                    log.debug('Pressing %s', modeNames[keyIndex])
+                    stats.presses += 1
+                    pressedCodes[keyIndex] = modeCodes[keyIndex]
+                    batch.press(modeCodes[keyIndex])
+                    bip(3000,1)
+
+                # Released since the last check
+                elif keyIndex in pressedCodes:
+                        
+                    # Release the key
+                    log.debug('Releasing %s', modeNames[keyIndex])
+                    stats.releases += 1
+                    batch.release(pressedCodes.pop(keyIndex))
+
+            # Send this scan's key events
+            batch.flush(frameTime)
         
         if(keyboardMode == 2):
             # Keyboard for console
 
 
-            # consoleMode:
-            #     0 = normal
-            #     1 = shift pressed
-            #     2 = symbol pressed
-            #     3 = extended (shift+symbol pressed then released)
-            if   (consoleMode == 0): setled(0,0,1)
-            elif (consoleMode == 1): setled(0,1,1)
-            elif (consoleMode == 2): setled(1,0,1)
-            elif (consoleMode == 3): setled(1,1,1)
-            listPressed=[]
+            pressedKey = None
+            for keyIndex in zxmatrix.keyIndexes(changed):
 
+                # Pressed since the last check
+                if((matrix >> keyIndex) & 1):
 
-            # Individually set each address line low
-            for addressLine in range(8):
+                    # Make a note of the key
+                    log.debug('Pressing %s', keyNames[keyIndex])
+                    stats.presses += 1
+                    stopTyping()
+                    pressedKey = keyIndex
+                    # if two keys are pressed the last wins
+
+                # Released since the last check
+                else:
                     
-                # Set low
-                wiringpi.digitalWrite(addressLines[addressLine], 0)
-                
-                # Scan data lines
-                for dataLine in range(5):
-
-                    # Get state and details for this button
-                    isFree = wiringpi.digitalRead(dataLines[dataLine])
-                    keyPressed = keys[addressLine][dataLine]
-                    # keyCode = getattr(uinput, 'KEY_' + keyPressed)
-
-                    if(isFree == False and type(normalKeys[addressLine][dataLine])==type(())):
-                        listPressed.append((addressLine,dataLine))
-
-                    # If pressed for the first time
-                    if(isFree == False and keyTrack[addressLine][dataLine] == False):
-
-                        # Press the key and make a note
-                        print('Pressing ' + keyPressed)
-                        keyTrack[addressLine][dataLine] = time.time()
-                        autorepeatKey = {'k':(addressLine,dataLine),'n':0,'t':False}
-                        # if two keys are pressed the last wins
-
-                    # If not pressed now but was pressed on last check
-                    elif(isFree == True and keyTrack[addressLine][dataLine]):
-                        
-                        # Release the key and make a note
-                        print('Releasing ' + keyPressed)
-                        keyTrack[addressLine][dataLine] = False
-                        autorepeatKey = None
-
-                # Set high
-                wiringpi.digitalWrite(addressLines[addressLine], 1)
-
-                # Have a quick snooze (suggested by Keef)
-                time.sleep(.01)
-
-            shiftkey = keyTrack[5][0]
-            symbolkey = keyTrack[7][1]
-            if shiftkey > consoleModeTime or symbolkey > consoleModeTime:
-                print "enter change mode"
-                # need to change console mode; all keys already pressed will be ignored
-                autorepeatKey = None
-                if shiftkey and symbolkey:
-                    if consoleMode == 3:
-                        consoleMode=0
-                    else:
-                        consoleMode=3
-                    extendedPressed = False
-                    print "shift+symbol pressed"
-                elif shiftkey:
-                    consoleMode = 1
-                    print "shift pressed"
-                elif symbolkey:
-                    consoleMode = 2
-                    print "symbol pressed"
-                print "mode switched to"
-                print consoleMode
-                consoleModeTime = time.time()
-                continue
-            if consoleMode == 3 and (shiftkey or symbolkey):
-                autorepeatKey = None
-                # to manage keys you have to release both shift and symbol
-                continue
-            if consoleMode == 0 and (shiftkey or symbolkey):
-                autorepeatKey = None
-                # this condition is bad, but possible
+                    # Stop typing
+                    log.debug('Releasing %s', keyNames[keyIndex])
+                    stats.releases += 1
+                    stopTyping()
+                    pressedKey = None
+
+            # shift and symbol pick the layout (and the leds)
+            if console.update(matrix, changed) != zxconsole.TYPE:
+                stopTyping()
                 continue
-            if consoleMode == 1 and symbolkey:
-                autorepeatKey = None
-                # this condition is not possible
-                continue
-            if consoleMode == 2 and shiftkey:
-                # this condition is not possible
-                autorepeatKey = None
-                continue
-            if consoleMode == 1 and not shiftkey:
-                # shift was released; need change mode
-                print "shift released rollback to normal"
-                autorepeatKey = None
-                consoleMode = 0
-                consoleModeTime = time.time()
-                continue
-            if consoleMode == 2 and not symbolkey:
-                # symbol was released; need change mode
-                print "symbol released rollback to normal"
-                autorepeatKey = None
-                consoleMode = 0
-                consoleModeTime = time.time()
-                continue
-            if consoleMode == 3 and extendedPressed and not listPressed:
-                # you can turnoff extended mode
-                print "return to normal after extended"
-                autorepeatKey = None
-                consoleMode = 0
-                consoleModeTime = time.time()
-                continue
-            # now you can manage pressed keys
-            # autorepeatKey = {'k':(addressLine,dataLine),'n':0,'t':False}
-            if autorepeatKey:
-                keyPressed = getKey(autorepeatKey['k'])
-                print keyPressed
-                if not keyPressed:
-                    # key not implemented
-                    autorepeatKey = None
-                    continue
-                if (autorepeatKey['n'] == 0) or (autorepeatKey['n'] == 1 and time.time() > autorepeatKey['t']+0.7) or (autorepeatKey['n'] > 1 and time.time() > autorepeatKey['t']+0.2):
-                    extendedPressed = True
-                    bip(3000,1)
-                    autorepeatKey['t']=time.time()
-                    autorepeatKey['n']+=1
-                    print autorepeatKey['n']
-                    if len(keyPressed) == 1:
-                        keyCode = getattr(uinput, 'KEY_' + keyPressed[0])
-                        device.emit(keyCode, 1)
-                        print "press "+keyPressed[0]+" down"
-                        device.emit(keyCode, 0)
-                        print "press "+keyPressed[0]+" up"
-                    else:
-                        keyCode0 = getattr(uinput, 'KEY_' + keyPressed[0])
-                        keyCode1 = getattr(uinput, 'KEY_' + keyPressed[1])
-                        device.emit(keyCode0, 1)
-                        print "press "+keyPressed[0]+" down"
-                        device.emit(keyCode1, 1)
-                        print "press "+keyPressed[1]+" down"
-                        device.emit(keyCode1, 0)
-                        print "press "+keyPressed[1]+" up"
-                        device.emit(keyCode0, 0)
-                        print "press "+keyPressed[0]+" up"
+
+            # now you can type: a key that's just gone down, or one that's
+            # due to repeat
+            if pressedKey is not None:
+                typeKey(pressedKey, False)
+            else:
+                repeatKey = repeater.poll()
+                if repeatKey is not None:
+                    typeKey(repeatKey, True)
 
 except KeyboardInterrupt:
-    for led in [ledR,ledG,ledB,buttonLED]:
-        wiringpi.digitalWrite(led, 0)
+    log.info('Frame ring: %d overflows, high water %d', scanThread.ring.overflows, scanThread.ring.highWater)
+    log.info('Autorepeat: %d repeats, worst %.1fms late', repeater.repeats, repeater.worstLateness * 1000)
+    if log.dropped:
+        log.warning('Log: %d messages dropped', log.dropped)
+    stopTyping()
+    macro.stop()
+    releasePressed(True)
+    if keymapWatcher:
+        keymapWatcher.close()
+    setled(0,0,0)
     bip(500,100)
+    feedback.close()
+    hardware.digitalWrite(buttonLED, 0)
+    if statsServer:
+        statsServer.close()
+    if export:
+        export.close()
+    log.close()
     sys.exit(0)
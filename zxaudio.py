@@ -0,0 +1,137 @@
+#
+# ZX Raspberry Keyboard Scanner - sound cues
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# The mode change dings used to start a shell and a fresh mpg123 (which
+# decodes the MP3 from scratch) every time. Now they are decoded once at
+# startup into 16 bit PCM and written to one output that stays open:
+#
+#   AlsaSink  writes straight to ALSA (needs pyalsaaudio)
+#   PipeSink  feeds a long running aplay through a pipe
+#   WavSink   writes to a WAV file instead of a sound card, keeping a log
+#             of when each cue started so timing can be checked
+#
+# Sinks have write(pcm) which returns once the sound has been handed over
+# (or, for WavSink with realtime set, once it would have finished).
+#
+
+import shutil, subprocess, time, wave
+
+RATE = 44100
+CHANNELS = 2
+SAMPLE_WIDTH = 2
+
+
+# Decode a sound file to raw PCM (RATE, CHANNELS, 16 bit little endian)
+def decode(path):
+    if path.lower().endswith('.wav'):
+        with wave.open(path, 'rb') as w:
+            if (w.getframerate(), w.getnchannels(), w.getsampwidth()) != (RATE, CHANNELS, SAMPLE_WIDTH):
+                raise ValueError('%s must be %d Hz, %d channels, 16 bit' % (path, RATE, CHANNELS))
+            return w.readframes(w.getnframes())
+    return subprocess.check_output(['mpg123', '-q', '-s', '-r', str(RATE), '--stereo', '-e', 's16', path])
+
+
+class AlsaSink(object):
+
+    def __init__(self, device='default'):
+        import alsaaudio
+        self.pcm = alsaaudio.PCM(alsaaudio.PCM_PLAYBACK, device=device)
+        self.pcm.setchannels(CHANNELS)
+        self.pcm.setrate(RATE)
+        self.pcm.setformat(alsaaudio.PCM_FORMAT_S16_LE)
+        self.pcm.setperiodsize(1024)
+        self.periodBytes = 1024 * CHANNELS * SAMPLE_WIDTH
+
+    def write(self, pcm):
+        for start in range(0, len(pcm), self.periodBytes):
+            self.pcm.write(pcm[start:start + self.periodBytes])
+
+    def close(self):
+        self.pcm.close()
+
+
+class PipeSink(object):
+
+    def __init__(self):
+        self.process = subprocess.Popen(
+            ['aplay', '-q', '-t', 'raw', '-f', 'S16_LE', '-r', str(RATE), '-c', str(CHANNELS)],
+            stdin=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def write(self, pcm):
+        self.process.stdin.write(pcm)
+        self.process.stdin.flush()
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+
+class WavSink(object):
+
+    # realtime: make write() take as long as the sound would to play
+    def __init__(self, path, realtime=True):
+        self.wav = wave.open(path, 'wb')
+        self.wav.setnchannels(CHANNELS)
+        self.wav.setsampwidth(SAMPLE_WIDTH)
+        self.wav.setframerate(RATE)
+        self.realtime = realtime
+        self.opened = time.monotonic()
+        self.written = 0
+        self.log = []
+
+    def write(self, pcm):
+        start = time.monotonic()
+        frameBytes = CHANNELS * SAMPLE_WIDTH
+
+        # Silence for the gap since the last sound so the file keeps time
+        position = int((start - self.opened) * RATE)
+        if position > self.written:
+            self.wav.writeframes(b'\0' * ((position - self.written) * frameBytes))
+            self.written = position
+
+        frames = len(pcm) // frameBytes
+        self.log.append((start, self.written, frames))
+        self.wav.writeframes(pcm)
+        self.written += frames
+
+        if self.realtime:
+            time.sleep(max(0, start + float(frames) / RATE - time.monotonic()))
+
+    def close(self):
+        self.wav.close()
+
+
+# The best output we can find: ALSA, then aplay, otherwise None
+def openSink():
+    try:
+        return AlsaSink()
+    except Exception:
+        pass
+    if shutil.which('aplay'):
+        return PipeSink()
+    return None
+
+
+class Player(object):
+
+    # sounds maps names to files, all decoded here and now
+    def __init__(self, sink, sounds):
+        self.sink = sink
+        self.sounds = {}
+        for name, path in sounds.items():
+            try:
+                self.sounds[name] = decode(path)
+            except (OSError, ValueError, subprocess.CalledProcessError) as e:
+                print('Unable to load %s: %s' % (path, e))
+
+    # Play a preloaded sound, returning when the sink has it
+    def play(self, name):
+        pcm = self.sounds.get(name)
+        if pcm is None or self.sink is None:
+            return
+        self.sink.write(pcm)
+
+    def close(self):
+        if self.sink:
+            self.sink.close()
@@ -0,0 +1,133 @@
+#
+# ZX Raspberry Keyboard Scanner - mode button gestures
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Turns the mode button's level into gestures, timed in nanoseconds on the
+# monotonic clock (so NTP stepping the wall clock can't stretch or shrink
+# a press):
+#
+#   HOLD        when the button goes down and every `progress` after that
+#               while it is held (held is 0, progress, 2 * progress...)
+#   LONG_PRESS  once, as soon as it has been held for `longPress`
+#   TAP         released before LONG_PRESS
+#   DOUBLE_TAP  two taps within `doubleTap` of each other
+#
+# A change of level only counts once it has stayed put for `debounce`.
+# TAP waits out the double tap window only if there's a DOUBLE_TAP handler.
+# Handlers are called with the time held in nanoseconds.
+#
+# update() takes the level whenever it changes; in between timeout() says
+# how soon it needs calling again for debounce and timed gestures to fire.
+#
+
+import time
+
+MS = 1000000
+SECOND = 1000000000
+
+TAP = 0
+DOUBLE_TAP = 1
+LONG_PRESS = 2
+HOLD = 3
+GESTURE_NAMES = ('tap', 'double tap', 'long press', 'hold')
+
+
+class ButtonGestures(object):
+
+    # debounce:  ns the level must stay put before a change counts
+    # doubleTap: ns after a tap to wait for a second one
+    # longPress: ns held before LONG_PRESS fires
+    # progress:  ns between HOLD events
+    def __init__(self, debounce=20 * MS, doubleTap=300 * MS, longPress=3 * SECOND, progress=SECOND, clock=time.monotonic_ns):
+        self.debounce = debounce
+        self.doubleTap = doubleTap
+        self.longPress = longPress
+        self.progress = progress
+        self.clock = clock
+        self.handlers = {}
+        self.level = False
+        self.levelSince = 0
+        self.down = False
+        self.downSince = 0
+        self.nextHold = None
+        self.longFired = False
+        self.secondTap = False
+        self.tapPending = None
+        self.tapHeld = 0
+        self.counts = [0] * len(GESTURE_NAMES)
+
+    # handler(held) is called for gesture (one handler per gesture)
+    def on(self, gesture, handler):
+        self.handlers[gesture] = handler
+
+    def fire(self, gesture, held):
+        self.counts[gesture] += 1
+        handler = self.handlers.get(gesture)
+        if handler:
+            handler(held)
+
+    # The button level (True while pressed)
+    def update(self, level, now=None):
+        if now is None:
+            now = self.clock()
+        if level != self.level:
+            self.level = level
+            self.levelSince = now
+
+        # Debounced press or release, dated from when the level changed
+        if self.level != self.down and now - self.levelSince >= self.debounce:
+            self.down = self.level
+            if self.down:
+                self.pressed(self.levelSince)
+            else:
+                self.released(self.levelSince)
+
+        if self.down:
+            held = now - self.downSince
+            if now >= self.nextHold:
+                step = self.nextHold - self.downSince
+                self.nextHold += (1 + (now - self.nextHold) // self.progress) * self.progress
+                self.fire(HOLD, step)
+            if not self.longFired and held >= self.longPress:
+                self.longFired = True
+                self.fire(LONG_PRESS, held)
+        elif self.tapPending is not None and now - self.tapPending >= self.doubleTap:
+            self.tapPending = None
+            self.fire(TAP, self.tapHeld)
+
+    def pressed(self, when):
+        self.downSince = when
+        self.nextHold = when
+        self.longFired = False
+        self.secondTap = self.tapPending is not None
+        self.tapPending = None
+
+    def released(self, when):
+        held = when - self.downSince
+        if self.longFired:
+            return
+        if self.secondTap:
+            self.fire(DOUBLE_TAP, held)
+        elif DOUBLE_TAP in self.handlers:
+            self.tapPending = when
+            self.tapHeld = held
+        else:
+            self.fire(TAP, held)
+
+    # Seconds until update() has something to do even if the level stays
+    # the same, None if nothing is waiting
+    def timeout(self, now=None):
+        if now is None:
+            now = self.clock()
+        due = []
+        if self.level != self.down:
+            due.append(self.levelSince + self.debounce)
+        if self.down:
+            due.append(self.nextHold)
+            if not self.longFired:
+                due.append(self.downSince + self.longPress)
+        elif self.tapPending is not None:
+            due.append(self.tapPending + self.doubleTap)
+        if not due:
+            return None
+        return max(0, min(due) - now) / float(SECOND)
@@ -0,0 +1,136 @@
+#
+# ZX Raspberry Keyboard Scanner - console mode state machine
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Console mode has four layouts picked with the Spectrum's shift keys:
+#
+#   NORMAL    nothing held
+#   SHIFT     caps shift held
+#   SYMBOL    symbol shift held
+#   EXTENDED  caps shift + symbol shift pressed together, then released
+#             (like the 'E' cursor); the next key typed drops back to NORMAL
+#
+# Each frame is boiled down to six input bits (which of shift/symbol went
+# down this frame, which are held, whether any other key is held and
+# whether a key has been typed in EXTENDED yet) and looked up in a
+# transition table built once at import, giving the next state and what
+# to do with the keys:
+#
+#   TYPE    go ahead and type the key being held
+#   BLOCK   type nothing (a shift key is in the way)
+#   SWITCH  the layout changed; forget the key being held
+#
+
+NORMAL = 0
+SHIFT = 1
+SYMBOL = 2
+EXTENDED = 3
+STATE_NAMES = ('normal', 'shift', 'symbol', 'extended')
+
+TYPE = 0
+BLOCK = 1
+SWITCH = 2
+
+# Input bits
+SHIFT_DOWN = 1          # caps shift went down this frame
+SYMBOL_DOWN = 2         # symbol shift went down this frame
+SHIFT_HELD = 4
+SYMBOL_HELD = 8
+KEYS_HELD = 16          # some key other than the shifts is held
+TYPED = 32              # a key has been typed since the last switch
+INPUTS = 64
+
+
+# The rules, one state and set of inputs at a time (only used to build
+# the table)
+def transition(state, inputs):
+    shiftHeld = inputs & SHIFT_HELD
+    symbolHeld = inputs & SYMBOL_HELD
+
+    # A shift key going down picks the layout; anything else held is ignored
+    # (a shift only counts as going down while it's held)
+    if inputs & (SHIFT_DOWN | SYMBOL_DOWN) & (inputs >> 2):
+        if shiftHeld and symbolHeld:
+            return (NORMAL if state == EXTENDED else EXTENDED), SWITCH
+        if shiftHeld:
+            return SHIFT, SWITCH
+        if symbolHeld:
+            return SYMBOL, SWITCH
+
+    # Shift keys still held from a switch, or held in the wrong layout
+    if state == EXTENDED and (shiftHeld or symbolHeld):
+        return state, BLOCK
+    if state == NORMAL and (shiftHeld or symbolHeld):
+        return state, BLOCK
+    if state == SHIFT and symbolHeld:
+        return state, BLOCK
+    if state == SYMBOL and shiftHeld:
+        return state, BLOCK
+
+    # Letting go of shift or symbol goes back to normal
+    if state == SHIFT and not shiftHeld:
+        return NORMAL, SWITCH
+    if state == SYMBOL and not symbolHeld:
+        return NORMAL, SWITCH
+
+    # Extended lasts until a key has been typed and everything let go
+    if state == EXTENDED and inputs & TYPED and not inputs & KEYS_HELD:
+        return NORMAL, SWITCH
+
+    return state, TYPE
+
+
+# (next state, action) for every state << 6 | inputs
+TRANSITIONS = tuple(transition(state, inputs) for state in range(4) for inputs in range(INPUTS))
+
+
+class ConsoleKeyboard(object):
+
+    # keymaps:       compiled keymap for each state (see zxkeymap.compileChords)
+    # shiftIndex:    matrix position of caps shift
+    # symbolIndex:   matrix position of symbol shift
+    # keysMask:      matrix bits of the keys that type something
+    # onStateChange: called with the new state whenever it changes
+    def __init__(self, keymaps, shiftIndex, symbolIndex, keysMask, onStateChange=None):
+        self.keymaps = keymaps
+        self.shiftIndex = shiftIndex
+        self.symbolIndex = symbolIndex
+        self.keysMask = keysMask
+        self.onStateChange = onStateChange
+        self.reset()
+
+    # Change keymaps (when the keymap file changes), staying in the same state
+    def setKeymaps(self, keymaps, keysMask):
+        self.keymaps = keymaps
+        self.keysMask = keysMask
+        self.keymap = keymaps[self.state]
+
+    # Back to NORMAL (on entering console mode)
+    def reset(self):
+        self.state = NORMAL
+        self.keymap = self.keymaps[NORMAL]
+        self.typed = 0
+
+    # A key has been typed in the current layout
+    def keyTyped(self):
+        self.typed = TYPED
+
+    # Run one frame through the state machine and return the action
+    def update(self, matrix, changed):
+        down = matrix & changed
+        inputs = (((down >> self.shiftIndex) & 1) |
+            ((down >> self.symbolIndex) & 1) << 1 |
+            ((matrix >> self.shiftIndex) & 1) << 2 |
+            ((matrix >> self.symbolIndex) & 1) << 3 |
+            (matrix & self.keysMask != 0) << 4 |
+            self.typed)
+
+        state, action = TRANSITIONS[self.state << 6 | inputs]
+        if action == SWITCH:
+            self.typed = 0
+            if state != self.state:
+                self.state = state
+                self.keymap = self.keymaps[state]
+                if self.onStateChange:
+                    self.onStateChange(state)
+        return action
@@ -0,0 +1,155 @@
+#
+# ZX Raspberry Keyboard Scanner - scan engine
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Ties the matrix lines, the frame scheduler, idle mode, ghost key
+# filtering and debouncing together. The scanners call nextFrame() once per pass of their loop and
+# get back the debounced matrix as a 40 bit integer (see zxmatrix), or
+# with a group of matrices (zxgpio.GpioMemMatrices) all of them in one
+# integer, 40 bits each, scanned in the same frame. Joysticks (see
+# zxjoystick) are read in the same frame too, and their switches follow on
+# from the matrices' keys.
+#
+# ScanThread runs an engine on a thread of its own and passes each frame
+# that differs from the last one on through a zxring.FrameRing, so nothing
+# the consumer does (printing, emitting, beeping) can delay a scan. It can
+# also publish every frame straight to emulators through a zxshm export.
+#
+
+import os, signal, threading, time, traceback, zxmatrix, zxring
+
+
+class ScanEngine(object):
+
+    # lines:     zxgpio matrix lines, or a group of matrices
+    # scheduler: zxscheduler.FrameScheduler
+    # idle:      zxidle.IdleMode, or None to scan flat out forever
+    # debounce:  zxmatrix.Debouncer, or None to pass raw scans through
+    # stats:     zxstats.ScanStats to time frames and row reads into, or None
+    # rate:      zxrate.AdaptiveRate to speed the scheduler up and slow it
+    #            down with the keyboard's use, or None for a fixed rate
+    # rollover:  zxrollover.RolloverFilter to deal with ghost keys before
+    #            debouncing, or None
+    # joysticks: zxjoystick.Joysticks to read with every scan, or None
+    def __init__(self, lines, scheduler, idle=None, debounce=None, stats=None, rate=None, rollover=None, joysticks=None):
+        self.lines = lines
+        self.scheduler = scheduler
+        self.idle = idle
+        self.debounce = debounce
+        self.stats = stats
+        self.rate = rate
+        self.rollover = rollover
+        self.joysticks = joysticks
+        self.quietFrames = 0
+        self.lastScan = None
+        if hasattr(lines, 'steps'):
+            self.scan = zxmatrix.scanMatrices
+            self.matrices = len(lines.matrices)
+            self.rows = len(lines.steps)
+        else:
+            self.scan = zxmatrix.scanMatrix
+            self.matrices = 1
+            self.rows = zxmatrix.ROWS
+        # Bits a frame can have set
+        self.bits = self.matrices * zxmatrix.KEYS
+        if joysticks:
+            self.bits = max(self.bits, joysticks.mask.bit_length())
+
+    # Wait for the next frame, scan it and return the matrix
+    #
+    # busy keeps the engine from going idle even though no keys are down
+    # (while the mode button is held, say).
+    def nextFrame(self, busy=False):
+        if self.idle and not busy and self.quietFrames >= self.idle.quietFrames:
+            if self.idle.sleep(self.lines):
+                self.quietFrames = 0
+                if self.rate:
+                    self.rate.wake()
+            self.scheduler.restart()
+            self.lastScan = None
+
+        self.scheduler.waitNextFrame()
+        if self.stats:
+            start = time.monotonic()
+            raw = self.scan(self.lines, self.scheduler.settle)
+            self.stats.rowRead.add((time.monotonic() - start) / self.rows)
+            if self.lastScan is not None:
+                self.stats.framePeriod.add(start - self.lastScan)
+            self.lastScan = start
+        else:
+            raw = self.scan(self.lines, self.scheduler.settle)
+        matrix = self.rollover.update(raw) if self.rollover else raw
+        if self.joysticks:
+            switches = self.joysticks.read()
+            raw |= switches
+            matrix |= switches
+        if self.debounce:
+            matrix = self.debounce.update(matrix)
+        if self.joysticks:
+            matrix = self.joysticks.toKeys(matrix)
+
+        if raw or matrix or busy:
+            self.quietFrames = 0
+        else:
+            self.quietFrames += 1
+        if self.rate:
+            self.rate.update(not self.quietFrames)
+        return matrix
+
+
+class ScanThread(object):
+
+    # engine:     ScanEngine to run
+    # readButton: returns True while the mode button is held, or None
+    # export:     zxshm.MatrixExport to publish every frame to, or None
+    # realtime:   zxrealtime.RealtimeMode for the thread to take on, or None
+    def __init__(self, engine, readButton=None, ringSize=256, export=None, realtime=None):
+        self.engine = engine
+        self.readButton = readButton
+        self.export = export
+        self.realtime = realtime
+        self.ring = zxring.FrameRing(ringSize, engine.bits > 64)
+        self.running = False
+        self.thread = threading.Thread(target=self.run, name='scan')
+        self.thread.daemon = True
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+
+    def run(self):
+        try:
+            if self.realtime:
+                self.realtime.scheduleThread()
+            self.scan()
+        except Exception:
+            # Scanning is no use to anyone if it has stopped, so take the
+            # whole scanner down with it (a real SIGINT, unlike
+            # interrupt_main(), also wakes a main thread blocked on the ring)
+            traceback.print_exc()
+            os.kill(os.getpid(), signal.SIGINT)
+
+    def scan(self):
+        engine = self.engine
+        readButton = self.readButton
+        export = self.export
+        push = self.ring.push
+        clock = time.monotonic
+        pushedMatrix = 0
+        pushedButton = False
+        button = False
+        while self.running:
+            matrix = engine.nextFrame(button)
+            if export:
+                export.publish(matrix, clock())
+            if readButton:
+                button = readButton()
+            if matrix != pushedMatrix or button != pushedButton:
+                # Diff against the last frame the consumer got, so nothing
+                # goes missing if the ring was full last time
+                if push(clock(), matrix, matrix ^ pushedMatrix, button):
+                    pushedMatrix = matrix
+                    pushedButton = button
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,121 @@
+#
+# ZX Raspberry Keyboard Scanner - buzzer, LED and sound feedback
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Beeping the buzzer means sleeping for the length of the beep and playing
+# a sound means starting a process, neither of which the scan loop can
+# afford. The scan loop just drops requests in here, which never blocks,
+# and a background thread does the slow part.
+#
+# The worker sleeps on an Event while there's nothing to do, rather than
+# polling, so an idle scanner isn't woken up a hundred times a second by
+# it. The price is on the scan loop's side: a request that finds the
+# worker asleep sets the Event, which takes its lock and may make a futex
+# system call to wake it. A request made while the worker is busy, or
+# already woken, only appends to the queue.
+#
+# Under load the worker doesn't try to catch up: the queue only holds the
+# last few requests, anything that has waited longer than maxAge is thrown
+# away, a run of identical beeps plays once, and only the latest LED colour
+# is ever shown.
+#
+
+import collections, threading, time
+
+TONE = 0
+SOUND = 1
+
+
+class Feedback(object):
+
+    # tone:  tone(frequency) starts the buzzer, tone(0) stops it
+    # led:   led(r, g, b) sets the status LEDs
+    # sound: sound(name) plays a sound and returns when it's done
+    def __init__(self, tone=None, led=None, sound=None, queueLength=8, maxAge=.25):
+        self.tone = tone
+        self.led = led
+        self.sound = sound
+        self.maxAge = maxAge
+        self.requests = collections.deque(maxlen=queueLength)
+        self.ledWanted = None
+        self.ledShown = None
+        self.played = 0
+        self.dropped = 0
+        self.lastDelay = 0.0
+        self.worstDelay = 0.0
+        self.running = True
+        self.wake = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='feedback')
+        self.thread.daemon = True
+        self.thread.start()
+
+    # Beep at frequency for length milliseconds
+    def bip(self, frequency, length):
+        self.requests.append((TONE, time.monotonic(), frequency, length))
+        self.wakeUp()
+
+    # Change the status LEDs
+    def setled(self, r, g, b):
+        self.ledWanted = (r, g, b)
+        self.wakeUp()
+
+    # Play a sound
+    def play(self, name):
+        self.requests.append((SOUND, time.monotonic(), name, 0))
+        self.wakeUp()
+
+    # Wake the worker if it's asleep
+    def wakeUp(self):
+        if not self.wake.is_set():
+            self.wake.set()
+
+    def run(self):
+        while self.running or self.requests:
+            self.updateLed()
+            try:
+                kind, queued, what, length = self.requests.popleft()
+            except IndexError:
+                # Clear before looking again, so a request made in between
+                # either is seen now or sets the Event again
+                self.wake.clear()
+                if not self.requests and self.running and self.ledWanted == self.ledShown:
+                    self.wake.wait()
+                continue
+
+            delay = time.monotonic() - queued
+            if delay > self.maxAge:
+                self.dropped += 1
+                continue
+
+            # Several of the same beep waiting: just play the last one
+            while self.requests and self.requests[0][0] == kind and self.requests[0][2:] == (what, length):
+                self.requests.popleft()
+                self.dropped += 1
+
+            # How long it sat in the queue
+            self.lastDelay = delay
+            if delay > self.worstDelay:
+                self.worstDelay = delay
+
+            if kind == TONE and self.tone:
+                self.tone(what)
+                time.sleep(length / 1000.0)
+                self.tone(0)
+            elif kind == SOUND and self.sound:
+                self.sound(what)
+            self.played += 1
+        self.updateLed()
+
+    def updateLed(self):
+        wanted = self.ledWanted
+        if wanted != self.ledShown:
+            if self.led:
+                self.led(*wanted)
+            self.ledShown = wanted
+
+    # Finish anything still queued and stop the worker
+    def close(self):
+        self.running = False
+        self.wake.set()
+        self.thread.join()
+
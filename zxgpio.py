@@ -0,0 +1,366 @@
+#
+# ZX Raspberry Keyboard Scanner - GPIO access
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Two ways of talking to the keyboard matrix lines:
+#
+# GpioMemLines reads the whole GPIO level register (GPLEV0) in one go from
+# a memory mapped /dev/gpiomem and picks the five data lines out of it with
+# precomputed lookup tables. Address lines are driven with single GPSET0 /
+# GPCLR0 writes.
+#
+# WiringPiLines does the same job one pin at a time through wiringpi, which
+# is how the scanners always worked.
+#
+# Both expose the same calls so the scan loop doesn't care which it gets:
+#
+#   selectRow(i)  drive address line i low
+#   readRow()     bitmask of data lines reading low (bit n = dataLines[n])
+#   releaseRow(i) drive address line i high again
+#   selectAll()   drive every address line low (any key pulls its line low)
+#   releaseAll()  drive every address line high
+#
+# GpioMemMatrices and WiringPiMatrices scan several matrices (the Spectrum's
+# plus a keypad, say) as one. Matrix k's keys come back at bit
+# k * 40 + row * 5 + column of one integer, and the scan goes through
+# `steps` rather than address lines: each step drives one address line of
+# every matrix in it low, and readRow() returns the keys of all of them,
+# already in place. Matrices with no data lines in common share steps, so
+# with /dev/gpiomem one GPLEV0 read covers them all; a matrix that shares
+# data lines with another (wired across the Spectrum's data lines, say)
+# gets steps of its own.
+#
+# GpioMemSwitches and WiringPiSwitches read switches wired straight from a
+# pin to ground, like a joystick's, with read().
+#
+
+import mmap, os, zxmatrix
+
+# BCM283x GPIO register block, as mapped by /dev/gpiomem
+GPIO_BLOCK_SIZE = 4096
+
+# Register offsets (in 32 bit words)
+GPSET0 = 0x1C // 4
+GPCLR0 = 0x28 // 4
+GPLEV0 = 0x34 // 4
+
+
+# Memory mapped GPIO registers
+#
+# path is normally /dev/gpiomem but any file of GPIO_BLOCK_SIZE bytes will
+# do (see createRegisterFile) which lets the scanner run off a Pi. On a real
+# Pi writes to GPSET0/GPCLR0 change the pins and GPLEV0 reflects them; with a
+# plain file they are just words in memory.
+class GpioMem(object):
+
+    def __init__(self, path='/dev/gpiomem'):
+        fd = os.open(path, os.O_RDWR | os.O_SYNC)
+        try:
+            self.mem = mmap.mmap(fd, GPIO_BLOCK_SIZE, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)
+        self.regs = memoryview(self.mem).cast('I')
+        self.path = path
+
+    # All 32 GPIO levels of bank 0 in a single load
+    def levels(self):
+        return self.regs[GPLEV0]
+
+    # Drive every pin in mask high
+    def set(self, mask):
+        self.regs[GPSET0] = mask
+
+    # Drive every pin in mask low
+    def clear(self, mask):
+        self.regs[GPCLR0] = mask
+
+    def close(self):
+        self.regs.release()
+        self.mem.close()
+
+
+# Create a zeroed file that GpioMem can map in place of /dev/gpiomem
+def createRegisterFile(path):
+    with open(path, 'wb') as f:
+        f.write(b'\0' * GPIO_BLOCK_SIZE)
+    return path
+
+
+# Build the lookup tables that turn a GPLEV0 value into a pressed mask
+#
+# The 32 bit level word is split into bytes. For every byte that holds at
+# least one data line there is a 256 entry table giving that byte's share
+# of the result, so readRow() costs one table lookup per byte in use rather
+# than a shift and mask per data line. Lines are active low so a pin
+# reading 0 sets its bit.
+def dataLineTables(dataLines):
+    tables = []
+    for shift in (0, 8, 16, 24):
+        inByte = [(pin - shift, bit) for bit, pin in enumerate(dataLines) if shift <= pin < shift + 8]
+        if not inByte:
+            continue
+        table = []
+        for value in range(256):
+            pressed = 0
+            for pinBit, bit in inByte:
+                if not (value >> pinBit) & 1:
+                    pressed |= 1 << bit
+            table.append(pressed)
+        tables.append((shift, tuple(table)))
+    return tuple(tables)
+
+
+class GpioMemLines(object):
+
+    def __init__(self, addressLines, dataLines, path='/dev/gpiomem'):
+        for pin in list(addressLines) + list(dataLines):
+            if not 0 <= pin < 32:
+                raise ValueError('GPIO %d is not in bank 0' % pin)
+        self.gpio = GpioMem(path)
+        self.addressMasks = tuple(1 << pin for pin in addressLines)
+        self.allAddressMask = sum(self.addressMasks)
+        self.tables = dataLineTables(dataLines)
+
+    def selectRow(self, row):
+        self.gpio.clear(self.addressMasks[row])
+
+    def releaseRow(self, row):
+        self.gpio.set(self.addressMasks[row])
+
+    def selectAll(self):
+        self.gpio.clear(self.allAddressMask)
+
+    def releaseAll(self):
+        self.gpio.set(self.allAddressMask)
+
+    def readRow(self):
+        levels = self.gpio.levels()
+        pressed = 0
+        for shift, table in self.tables:
+            pressed |= table[(levels >> shift) & 0xFF]
+        return pressed
+
+
+class WiringPiLines(object):
+
+    # gpio: anything with wiringpi's digitalWrite/digitalRead (the wiringpi
+    # module itself if not given)
+    def __init__(self, addressLines, dataLines, gpio=None):
+        if gpio is None:
+            import wiringpi as gpio
+        self.wiringpi = gpio
+        self.addressLines = list(addressLines)
+        self.dataLines = list(dataLines)
+        self.dataBits = tuple((dataLine, 1 << bit) for bit, dataLine in enumerate(dataLines))
+
+    def selectRow(self, row):
+        self.wiringpi.digitalWrite(self.addressLines[row], 0)
+
+    def releaseRow(self, row):
+        self.wiringpi.digitalWrite(self.addressLines[row], 1)
+
+    def selectAll(self):
+        for addressLine in self.addressLines:
+            self.wiringpi.digitalWrite(addressLine, 0)
+
+    def releaseAll(self):
+        for addressLine in self.addressLines:
+            self.wiringpi.digitalWrite(addressLine, 1)
+
+    def readRow(self):
+        pressed = 0
+        for dataLine, bit in self.dataBits:
+            if not self.wiringpi.digitalRead(dataLine):
+                pressed |= bit
+        return pressed
+
+
+# Use /dev/gpiomem when we can, otherwise fall back to wiringpi
+def openMatrixLines(addressLines, dataLines, path='/dev/gpiomem'):
+    try:
+        return GpioMemLines(addressLines, dataLines, path)
+    except (OSError, IOError, ValueError) as e:
+        print('GPIO memory access unavailable (%s), using wiringpi' % e)
+        return WiringPiLines(addressLines, dataLines)
+
+
+# Work out the steps for scanning matrices together
+#
+# matrices is a list of (addressLines, dataLines). Matrices go into phases
+# whose data lines don't overlap, first fit, and each phase takes as many
+# steps as its tallest matrix has address lines. Returns a tuple of steps,
+# each a tuple of (matrix, row).
+def planSteps(matrices):
+    addressPins = [pin for addressLines, dataLines in matrices for pin in addressLines]
+    if len(set(addressPins)) != len(addressPins):
+        raise ValueError('Matrices can\'t share address lines')
+    for addressLines, dataLines in matrices:
+        if not 0 < len(addressLines) <= zxmatrix.ROWS or not 0 < len(dataLines) <= zxmatrix.COLUMNS:
+            raise ValueError('A matrix needs 1-%d address lines and 1-%d data lines' % (zxmatrix.ROWS, zxmatrix.COLUMNS))
+        if set(dataLines) & set(addressPins):
+            raise ValueError('GPIO %d is both an address line and a data line' % min(set(dataLines) & set(addressPins)))
+    phases = []
+    for matrix, (addressLines, dataLines) in enumerate(matrices):
+        for phase in phases:
+            if not phase[0] & set(dataLines):
+                break
+        else:
+            phase = (set(), [])
+            phases.append(phase)
+        phase[0].update(dataLines)
+        phase[1].append(matrix)
+    steps = []
+    for pins, members in phases:
+        for row in range(max(len(matrices[matrix][0]) for matrix in members)):
+            steps.append(tuple((matrix, row) for matrix in members if row < len(matrices[matrix][0])))
+    return tuple(steps)
+
+
+class GpioMemMatrices(object):
+
+    # matrices: list of (addressLines, dataLines), the first the Spectrum's
+    def __init__(self, matrices, path='/dev/gpiomem'):
+        for addressLines, dataLines in matrices:
+            for pin in list(addressLines) + list(dataLines):
+                if not 0 <= pin < 32:
+                    raise ValueError('GPIO %d is not in bank 0' % pin)
+        self.matrices = [(list(addressLines), list(dataLines)) for addressLines, dataLines in matrices]
+        plan = planSteps(self.matrices)
+        self.gpio = GpioMem(path)
+        tables = [dataLineTables(dataLines) for addressLines, dataLines in self.matrices]
+
+        # For each step the address lines to drive and, for each byte of
+        # GPLEV0 in use, the tables of the matrices reading it, with the
+        # shift that puts their keys in place
+        self.steps = []
+        for step in plan:
+            mask = sum(1 << self.matrices[matrix][0][row] for matrix, row in step)
+            reads = tuple((shift, table, matrix * zxmatrix.KEYS + row * zxmatrix.COLUMNS)
+                for matrix, row in step for shift, table in tables[matrix])
+            self.steps.append((mask, reads))
+        self.allAddressMask = sum(1 << pin for addressLines, dataLines in self.matrices for pin in addressLines)
+        self.allReads = tuple((shift, table, matrix * zxmatrix.KEYS)
+            for matrix in range(len(self.matrices)) for shift, table in tables[matrix])
+        self.reads = self.allReads
+
+    def selectRow(self, step):
+        mask, self.reads = self.steps[step]
+        self.gpio.clear(mask)
+
+    def releaseRow(self, step):
+        self.gpio.set(self.steps[step][0])
+
+    def selectAll(self):
+        self.reads = self.allReads
+        self.gpio.clear(self.allAddressMask)
+
+    def releaseAll(self):
+        self.gpio.set(self.allAddressMask)
+
+    def readRow(self):
+        levels = self.gpio.levels()
+        pressed = 0
+        for shift, table, offset in self.reads:
+            pressed |= table[(levels >> shift) & 0xFF] << offset
+        return pressed
+
+
+class WiringPiMatrices(object):
+
+    # matrices: list of (addressLines, dataLines), the first the Spectrum's
+    # gpio:     anything with wiringpi's digitalWrite/digitalRead
+    def __init__(self, matrices, gpio=None):
+        if gpio is None:
+            import wiringpi as gpio
+        self.wiringpi = gpio
+        self.matrices = [(list(addressLines), list(dataLines)) for addressLines, dataLines in matrices]
+        plan = planSteps(self.matrices)
+        self.steps = []
+        for step in plan:
+            pins = tuple(self.matrices[matrix][0][row] for matrix, row in step)
+            reads = tuple((dataLine, 1 << (matrix * zxmatrix.KEYS + row * zxmatrix.COLUMNS + bit))
+                for matrix, row in step for bit, dataLine in enumerate(self.matrices[matrix][1]))
+            self.steps.append((pins, reads))
+        self.allAddressLines = [pin for addressLines, dataLines in self.matrices for pin in addressLines]
+        self.allReads = tuple((dataLine, 1 << (matrix * zxmatrix.KEYS + bit))
+            for matrix, (addressLines, dataLines) in enumerate(self.matrices) for bit, dataLine in enumerate(dataLines))
+        self.reads = self.allReads
+
+    def selectRow(self, step):
+        pins, self.reads = self.steps[step]
+        for pin in pins:
+            self.wiringpi.digitalWrite(pin, 0)
+
+    def releaseRow(self, step):
+        for pin in self.steps[step][0]:
+            self.wiringpi.digitalWrite(pin, 1)
+
+    def selectAll(self):
+        self.reads = self.allReads
+        for pin in self.allAddressLines:
+            self.wiringpi.digitalWrite(pin, 0)
+
+    def releaseAll(self):
+        for pin in self.allAddressLines:
+            self.wiringpi.digitalWrite(pin, 1)
+
+    def readRow(self):
+        pressed = 0
+        for dataLine, bit in self.reads:
+            if not self.wiringpi.digitalRead(dataLine):
+                pressed |= bit
+        return pressed
+
+
+class GpioMemSwitches(object):
+
+    # Switches wired from a pin to ground (joysticks): read() returns bit i
+    # set while pins[i] is held low, all of them from one GPLEV0 read
+    def __init__(self, pins, path='/dev/gpiomem'):
+        for pin in pins:
+            if not 0 <= pin < 32:
+                raise ValueError('GPIO %d is not in bank 0' % pin)
+        self.gpio = GpioMem(path)
+        self.tables = dataLineTables(pins)
+
+    def read(self):
+        levels = self.gpio.levels()
+        pressed = 0
+        for shift, table in self.tables:
+            pressed |= table[(levels >> shift) & 0xFF]
+        return pressed
+
+
+class WiringPiSwitches(object):
+
+    # gpio: anything with wiringpi's digitalRead
+    def __init__(self, pins, gpio=None):
+        if gpio is None:
+            import wiringpi as gpio
+        self.wiringpi = gpio
+        self.bits = tuple((pin, 1 << bit) for bit, pin in enumerate(pins))
+
+    def read(self):
+        pressed = 0
+        for pin, bit in self.bits:
+            if not self.wiringpi.digitalRead(pin):
+                pressed |= bit
+        return pressed
+
+
+def openSwitchLines(pins, path='/dev/gpiomem'):
+    try:
+        return GpioMemSwitches(pins, path)
+    except (OSError, IOError, ValueError) as e:
+        print('GPIO memory access unavailable (%s), using wiringpi' % e)
+        return WiringPiSwitches(pins)
+
+
+# Several matrices, through /dev/gpiomem when we can
+def openMatrixGroup(matrices, path='/dev/gpiomem'):
+    planSteps(matrices)
+    try:
+        return GpioMemMatrices(matrices, path)
+    except (OSError, IOError, ValueError) as e:
+        print('GPIO memory access unavailable (%s), using wiringpi' % e)
+        return WiringPiMatrices(matrices)
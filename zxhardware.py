@@ -0,0 +1,261 @@
+#
+# ZX Raspberry Keyboard Scanner - hardware backends
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# The scanners only get at the hardware through a backend:
+#
+#   WiringPiBackend   the real thing: GPIO through wiringpi (the matrix
+#                     through /dev/gpiomem when it can) and keys out through
+#                     uinput
+#   SimulatedBackend  the 8x5 matrix, mode button, LEDs and buzzer
+#                     modelled in memory, with a RecordingDevice in place of
+#                     uinput, so everything runs on any Linux box; with a
+#                     diode on every key, or ghosting like a real membrane
+#
+# Both have the wiringpi pin calls the scanners use (pinMode,
+# pullUpDnControl, digitalWrite, digitalRead, softToneCreate, softToneWrite)
+# plus:
+#
+#   matrixLines(addressLines, dataLines)  lines for zxmatrix.scanMatrix
+#   matrixGroup(matrices)                 several matrices for
+#                                         zxmatrix.scanMatrices
+#   switchLines(pins)                     switches to ground (joysticks)
+#   edgeSource(pins)                      edge source for zxidle.IdleMode
+#   openDevice(events, repeat, name)      (device, fd) as zxoutput.openDevice
+#
+# openBackend() picks the simulated backend when ZXSCANNER_BACKEND is set
+# to 'simulated' and wiringpi otherwise. Benchmarks that run a scanner
+# in-process set override to the backend it should get instead.
+#
+
+import collections, os, time, zxgpio, zxidle, zxmatrix, zxoutput
+
+PUD_UP = 2
+
+# Backend for openBackend() to hand out, whatever the environment says
+override = None
+
+
+class WiringPiBackend(object):
+
+    def __init__(self):
+        import wiringpi
+        wiringpi.wiringPiSetupGpio()
+        self.wiringpi = wiringpi
+        self.pinMode = wiringpi.pinMode
+        self.pullUpDnControl = wiringpi.pullUpDnControl
+        self.digitalWrite = wiringpi.digitalWrite
+        self.digitalRead = wiringpi.digitalRead
+        self.softToneCreate = wiringpi.softToneCreate
+        self.softToneWrite = wiringpi.softToneWrite
+
+    def matrixLines(self, addressLines, dataLines):
+        return zxgpio.openMatrixLines(addressLines, dataLines)
+
+    def matrixGroup(self, matrices):
+        return zxgpio.openMatrixGroup(matrices)
+
+    def switchLines(self, pins):
+        return zxgpio.openSwitchLines(pins)
+
+    def edgeSource(self, pins):
+        return zxidle.openEdgeSource(pins)
+
+    def openDevice(self, events, repeat=False, name=None):
+        import uinput
+        return zxoutput.openDevice(uinput, events, repeat, name)
+
+
+# Stands in for a python-uinput Device, keeping everything sent to it as
+# (time, type, code, value) with each SYN_REPORT as (time, EV_SYN, 0, 0)
+class RecordingDevice(object):
+
+    # limit: most events to keep (None = all of them)
+    def __init__(self, events, limit=None, clock=time.monotonic):
+        self.capabilities = list(events)
+        self.events = collections.deque(maxlen=limit)
+        self.clock = clock
+
+    def emit(self, event, value, syn=True):
+        self.events.append((self.clock(), event[0], event[1], value))
+        if syn:
+            self.syn()
+
+    def syn(self):
+        self.events.append((self.clock(), zxoutput.EV_SYN, zxoutput.SYN_REPORT, 0))
+
+    def destroy(self):
+        pass
+
+
+class SimulatedBackend(object):
+
+    # ghosting: model a membrane with no diodes on its keys, where three keys
+    #           down on the corners of a rectangle make the fourth read down
+    def __init__(self, clock=time.monotonic, ghosting=False):
+        self.clock = clock
+        self.ghosting = ghosting
+        self.modes = {}
+        self.pulls = {}
+        self.levels = {}
+        self.tones = {}
+        self.toneLog = []
+        self.rowPins = {}
+        self.columnPins = {}
+        self.dataLines = []
+        # Address lines driven low, and for each data line the address
+        # lines it is connected to through a key that's down
+        self.selected = 0
+        self.columns = [0] * zxmatrix.COLUMNS
+        # connectedRows() for the current selection and keys (None = not
+        # worked out yet)
+        self.connected = None
+        self.edges = None
+        # The first device opened, and all of them
+        self.device = None
+        self.devices = []
+        # Keys down on matrices other than the Spectrum's, as (address pin,
+        # data pin)
+        self.pinKeys = set()
+        # Times the first address line has been driven low (about one a scan)
+        self.scans = 0
+
+    def pinMode(self, pin, mode):
+        self.modes[pin] = mode
+
+    def pullUpDnControl(self, pin, pud):
+        self.pulls[pin] = pud
+
+    def digitalWrite(self, pin, value):
+        self.levels[pin] = value
+        row = self.rowPins.get(pin)
+        if row is not None:
+            self.connected = None
+            if value:
+                self.selected &= ~(1 << row)
+            else:
+                self.selected |= 1 << row
+                if not row:
+                    self.scans += 1
+
+    # A data line reads low when a key down on it connects it, through the
+    # key's diode, to an address line that is being driven low
+    #
+    # Without diodes current can also go the other way through a key, so
+    # the data line reads low when any chain of keys down connects it to a
+    # selected address line.
+    def digitalRead(self, pin):
+        column = self.columnPins.get(pin)
+        if column is not None:
+            rows = self.connectedRows() if self.ghosting else self.selected
+            if self.columns[column] & rows:
+                return 0
+        if self.pinKeys:
+            for addressPin, dataPin in self.pinKeys:
+                if dataPin == pin and not self.levels.get(addressPin, 1):
+                    return 0
+        if column is not None:
+            return 1
+        return self.levels.get(pin, 1 if self.pulls.get(pin) == PUD_UP else 0)
+
+    # Address lines joined to a selected one through keys that are down
+    def connectedRows(self):
+        if self.connected is None:
+            rows = self.selected
+            while True:
+                joined = rows
+                for keys in self.columns:
+                    if keys & rows:
+                        joined |= keys
+                if joined == rows:
+                    break
+                rows = joined
+            self.connected = rows
+        return self.connected
+
+    def softToneCreate(self, pin):
+        self.tones[pin] = 0
+
+    def softToneWrite(self, pin, frequency):
+        self.tones[pin] = frequency
+        self.toneLog.append((self.clock(), pin, frequency))
+
+    def matrixLines(self, addressLines, dataLines):
+        self.rowPins = dict((pin, row) for row, pin in enumerate(addressLines))
+        self.columnPins = dict((pin, column) for column, pin in enumerate(dataLines))
+        self.dataLines = list(dataLines)
+        self.selected = 0
+        self.connected = None
+        for pin in addressLines:
+            if not self.levels.get(pin, 1):
+                self.selected |= 1 << self.rowPins[pin]
+        return zxgpio.WiringPiLines(addressLines, dataLines, self)
+
+    # The first matrix is modelled as the Spectrum's; keys on the others
+    # are pressed with pressPins()
+    def matrixGroup(self, matrices):
+        self.matrixLines(*matrices[0])
+        return zxgpio.WiringPiMatrices(matrices, self)
+
+    # Switches are held with setButton()
+    def switchLines(self, pins):
+        return zxgpio.WiringPiSwitches(pins, self)
+
+    def edgeSource(self, pins):
+        self.edges = zxidle.SimulatedEdgeSource()
+        return self.edges
+
+    def openDevice(self, events, repeat=False, name=None):
+        device = RecordingDevice(events, clock=self.clock)
+        if self.device is None:
+            self.device = device
+        self.devices.append(device)
+        return device, None
+
+    # Put the whole keyboard in the state given by a zxmatrix bitmask
+    def setMatrix(self, matrix):
+        columns = [0] * zxmatrix.COLUMNS
+        for index in zxmatrix.keyIndexes(matrix):
+            row, column = divmod(index, zxmatrix.COLUMNS)
+            columns[column] |= 1 << row
+        before = self.columns
+        self.columns = columns
+        self.connected = None
+        for column in range(zxmatrix.COLUMNS):
+            if columns[column] & ~before[column] & self.selected and self.edges:
+                self.edges.trigger(self.dataLines[column])
+
+    def pressKey(self, index):
+        row, column = divmod(index, zxmatrix.COLUMNS)
+        self.columns[column] |= 1 << row
+        self.connected = None
+        if (self.selected >> row) & 1 and self.edges:
+            self.edges.trigger(self.dataLines[column])
+
+    def releaseKey(self, index):
+        row, column = divmod(index, zxmatrix.COLUMNS)
+        self.columns[column] &= ~(1 << row)
+        self.connected = None
+
+    # Hold or let go of a key joining addressPin and dataPin on another matrix
+    def pressPins(self, addressPin, dataPin):
+        self.pinKeys.add((addressPin, dataPin))
+        if not self.levels.get(addressPin, 1) and self.edges:
+            self.edges.trigger(dataPin)
+
+    def releasePins(self, addressPin, dataPin):
+        self.pinKeys.discard((addressPin, dataPin))
+
+    # Hold or let go of a push button wired from pin to ground
+    def setButton(self, pin, down):
+        self.levels[pin] = 0 if down else 1
+        if down and self.edges:
+            self.edges.trigger(pin)
+
+
+def openBackend():
+    if override:
+        return override
+    if os.environ.get('ZXSCANNER_BACKEND') == 'simulated':
+        return SimulatedBackend()
+    return WiringPiBackend()
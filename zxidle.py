@@ -0,0 +1,198 @@
+#
+# ZX Raspberry Keyboard Scanner - idle mode
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# When nobody has touched the keyboard for a while there is no point
+# scanning it hundreds of times a second. Instead every address line is set
+# low at once, so any key pulls its data line low, and we block until a
+# falling edge turns up on a data line (or the mode button).
+#
+# Edge sources all look the same to IdleMode:
+#
+#   arm()        start listening (drops anything seen before)
+#   wait(t)      block up to t seconds (None = forever) for an edge and
+#                return (pin, monotonic ns of the edge) or None
+#   disarm()     stop listening
+#
+# CdevEdgeSource uses GPIO character device line events, WiringPiEdgeSource
+# uses wiringPiISR and SimulatedEdgeSource is poked by hand for testing.
+#
+
+import fcntl, os, select, struct, threading, time
+
+# linux/gpio.h (v1 ABI)
+GPIOHANDLE_REQUEST_INPUT = 1 << 0
+GPIOEVENT_REQUEST_FALLING_EDGE = 1 << 1
+GPIOEVENT_REQUEST_SIZE = 48                  # struct gpioevent_request
+GPIOEVENT_DATA_SIZE = 16                     # struct gpioevent_data
+GPIO_GET_LINEEVENT_IOCTL = 0xC0000000 | (GPIOEVENT_REQUEST_SIZE << 16) | (0xB4 << 8) | 0x04
+
+
+class CdevEdgeSource(object):
+
+    def __init__(self, pins, chip='/dev/gpiochip0'):
+        self.pins = list(pins)
+        self.chip = chip
+        self.lines = {}
+        self.poll = None
+
+    def arm(self):
+        chipFd = os.open(self.chip, os.O_RDONLY)
+        try:
+            self.poll = select.poll()
+            for pin in self.pins:
+                request = bytearray(struct.pack('III32si', pin, GPIOHANDLE_REQUEST_INPUT,
+                    GPIOEVENT_REQUEST_FALLING_EDGE, b'zxscanner', 0))
+                fcntl.ioctl(chipFd, GPIO_GET_LINEEVENT_IOCTL, request)
+                lineFd = struct.unpack_from('i', request, 44)[0]
+                self.lines[lineFd] = pin
+                self.poll.register(lineFd, select.POLLIN)
+        except:
+            self.disarm()
+            raise
+        finally:
+            os.close(chipFd)
+
+    def wait(self, timeout=None):
+        ready = self.poll.poll(None if timeout is None else int(timeout * 1000))
+        if not ready:
+            return None
+        lineFd = ready[0][0]
+        # Line events are stamped with CLOCK_MONOTONIC (Linux 5.7 on)
+        timestamp = struct.unpack_from('Q', os.read(lineFd, GPIOEVENT_DATA_SIZE))[0]
+        return (self.lines[lineFd], timestamp)
+
+    def disarm(self):
+        for lineFd in self.lines:
+            os.close(lineFd)
+        self.lines = {}
+        self.poll = None
+
+
+class WiringPiEdgeSource(object):
+
+    def __init__(self, pins):
+        import wiringpi
+        self.event = threading.Event()
+        self.edge = None
+        self.armed = False
+        # wiringPiISR can't be undone, so the callbacks check self.armed
+        for pin in pins:
+            wiringpi.wiringPiISR(pin, wiringpi.INT_EDGE_FALLING, self.callback(pin))
+
+    def callback(self, pin):
+        def isr():
+            if self.armed and not self.event.is_set():
+                self.edge = (pin, time.monotonic_ns())
+                self.event.set()
+        return isr
+
+    def arm(self):
+        self.event.clear()
+        self.armed = True
+
+    def wait(self, timeout=None):
+        if not self.event.wait(timeout):
+            return None
+        return self.edge
+
+    def disarm(self):
+        self.armed = False
+
+
+class SimulatedEdgeSource(object):
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.edge = None
+        self.armed = False
+
+    # Call from another thread to pretend pin just went low
+    def trigger(self, pin=0):
+        if self.armed:
+            self.edge = (pin, time.monotonic_ns())
+            self.event.set()
+
+    def arm(self):
+        self.event.clear()
+        self.armed = True
+
+    def wait(self, timeout=None):
+        if not self.event.wait(timeout):
+            return None
+        return self.edge
+
+    def disarm(self):
+        self.armed = False
+
+
+# Character device events if the kernel has them, wiringPiISR otherwise
+def openEdgeSource(pins, chip='/dev/gpiochip0'):
+    if os.path.exists(chip):
+        return CdevEdgeSource(pins, chip)
+    return WiringPiEdgeSource(pins)
+
+
+class IdleMode(object):
+
+    # source:      one of the edge sources above
+    # quietFrames: frames with nothing pressed before going idle
+    # timeout:     longest to stay idle before taking another look anyway
+    # onWake:      called with (seconds idle, seconds from edge to waking)
+    def __init__(self, source, quietFrames=250, timeout=1.0, onWake=None):
+        self.source = source
+        self.quietFrames = quietFrames
+        self.timeout = timeout
+        self.onWake = onWake
+        self.idleStart = None
+        self.idleCount = 0
+        self.wakeCount = 0
+        self.idleTime = 0.0
+        self.idleCpu = 0.0
+        self.lastWakeLatency = 0.0
+        self.worstWakeLatency = 0.0
+
+    # Set every address line low and wait for a key
+    #
+    # Returns True when woken by an edge, False on timeout.
+    def sleep(self, lines):
+        start = time.monotonic()
+        startCpu = time.process_time()
+        if self.idleStart is None:
+            self.idleStart = start
+            self.idleCount += 1
+
+        self.source.arm()
+        lines.selectAll()
+        try:
+            # Something went down between the last scan and now
+            if lines.readRow():
+                self.idleStart = None
+                return True
+            edge = self.source.wait(self.timeout)
+        finally:
+            lines.releaseAll()
+            self.source.disarm()
+            self.idleTime += time.monotonic() - start
+            self.idleCpu += time.process_time() - startCpu
+
+        if edge is None:
+            return False
+
+        # How long from the edge until we're back scanning
+        self.wakeCount += 1
+        latency = (time.monotonic_ns() - edge[1]) / 1e9
+        if 0 <= latency < 1:
+            self.lastWakeLatency = latency
+            if latency > self.worstWakeLatency:
+                self.worstWakeLatency = latency
+        if self.onWake:
+            self.onWake(time.monotonic() - self.idleStart, self.lastWakeLatency)
+        self.idleStart = None
+        return True
+
+    # Fraction of a CPU used while idle
+    def cpuUse(self):
+        if not self.idleTime:
+            return 0.0
+        return self.idleCpu / self.idleTime
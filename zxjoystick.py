@@ -0,0 +1,147 @@
+#
+# ZX Raspberry Keyboard Scanner - joysticks
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Up to two Atari style joysticks (five switches to ground: up, down, left,
+# right and fire) on spare GPIOs, read by the scan thread in the same frame
+# as the matrix. Their switches ride along in the frame integer above the
+# matrices' keys, 5 bits a joystick, so they go through the same debouncer
+# and frame ring as the keys (but not the ghost key filter: each switch has
+# a pin of its own).
+#
+# Each joystick either is a gamepad, with a uinput device of its own
+# sending ABS_X, ABS_Y and BTN_SOUTH (which an emulator can treat as a
+# Kempston joystick), or stands in for Spectrum keys the way the joystick
+# interfaces did:
+#
+#   sinclair1   Interface 2 port 1: 6 left, 7 right, 8 down, 9 up, 0 fire
+#   sinclair2   Interface 2 port 2: 1 left, 2 right, 3 down, 4 up, 5 fire
+#   cursor      cursor (Protek, AGF): 5 left, 8 right, 6 down, 7 up, 0 fire
+#
+# or any five keys of the Spectrum keymap. A joystick on keys is folded into
+# the Spectrum's matrix straight after debouncing, so from there on it is
+# those keys being pressed: they go through the keymap of the mode the
+# scanner is in, the console and the emulator feed like any others.
+#
+
+import zxmatrix
+
+UP = 0
+DOWN = 1
+LEFT = 2
+RIGHT = 3
+FIRE = 4
+SWITCHES = 5
+SWITCH_MASK = (1 << SWITCHES) - 1
+MAX_JOYSTICKS = 2
+
+# Spectrum keys for each switch (up, down, left, right, fire)
+LAYOUTS = {
+    'sinclair1': ('9', '8', '6', '7', '0'),
+    'sinclair2': ('4', '3', '1', '2', '5'),
+    'cursor': ('7', '6', '5', '8', '0'),
+}
+GAMEPAD = 'gamepad'
+
+# Gamepad events, as python-uinput tuples
+EV_KEY = 0x01
+EV_ABS = 0x03
+ABS_X = (EV_ABS, 0x00)
+ABS_Y = (EV_ABS, 0x01)
+BTN_SOUTH = (EV_KEY, 0x130)
+
+# What a gamepad device is created with: both axes run -1 to 1
+GAMEPAD_EVENTS = [ABS_X + (-1, 1, 0, 0), ABS_Y + (-1, 1, 0, 0), BTN_SOUTH]
+
+
+# Key indexes for a joystick's keys setting, None for a gamepad
+#
+# keys: GAMEPAD, a LAYOUTS name or five key names from keyNames (the
+# flattened Spectrum keymap)
+def joystickKeys(keys, keyNames):
+    if keys == (GAMEPAD,):
+        return None
+    if len(keys) == 1 and keys[0] in LAYOUTS:
+        keys = LAYOUTS[keys[0]]
+    if len(keys) != SWITCHES:
+        raise ValueError('keys must be %s, %s or %d key names' % (GAMEPAD, ', '.join(sorted(LAYOUTS)), SWITCHES))
+    indexes = []
+    for name in keys:
+        if name not in keyNames:
+            raise ValueError('%r is not a key of the Spectrum keymap' % name)
+        indexes.append(keyNames.index(name))
+    return tuple(indexes)
+
+
+# Lookup table from a joystick's 5 switch bits to the keys it presses
+def keyTable(indexes):
+    return tuple(zxmatrix.keyMask(indexes[switch] for switch in range(SWITCHES) if (switches >> switch) & 1)
+        for switches in range(1 << SWITCHES))
+
+
+class Joysticks(object):
+
+    # lines: zxgpio switch lines for every joystick's switches, UP to FIRE,
+    #        one joystick after the other
+    # shift: bit of the frame integer the first joystick's UP goes in
+    # keys:  for each joystick, its key indexes (joystickKeys) or None
+    def __init__(self, lines, shift, keys):
+        self.lines = lines
+        self.shift = shift
+        self.count = len(keys)
+        # The switches' bits
+        self.mask = ((1 << (SWITCHES * self.count)) - 1) << shift
+        self.setKeys(keys)
+
+    # Change which joysticks stand in for which keys, from any thread
+    def setKeys(self, keys):
+        self.tables = tuple((self.shift + joystick * SWITCHES, keyTable(indexes))
+            for joystick, indexes in enumerate(keys) if indexes is not None)
+
+    # Every joystick's switches, in place in the frame integer
+    def read(self):
+        return self.lines.read() << self.shift
+
+    # Move joysticks on keys off their switches and onto their keys
+    def toKeys(self, matrix):
+        for offset, table in self.tables:
+            switches = (matrix >> offset) & SWITCH_MASK
+            if switches:
+                matrix = (matrix & ~(SWITCH_MASK << offset)) | table[switches]
+        return matrix
+
+
+class GamepadOutput(object):
+
+    # batches: for each joystick a zxoutput.EventBatch on its gamepad
+    #          device, or None for joysticks on keys
+    # shift:   as Joysticks
+    def __init__(self, batches, shift):
+        self.batches = batches
+        self.shift = shift
+        self.mask = ((1 << (SWITCHES * len(batches))) - 1) << shift
+        # Switches that have gone down
+        self.moves = 0
+
+    # Send what changed this frame; since is the frame's time, for the
+    # press to emit statistics
+    def update(self, matrix, changed, since=None):
+        if not changed & self.mask:
+            return
+        for joystick, batch in enumerate(self.batches):
+            offset = self.shift + joystick * SWITCHES
+            switched = (changed >> offset) & SWITCH_MASK
+            if batch is None or not switched:
+                continue
+            switches = (matrix >> offset) & SWITCH_MASK
+            self.moves += bin(switched & switches).count('1')
+            if switched & (1 << LEFT | 1 << RIGHT):
+                batch.move(ABS_X, ((switches >> RIGHT) & 1) - ((switches >> LEFT) & 1))
+            if switched & (1 << UP | 1 << DOWN):
+                batch.move(ABS_Y, ((switches >> DOWN) & 1) - ((switches >> UP) & 1))
+            if switched & (1 << FIRE):
+                if (switches >> FIRE) & 1:
+                    batch.press(BTN_SOUTH)
+                else:
+                    batch.release(BTN_SOUTH)
+            batch.flush(since)
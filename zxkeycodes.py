@@ -0,0 +1,262 @@
+#
+# ZX Raspberry Keyboard Scanner - key codes
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# The KEY_ events from linux/input-event-codes.h as (type, code) tuples,
+# the same values python-uinput uses, so keymaps can be compiled (and
+# recorded) on machines without uinput.
+#
+
+EV_KEY = 0x01
+
+KEY_ESC = (EV_KEY, 1)
+KEY_1 = (EV_KEY, 2)
+KEY_2 = (EV_KEY, 3)
+KEY_3 = (EV_KEY, 4)
+KEY_4 = (EV_KEY, 5)
+KEY_5 = (EV_KEY, 6)
+KEY_6 = (EV_KEY, 7)
+KEY_7 = (EV_KEY, 8)
+KEY_8 = (EV_KEY, 9)
+KEY_9 = (EV_KEY, 10)
+KEY_0 = (EV_KEY, 11)
+KEY_MINUS = (EV_KEY, 12)
+KEY_EQUAL = (EV_KEY, 13)
+KEY_BACKSPACE = (EV_KEY, 14)
+KEY_TAB = (EV_KEY, 15)
+KEY_Q = (EV_KEY, 16)
+KEY_W = (EV_KEY, 17)
+KEY_E = (EV_KEY, 18)
+KEY_R = (EV_KEY, 19)
+KEY_T = (EV_KEY, 20)
+KEY_Y = (EV_KEY, 21)
+KEY_U = (EV_KEY, 22)
+KEY_I = (EV_KEY, 23)
+KEY_O = (EV_KEY, 24)
+KEY_P = (EV_KEY, 25)
+KEY_LEFTBRACE = (EV_KEY, 26)
+KEY_RIGHTBRACE = (EV_KEY, 27)
+KEY_ENTER = (EV_KEY, 28)
+KEY_LEFTCTRL = (EV_KEY, 29)
+KEY_A = (EV_KEY, 30)
+KEY_S = (EV_KEY, 31)
+KEY_D = (EV_KEY, 32)
+KEY_F = (EV_KEY, 33)
+KEY_G = (EV_KEY, 34)
+KEY_H = (EV_KEY, 35)
+KEY_J = (EV_KEY, 36)
+KEY_K = (EV_KEY, 37)
+KEY_L = (EV_KEY, 38)
+KEY_SEMICOLON = (EV_KEY, 39)
+KEY_APOSTROPHE = (EV_KEY, 40)
+KEY_GRAVE = (EV_KEY, 41)
+KEY_LEFTSHIFT = (EV_KEY, 42)
+KEY_BACKSLASH = (EV_KEY, 43)
+KEY_Z = (EV_KEY, 44)
+KEY_X = (EV_KEY, 45)
+KEY_C = (EV_KEY, 46)
+KEY_V = (EV_KEY, 47)
+KEY_B = (EV_KEY, 48)
+KEY_N = (EV_KEY, 49)
+KEY_M = (EV_KEY, 50)
+KEY_COMMA = (EV_KEY, 51)
+KEY_DOT = (EV_KEY, 52)
+KEY_SLASH = (EV_KEY, 53)
+KEY_RIGHTSHIFT = (EV_KEY, 54)
+KEY_KPASTERISK = (EV_KEY, 55)
+KEY_LEFTALT = (EV_KEY, 56)
+KEY_SPACE = (EV_KEY, 57)
+KEY_CAPSLOCK = (EV_KEY, 58)
+KEY_F1 = (EV_KEY, 59)
+KEY_F2 = (EV_KEY, 60)
+KEY_F3 = (EV_KEY, 61)
+KEY_F4 = (EV_KEY, 62)
+KEY_F5 = (EV_KEY, 63)
+KEY_F6 = (EV_KEY, 64)
+KEY_F7 = (EV_KEY, 65)
+KEY_F8 = (EV_KEY, 66)
+KEY_F9 = (EV_KEY, 67)
+KEY_F10 = (EV_KEY, 68)
+KEY_NUMLOCK = (EV_KEY, 69)
+KEY_SCROLLLOCK = (EV_KEY, 70)
+KEY_KP7 = (EV_KEY, 71)
+KEY_KP8 = (EV_KEY, 72)
+KEY_KP9 = (EV_KEY, 73)
+KEY_KPMINUS = (EV_KEY, 74)
+KEY_KP4 = (EV_KEY, 75)
+KEY_KP5 = (EV_KEY, 76)
+KEY_KP6 = (EV_KEY, 77)
+KEY_KPPLUS = (EV_KEY, 78)
+KEY_KP1 = (EV_KEY, 79)
+KEY_KP2 = (EV_KEY, 80)
+KEY_KP3 = (EV_KEY, 81)
+KEY_KP0 = (EV_KEY, 82)
+KEY_KPDOT = (EV_KEY, 83)
+KEY_ZENKAKUHANKAKU = (EV_KEY, 85)
+KEY_102ND = (EV_KEY, 86)
+KEY_F11 = (EV_KEY, 87)
+KEY_F12 = (EV_KEY, 88)
+KEY_RO = (EV_KEY, 89)
+KEY_KATAKANA = (EV_KEY, 90)
+KEY_HIRAGANA = (EV_KEY, 91)
+KEY_HENKAN = (EV_KEY, 92)
+KEY_KATAKANAHIRAGANA = (EV_KEY, 93)
+KEY_MUHENKAN = (EV_KEY, 94)
+KEY_KPJPCOMMA = (EV_KEY, 95)
+KEY_KPENTER = (EV_KEY, 96)
+KEY_RIGHTCTRL = (EV_KEY, 97)
+KEY_KPSLASH = (EV_KEY, 98)
+KEY_SYSRQ = (EV_KEY, 99)
+KEY_RIGHTALT = (EV_KEY, 100)
+KEY_LINEFEED = (EV_KEY, 101)
+KEY_HOME = (EV_KEY, 102)
+KEY_UP = (EV_KEY, 103)
+KEY_PAGEUP = (EV_KEY, 104)
+KEY_LEFT = (EV_KEY, 105)
+KEY_RIGHT = (EV_KEY, 106)
+KEY_END = (EV_KEY, 107)
+KEY_DOWN = (EV_KEY, 108)
+KEY_PAGEDOWN = (EV_KEY, 109)
+KEY_INSERT = (EV_KEY, 110)
+KEY_DELETE = (EV_KEY, 111)
+KEY_MACRO = (EV_KEY, 112)
+KEY_MUTE = (EV_KEY, 113)
+KEY_VOLUMEDOWN = (EV_KEY, 114)
+KEY_VOLUMEUP = (EV_KEY, 115)
+KEY_POWER = (EV_KEY, 116)
+KEY_KPEQUAL = (EV_KEY, 117)
+KEY_KPPLUSMINUS = (EV_KEY, 118)
+KEY_PAUSE = (EV_KEY, 119)
+KEY_SCALE = (EV_KEY, 120)
+KEY_KPCOMMA = (EV_KEY, 121)
+KEY_HANGEUL = (EV_KEY, 122)
+KEY_HANGUEL = (EV_KEY, 122)
+KEY_HANJA = (EV_KEY, 123)
+KEY_YEN = (EV_KEY, 124)
+KEY_LEFTMETA = (EV_KEY, 125)
+KEY_RIGHTMETA = (EV_KEY, 126)
+KEY_COMPOSE = (EV_KEY, 127)
+KEY_STOP = (EV_KEY, 128)
+KEY_AGAIN = (EV_KEY, 129)
+KEY_PROPS = (EV_KEY, 130)
+KEY_UNDO = (EV_KEY, 131)
+KEY_FRONT = (EV_KEY, 132)
+KEY_COPY = (EV_KEY, 133)
+KEY_OPEN = (EV_KEY, 134)
+KEY_PASTE = (EV_KEY, 135)
+KEY_FIND = (EV_KEY, 136)
+KEY_CUT = (EV_KEY, 137)
+KEY_HELP = (EV_KEY, 138)
+KEY_MENU = (EV_KEY, 139)
+KEY_CALC = (EV_KEY, 140)
+KEY_SETUP = (EV_KEY, 141)
+KEY_SLEEP = (EV_KEY, 142)
+KEY_WAKEUP = (EV_KEY, 143)
+KEY_FILE = (EV_KEY, 144)
+KEY_SENDFILE = (EV_KEY, 145)
+KEY_DELETEFILE = (EV_KEY, 146)
+KEY_XFER = (EV_KEY, 147)
+KEY_PROG1 = (EV_KEY, 148)
+KEY_PROG2 = (EV_KEY, 149)
+KEY_WWW = (EV_KEY, 150)
+KEY_MSDOS = (EV_KEY, 151)
+KEY_COFFEE = (EV_KEY, 152)
+KEY_SCREENLOCK = (EV_KEY, 152)
+KEY_ROTATE_DISPLAY = (EV_KEY, 153)
+KEY_DIRECTION = (EV_KEY, 153)
+KEY_CYCLEWINDOWS = (EV_KEY, 154)
+KEY_MAIL = (EV_KEY, 155)
+KEY_BOOKMARKS = (EV_KEY, 156)
+KEY_COMPUTER = (EV_KEY, 157)
+KEY_BACK = (EV_KEY, 158)
+KEY_FORWARD = (EV_KEY, 159)
+KEY_CLOSECD = (EV_KEY, 160)
+KEY_EJECTCD = (EV_KEY, 161)
+KEY_EJECTCLOSECD = (EV_KEY, 162)
+KEY_NEXTSONG = (EV_KEY, 163)
+KEY_PLAYPAUSE = (EV_KEY, 164)
+KEY_PREVIOUSSONG = (EV_KEY, 165)
+KEY_STOPCD = (EV_KEY, 166)
+KEY_RECORD = (EV_KEY, 167)
+KEY_REWIND = (EV_KEY, 168)
+KEY_PHONE = (EV_KEY, 169)
+KEY_ISO = (EV_KEY, 170)
+KEY_CONFIG = (EV_KEY, 171)
+KEY_HOMEPAGE = (EV_KEY, 172)
+KEY_REFRESH = (EV_KEY, 173)
+KEY_EXIT = (EV_KEY, 174)
+KEY_MOVE = (EV_KEY, 175)
+KEY_EDIT = (EV_KEY, 176)
+KEY_SCROLLUP = (EV_KEY, 177)
+KEY_SCROLLDOWN = (EV_KEY, 178)
+KEY_KPLEFTPAREN = (EV_KEY, 179)
+KEY_KPRIGHTPAREN = (EV_KEY, 180)
+KEY_NEW = (EV_KEY, 181)
+KEY_REDO = (EV_KEY, 182)
+KEY_F13 = (EV_KEY, 183)
+KEY_F14 = (EV_KEY, 184)
+KEY_F15 = (EV_KEY, 185)
+KEY_F16 = (EV_KEY, 186)
+KEY_F17 = (EV_KEY, 187)
+KEY_F18 = (EV_KEY, 188)
+KEY_F19 = (EV_KEY, 189)
+KEY_F20 = (EV_KEY, 190)
+KEY_F21 = (EV_KEY, 191)
+KEY_F22 = (EV_KEY, 192)
+KEY_F23 = (EV_KEY, 193)
+KEY_F24 = (EV_KEY, 194)
+KEY_PLAYCD = (EV_KEY, 200)
+KEY_PAUSECD = (EV_KEY, 201)
+KEY_PROG3 = (EV_KEY, 202)
+KEY_PROG4 = (EV_KEY, 203)
+KEY_ALL_APPLICATIONS = (EV_KEY, 204)
+KEY_DASHBOARD = (EV_KEY, 204)
+KEY_SUSPEND = (EV_KEY, 205)
+KEY_CLOSE = (EV_KEY, 206)
+KEY_PLAY = (EV_KEY, 207)
+KEY_FASTFORWARD = (EV_KEY, 208)
+KEY_BASSBOOST = (EV_KEY, 209)
+KEY_PRINT = (EV_KEY, 210)
+KEY_HP = (EV_KEY, 211)
+KEY_CAMERA = (EV_KEY, 212)
+KEY_SOUND = (EV_KEY, 213)
+KEY_QUESTION = (EV_KEY, 214)
+KEY_EMAIL = (EV_KEY, 215)
+KEY_CHAT = (EV_KEY, 216)
+KEY_SEARCH = (EV_KEY, 217)
+KEY_CONNECT = (EV_KEY, 218)
+KEY_FINANCE = (EV_KEY, 219)
+KEY_SPORT = (EV_KEY, 220)
+KEY_SHOP = (EV_KEY, 221)
+KEY_ALTERASE = (EV_KEY, 222)
+KEY_CANCEL = (EV_KEY, 223)
+KEY_BRIGHTNESSDOWN = (EV_KEY, 224)
+KEY_BRIGHTNESSUP = (EV_KEY, 225)
+KEY_MEDIA = (EV_KEY, 226)
+KEY_SWITCHVIDEOMODE = (EV_KEY, 227)
+KEY_KBDILLUMTOGGLE = (EV_KEY, 228)
+KEY_KBDILLUMDOWN = (EV_KEY, 229)
+KEY_KBDILLUMUP = (EV_KEY, 230)
+KEY_SEND = (EV_KEY, 231)
+KEY_REPLY = (EV_KEY, 232)
+KEY_FORWARDMAIL = (EV_KEY, 233)
+KEY_SAVE = (EV_KEY, 234)
+KEY_DOCUMENTS = (EV_KEY, 235)
+KEY_BATTERY = (EV_KEY, 236)
+KEY_BLUETOOTH = (EV_KEY, 237)
+KEY_WLAN = (EV_KEY, 238)
+KEY_UWB = (EV_KEY, 239)
+KEY_UNKNOWN = (EV_KEY, 240)
+KEY_VIDEO_NEXT = (EV_KEY, 241)
+KEY_VIDEO_PREV = (EV_KEY, 242)
+KEY_BRIGHTNESS_CYCLE = (EV_KEY, 243)
+KEY_BRIGHTNESS_AUTO = (EV_KEY, 244)
+KEY_BRIGHTNESS_ZERO = (EV_KEY, 244)
+KEY_DISPLAY_OFF = (EV_KEY, 245)
+KEY_WWAN = (EV_KEY, 246)
+KEY_WIMAX = (EV_KEY, 246)
+KEY_RFKILL = (EV_KEY, 247)
+KEY_MICMUTE = (EV_KEY, 248)
+
+# Every key above once, in code order, for devices that can send any key
+KEYS = tuple(sorted(set(value for name, value in list(globals().items()) if name.startswith('KEY_'))))
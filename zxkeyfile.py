@@ -0,0 +1,491 @@
+#
+# ZX Raspberry Keyboard Scanner - keymap files
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# The keymaps and the GPIO wiring live in a text file for each scanner
+# (keymaps/zxscanner.keymap, keymaps/keyscanner.keymap) instead of in the
+# scripts:
+#
+#   # comments run to the end of the line
+#   wiring = magpi
+#
+#   [wiring magpi]
+#   dataLines = 26 19 13 6 5
+#   addressLines = 25 24 23 22 27 18 17 4
+#
+#   [keymap keys]
+#   1         2         3         4         5
+#   Q         W         E         R         T
+#   ...                                      8 rows of 5, one per address line
+#
+# A file can describe several wirings; the wiring line picks the one in
+# use. In a keymap each key is a key name (A, ENTER, LEFTSHIFT, ...), a
+# chord of them joined with + (LEFTSHIFT+Q) in tables the scanner takes
+# chords from, - for nothing, or one of the console mode markers shift,
+# symbol and extended.
+#
+# Other keyboards wired to spare GPIOs (a Spectrum+ extra keys membrane, a
+# keypad) are scanned along with the Spectrum's, each one a matrix with its
+# own pins and a keymap of the same name, a row per address line and a key
+# per data line:
+#
+#   [matrix keypad]
+#   dataLines = 8 9 10 11
+#   addressLines = 20 21 16 7
+#
+#   [keymap keypad]
+#   KP7       KP8       KP9       KPSLASH
+#   ...                                      4 rows of 4
+#
+# A matrix can share the Spectrum's data lines (it then takes steps of its
+# own in the scan) but no address line can be used twice. Matrices are
+# part of every wiring.
+#
+# Joysticks (up to two, see zxjoystick.py) are read along with the
+# matrices, each from five pins wired to ground through its switches:
+#
+#   [joystick 1]
+#   pins = 2 3 7 8 10       # up down left right fire
+#   keys = sinclair1        # or gamepad (the default), sinclair2, cursor,
+#                           # or five keys of [keymap keys]
+#
+# loadKeymaps() parses the file and compiles it with zxkeymap, so every
+# name is checked against the uinput device, and keeps the result in a
+# binary cache (marshal, in a __pycache__ directory beside the file). The
+# cache is used as long as the file's mtime and size match, or failing
+# that its SHA-1, and the device's capabilities haven't changed.
+#
+# KeymapWatcher watches the file (inotify on its directory, so editors
+# that save by writing a new file and renaming it work too) and loads it
+# again on a thread of its own whenever it changes, handing each new
+# Keymaps that loads to the scanner to swap in between frames. A file that
+# doesn't load is reported and the keymaps in use are kept.
+#
+
+import ctypes, ctypes.util, errno, hashlib, marshal, os, select, struct, threading, zxjoystick, zxkeymap
+
+# Kinds of table
+KEYS = 0     # one key name per key (zxkeymap.compileKeys)
+CHORDS = 1   # chords and console mode markers (zxkeymap.compileChords)
+
+MARKERS = ('shift', 'symbol', 'extended')
+UNMAPPED = '-'
+
+# Pins each wiring must give, and how many
+PINS = (('dataLines', zxkeymap.COLUMNS), ('addressLines', zxkeymap.ROWS))
+
+# The table joysticks' keys are looked up in
+JOYSTICK_TABLE = 'keys'
+
+CACHE_VERSION = 3
+
+
+class Keymaps(object):
+
+    # wiring:   name of the wiring in use, with its dataLines and addressLines
+    # matrices: (name, addressLines, dataLines) for each other matrix, in
+    #           the order they appear in the file
+    # joysticks: (name, pins, key indexes or None for a gamepad) for each
+    #           joystick, likewise
+    # names:    table name: flattened table (zxkeymap.flattenKeys), padded
+    #           to 8x5 for other matrices
+    # codes:    table name: compiled table
+    def __init__(self, path, digest, wiring, pins, matrices, joysticks, names, codes, cached=False):
+        self.path = path
+        self.digest = digest
+        self.wiring = wiring
+        self.dataLines = list(pins['dataLines'])
+        self.addressLines = list(pins['addressLines'])
+        self.matrices = [(name, list(addressLines), list(dataLines)) for name, addressLines, dataLines in matrices]
+        self.joysticks = [(name, list(pins), keys and tuple(keys)) for name, pins, keys in joysticks]
+        self.names = names
+        self.codes = codes
+        # Whether this came out of the cache
+        self.cached = cached
+
+    # The other matrices and joysticks, as far as taking them into use
+    # needs a restart (pins, and which joysticks are gamepads)
+    def devices(self):
+        return self.matrices, [(name, pins, keys is None) for name, pins, keys in self.joysticks]
+
+
+# One key of a keymap as the tables in the scripts used to have it
+def parseKey(token, kind):
+    if token == UNMAPPED:
+        return False
+    if token in MARKERS:
+        if kind != CHORDS:
+            raise ValueError('%r only goes in console keymaps' % token)
+        return token
+    names = tuple(token.split('+'))
+    if not all(names):
+        raise ValueError('Bad chord %r' % token)
+    if kind == KEYS:
+        if len(names) != 1:
+            raise ValueError('Chord %r in a keymap of single keys' % token)
+        return names[0]
+    return names
+
+
+# Parse a keymap file's text into (wiring name, pins, matrices, joysticks,
+# tables)
+#
+# tables: table name: KEYS or CHORDS, for every table the file must have;
+# they come back as 8x5 lists like the ones zxkeymap compiles, along with
+# a KEYS table for each matrix, padded out to 8x5 with nothing.
+def parseKeymaps(text, tables, path='keymap'):
+    wiring = None
+    wirings = {}
+    matrices = {}
+    order = []
+    joysticks = {}
+    joystickOrder = []
+    parsed = {}
+    section = None
+    for number, line in enumerate(text.splitlines(), 1):
+        where = '%s line %d' % (path, number)
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+
+        if line.startswith('['):
+            words = line.strip('[]').split()
+            if not line.endswith(']') or len(words) != 2 or words[0] not in ('wiring', 'matrix', 'joystick', 'keymap'):
+                raise ValueError('%s: expected [wiring name], [matrix name], [joystick name] or [keymap name]' % where)
+            kind, name = words
+            if kind == 'matrix' and name in tables:
+                raise ValueError('%s: matrix %r has the name of a keymap' % (where, name))
+            found = {'wiring': wirings, 'matrix': matrices, 'joystick': joysticks, 'keymap': parsed}[kind]
+            if name in found:
+                raise ValueError('%s: %s %r given twice' % (where, kind, name))
+            found[name] = [] if kind == 'keymap' else {}
+            if kind == 'matrix':
+                order.append(name)
+            elif kind == 'joystick':
+                joystickOrder.append(name)
+            section = (kind, name)
+            continue
+
+        if section is None or section[0] != 'keymap':
+            setting, equals, value = line.partition('=')
+            setting = setting.strip()
+            if not equals:
+                raise ValueError('%s: expected name = value' % where)
+            if section is None:
+                if setting != 'wiring':
+                    raise ValueError('%s: unknown setting %r' % (where, setting))
+                wiring = value.strip()
+                continue
+            if section[0] == 'joystick':
+                if setting == 'keys':
+                    joysticks[section[1]][setting] = tuple(value.split())
+                    continue
+                if setting != 'pins':
+                    raise ValueError('%s: unknown setting %r' % (where, setting))
+            elif setting not in dict(PINS):
+                raise ValueError('%s: unknown pins %r' % (where, setting))
+            found = {'wiring': wirings, 'matrix': matrices, 'joystick': joysticks}[section[0]]
+            try:
+                found[section[1]][setting] = tuple(int(pin) for pin in value.split())
+            except ValueError:
+                raise ValueError('%s: pins must be BCM numbers' % where)
+            continue
+
+        # Other matrices' keymaps are checked for shape once their pins are
+        # known
+        rows = parsed[section[1]]
+        tokens = line.split()
+        if section[1] in tables:
+            if len(rows) == zxkeymap.ROWS:
+                raise ValueError('%s: keymap %r has more than %d rows' % (where, section[1], zxkeymap.ROWS))
+            if len(tokens) != zxkeymap.COLUMNS:
+                raise ValueError('%s: a row needs %d keys' % (where, zxkeymap.COLUMNS))
+        try:
+            rows.append([parseKey(token, tables.get(section[1], KEYS)) for token in tokens])
+        except ValueError as e:
+            raise ValueError('%s: %s' % (where, e))
+
+    if wiring is None and len(wirings) == 1:
+        wiring = next(iter(wirings))
+    if wiring not in wirings:
+        raise ValueError('%s: wiring %r not described (have %s)' % (path, wiring, ', '.join(sorted(wirings)) or 'none'))
+    pins = wirings[wiring]
+    for name, count in PINS:
+        if len(pins.get(name, ())) != count:
+            raise ValueError('%s: wiring %r needs %d %s' % (path, wiring, count, name))
+    every = pins['dataLines'] + pins['addressLines']
+    if len(set(every)) != len(every):
+        raise ValueError('%s: wiring %r uses a pin twice' % (path, wiring))
+    for name in tables:
+        if name not in parsed:
+            raise ValueError('%s: no [keymap %s]' % (path, name))
+        if len(parsed[name]) != zxkeymap.ROWS:
+            raise ValueError('%s: keymap %r needs %d rows' % (path, name, zxkeymap.ROWS))
+
+    extras = []
+    addressLines = set(pins['addressLines'])
+    dataLines = set(pins['dataLines'])
+    for name in order:
+        matrix = matrices[name]
+        for setting, count in PINS:
+            if not 1 <= len(matrix.get(setting, ())) <= count:
+                raise ValueError('%s: matrix %r needs 1 to %d %s' % (path, name, count, setting))
+        if len(set(matrix['addressLines'])) != len(matrix['addressLines']) or len(set(matrix['dataLines'])) != len(matrix['dataLines']):
+            raise ValueError('%s: matrix %r uses a pin twice' % (path, name))
+        if addressLines & set(matrix['addressLines'] + matrix['dataLines']) or dataLines & set(matrix['addressLines']):
+            raise ValueError('%s: matrix %r uses another matrix\'s address line' % (path, name))
+        addressLines.update(matrix['addressLines'])
+        dataLines.update(matrix['dataLines'])
+        rows = parsed.get(name)
+        if rows is None:
+            raise ValueError('%s: no [keymap %s] for matrix %r' % (path, name, name))
+        if len(rows) != len(matrix['addressLines']) or any(len(row) != len(matrix['dataLines']) for row in rows):
+            raise ValueError('%s: keymap %r needs %d rows of %d keys' % (path, name, len(matrix['addressLines']), len(matrix['dataLines'])))
+        padding = [False] * zxkeymap.COLUMNS
+        parsed[name] = [(row + padding)[:zxkeymap.COLUMNS] for row in rows] + [padding] * (zxkeymap.ROWS - len(rows))
+        extras.append((name, matrix['addressLines'], matrix['dataLines']))
+    for name in parsed:
+        if name not in tables and name not in matrices:
+            raise ValueError('%s: unknown keymap %r (expected %s)' % (path, name, ', '.join(sorted(tables) + order)))
+
+    if len(joystickOrder) > zxjoystick.MAX_JOYSTICKS:
+        raise ValueError('%s: no more than %d joysticks' % (path, zxjoystick.MAX_JOYSTICKS))
+    sticks = []
+    used = addressLines | dataLines
+    for name in joystickOrder:
+        joystick = joysticks[name]
+        joystickPins = joystick.get('pins', ())
+        if len(joystickPins) != zxjoystick.SWITCHES:
+            raise ValueError('%s: joystick %r needs %d pins (up down left right fire)' % (path, name, zxjoystick.SWITCHES))
+        if len(set(joystickPins)) != len(joystickPins) or used & set(joystickPins):
+            raise ValueError('%s: joystick %r uses a pin twice, or one already in use' % (path, name))
+        used.update(joystickPins)
+        keys = joystick.get('keys', (zxjoystick.GAMEPAD,))
+        try:
+            keyNames = zxkeymap.flattenKeys(parsed[JOYSTICK_TABLE]) if JOYSTICK_TABLE in tables else ()
+            sticks.append((name, joystickPins, zxjoystick.joystickKeys(keys, keyNames)))
+        except ValueError as e:
+            raise ValueError('%s: joystick %r: %s' % (path, name, e))
+    return wiring, pins, extras, sticks, parsed
+
+
+# Compile parsed tables to (names, codes)
+#
+# Tables in parsed that aren't in tables are other matrices': KEYS tables,
+# checked against matrixCapabilities (their devices') if given.
+def compileTables(parsed, tables, capabilities, namespace, path='keymap', matrixCapabilities=None):
+    names = {}
+    codes = {}
+    for name in parsed:
+        kind = tables.get(name, KEYS)
+        compile = zxkeymap.compileKeys if kind == KEYS else zxkeymap.compileChords
+        if name not in tables and matrixCapabilities is not None:
+            allowed = matrixCapabilities
+        else:
+            allowed = capabilities
+        try:
+            names[name] = zxkeymap.flattenKeys(parsed[name])
+            codes[name] = compile(parsed[name], allowed, namespace)
+        except ValueError as e:
+            raise ValueError('%s: keymap %r: %s' % (path, name, e))
+    return names, codes
+
+
+def cachePath(path):
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, '__pycache__', name + '.zxc')
+
+
+# What else a cached keymap depends on: the tables asked for and what the
+# devices can send
+def specDigest(tables, capabilities, matrixCapabilities=None):
+    spec = repr((sorted(tables.items()), sorted(capabilities), matrixCapabilities and sorted(matrixCapabilities)))
+    return hashlib.sha1(spec.encode()).hexdigest()
+
+
+def readCache(path):
+    try:
+        with open(path, 'rb') as f:
+            entry = marshal.loads(f.read())
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(entry, tuple) or len(entry) != 11 or entry[0] != CACHE_VERSION:
+        return None
+    return entry
+
+
+# Write the cache next to the file, atomically; a read only filesystem
+# just means no cache
+def writeCache(path, entry):
+    temporary = '%s.%d' % (path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temporary, 'wb') as f:
+            f.write(marshal.dumps(entry))
+        os.replace(temporary, path)
+        return True
+    except OSError:
+        try:
+            os.unlink(temporary)
+        except OSError:
+            pass
+        return False
+
+
+# Load a keymap file, from its cache if it's up to date
+#
+# Raises ValueError if the file is wrong in any way and OSError if it
+# can't be read. matrixCapabilities is what other matrices' devices can
+# send, if not the same as the Spectrum keyboard's.
+def loadKeymaps(path, tables, capabilities, namespace, cache=True, matrixCapabilities=None):
+    status = os.stat(path)
+    spec = specDigest(tables, capabilities, matrixCapabilities)
+    cacheFile = cachePath(path)
+    entry = readCache(cacheFile) if cache else None
+    if entry and entry[4] == spec and entry[1:3] == (status.st_mtime_ns, status.st_size):
+        return Keymaps(path, entry[3], *entry[5:], cached=True)
+
+    with open(path, 'rb') as f:
+        source = f.read()
+    digest = hashlib.sha1(source).hexdigest()
+    if entry and entry[4] == spec and entry[3] == digest:
+        # Touched or copied but the same: just bring the cache up to date
+        entry = (CACHE_VERSION, status.st_mtime_ns, status.st_size) + entry[3:]
+        writeCache(cacheFile, entry)
+        return Keymaps(path, digest, *entry[5:], cached=True)
+
+    try:
+        text = source.decode('utf-8')
+    except UnicodeDecodeError:
+        raise ValueError('%s: not UTF-8 text' % path)
+    wiring, pins, matrices, joysticks, parsed = parseKeymaps(text, tables, path)
+    names, codes = compileTables(parsed, tables, capabilities, namespace, path, matrixCapabilities)
+    if cache:
+        writeCache(cacheFile, (CACHE_VERSION, status.st_mtime_ns, status.st_size, digest, spec, wiring, pins, matrices, joysticks, names, codes))
+    return Keymaps(path, digest, wiring, pins, matrices, joysticks, names, codes)
+
+
+# inotify, through libc
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+def openInotify(directory):
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        init = libc.inotify_init1
+        addWatch = libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    fd = init(IN_NONBLOCK | IN_CLOEXEC)
+    if fd < 0:
+        return None
+    if addWatch(fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+class KeymapWatcher(object):
+
+    # load:     load() returns a new Keymaps, raising ValueError or OSError
+    #           if the file won't do
+    # onChange: onChange(keymaps) with each one that loads (on the watcher's
+    #           thread)
+    # onError:  onError(error) with each one that doesn't
+    # settle:   seconds the file has to stay unchanged before loading it, so
+    #           a save in several writes is only loaded once
+    # poll:     seconds between looks at the file's mtime when there's no
+    #           inotify
+    def __init__(self, path, load, onChange, onError=None, settle=.05, poll=1.0):
+        self.path = os.path.abspath(path)
+        self.name = os.fsencode(os.path.basename(self.path))
+        self.load = load
+        self.onChange = onChange
+        self.onError = onError
+        self.settle = settle
+        self.poll = poll
+        self.reloads = 0
+        self.errors = 0
+        self.last = self.signature()
+        self.wakeRead, self.wakeWrite = os.pipe()
+        self.fd = openInotify(os.path.dirname(self.path))
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='keymaps')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def signature(self):
+        try:
+            status = os.stat(self.path)
+        except OSError:
+            return None
+        return (status.st_mtime_ns, status.st_size)
+
+    # Whether inotify has anything about our file, reading all it has
+    def touched(self):
+        touched = False
+        while True:
+            try:
+                data = os.read(self.fd, 4096)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return touched
+                raise
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if name == self.name:
+                    touched = True
+
+    # Wait up to timeout seconds for the file to change, False when closed
+    def wait(self, timeout):
+        sources = [self.wakeRead] + ([self.fd] if self.fd is not None else [])
+        ready = select.select(sources, [], [], timeout)[0]
+        if self.wakeRead in ready or not self.running:
+            return False
+        return self.fd in ready and self.touched()
+
+    def run(self):
+        while self.running:
+            if self.fd is not None:
+                if not self.wait(None):
+                    continue
+                # Let a save finish
+                while self.running and self.wait(self.settle):
+                    pass
+            else:
+                self.wait(self.poll)
+                signature = self.signature()
+                if signature == self.last:
+                    continue
+                self.last = signature
+            if self.running:
+                self.reload()
+
+    def reload(self):
+        try:
+            keymaps = self.load()
+        except (ValueError, OSError) as e:
+            self.errors += 1
+            if self.onError:
+                self.onError(e)
+            return
+        self.reloads += 1
+        self.onChange(keymaps)
+
+    def close(self):
+        self.running = False
+        os.write(self.wakeWrite, b'x')
+        self.thread.join(1)
+        if self.fd is not None:
+            os.close(self.fd)
+        os.close(self.wakeRead)
+        os.close(self.wakeWrite)
@@ -0,0 +1,63 @@
+#
+# ZX Raspberry Keyboard Scanner - keymap compilation
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# The keymaps are written as 8x5 tables of key names, one list per address
+# line. The scan loop wants uinput events, so the tables are resolved once
+# at startup into flat tuples indexed by addressLine * 5 + dataLine.
+#
+# Every name is checked against the list of events the uinput device was
+# created with. A typo or a key the device can't send fails here rather
+# than the first time someone presses it.
+#
+
+ROWS = 8
+COLUMNS = 5
+
+
+def keyIndex(addressLine, dataLine):
+    return addressLine * COLUMNS + dataLine
+
+
+# Turn one key name into its uinput event
+#
+# namespace is where the KEY_ constants live (normally the uinput module)
+# and capabilities the events the device was created with.
+def resolveKey(name, capabilities, namespace):
+    event = getattr(namespace, 'KEY_' + name, None)
+    if event is None:
+        raise ValueError('Unknown key name %r' % name)
+    if event not in capabilities:
+        raise ValueError('Key %r is not in the device capability list' % name)
+    return event
+
+
+# Flatten an 8x5 table into a tuple, checking its shape on the way
+def flattenKeys(table):
+    if len(table) != ROWS or any(len(row) != COLUMNS for row in table):
+        raise ValueError('Keymap must be %d rows of %d keys' % (ROWS, COLUMNS))
+    return tuple(key for row in table for key in row)
+
+
+# Compile a table of single key names (keys, funcKeys)
+#
+# Unmapped keys (False) never send anything and become None.
+def compileKeys(table, capabilities, namespace):
+    capabilities = set(capabilities)
+    return tuple(None if name is False else resolveKey(name, capabilities, namespace) for name in flattenKeys(table))
+
+
+# Compile a table of chords (normalKeys, shiftKeys, symbolKeys, extendedKeys)
+#
+# Each entry becomes a tuple of events pressed in order and released in
+# reverse. Unmapped keys (False) and the mode markers ('shift', 'symbol',
+# 'extended') never send anything and become None.
+def compileChords(table, capabilities, namespace):
+    capabilities = set(capabilities)
+    compiled = []
+    for chord in flattenKeys(table):
+        if isinstance(chord, tuple):
+            compiled.append(tuple(resolveKey(name, capabilities, namespace) for name in chord))
+        else:
+            compiled.append(None)
+    return tuple(compiled)
@@ -0,0 +1,141 @@
+#
+# ZX Raspberry Keyboard Scanner - logging
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# print() in the scan loop writes straight to stdout, which under systemd
+# is a pipe to journald; when the journal falls behind, print() blocks and
+# so does the keyboard. Logger calls only fill in a slot of a ring
+# allocated up front (the time, the level, the format string and its
+# arguments); a background thread does the formatting and the writing.
+#
+# If the writer can't keep up the ring fills and new records are dropped
+# (and counted) rather than anyone waiting. Any thread can log: filling a
+# slot is done under a lock that is never held for longer than that, and
+# each slot carries the sequence number it was written with so the writer
+# never picks up a half written record.
+#
+# With nothing to write the writer sleeps until a record comes in, so an
+# idle scanner isn't woken by it. The first record after that wakes it up
+# (setting an Event: a lock and maybe a futex call); it then gives more
+# records interval seconds to pile up and writes them in one go, unless a
+# warning or worse cuts the wait short. Records logged while it's awake
+# only fill in their slot.
+#
+# Below the logger's level debug() and friends are swapped for a function
+# that does nothing, so per key debug logging costs one call when it's off.
+#
+
+import sys, threading, time
+from array import array
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARNING', ERROR: 'ERROR'}
+
+
+def ignore(*args):
+    pass
+
+
+class Logger(object):
+
+    # level:    records below this are ignored
+    # size:     records the ring holds
+    # out:      file the writer thread writes to
+    # interval: seconds the writer waits for more records once woken
+    #           (warnings are written straight away)
+    def __init__(self, level=INFO, size=1024, out=None, interval=.05):
+        self.size = size
+        self.out = out or sys.stdout
+        self.interval = interval
+        self.times = array('d', [0.0] * size)
+        self.levels = array('B', [0] * size)
+        self.formats = [None] * size
+        self.args = [None] * size
+        self.sequences = array('q', [-1] * size)
+        self.lock = threading.Lock()
+        self.head = 0
+        self.written = 0
+        self.dropped = 0
+        self.setLevel(level)
+        self.wake = threading.Event()
+        self.hurry = threading.Event()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='log')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def setLevel(self, level):
+        self.level = level
+        for name, value in (('debug', DEBUG), ('info', INFO), ('warning', WARNING), ('error', ERROR)):
+            if value >= level:
+                setattr(self, name, lambda format, *args, value=value: self.record(value, format, args))
+            else:
+                setattr(self, name, ignore)
+
+    def record(self, level, format, args):
+        with self.lock:
+            sequence = self.head
+            if sequence - self.written >= self.size:
+                self.dropped += 1
+                return
+            slot = sequence % self.size
+            self.times[slot] = time.time()
+            self.levels[slot] = level
+            self.formats[slot] = format
+            self.args[slot] = args
+            self.sequences[slot] = sequence
+            self.head = sequence + 1
+        if level >= WARNING:
+            self.hurry.set()
+            self.wake.set()
+        elif not self.wake.is_set():
+            self.wake.set()
+
+    def run(self):
+        while True:
+            lines = []
+            while True:
+                slot = self.written % self.size
+                if self.sequences[slot] != self.written:
+                    break
+                lines.append(self.format(slot))
+                self.formats[slot] = self.args[slot] = None
+                self.written += 1
+            if lines:
+                try:
+                    self.out.write(''.join(lines))
+                    self.out.flush()
+                except (OSError, ValueError):
+                    pass
+            elif not self.running:
+                return
+            else:
+                # Clear before looking again, so a record logged in between
+                # either is seen now or sets the Event again
+                self.wake.clear()
+                if self.sequences[self.written % self.size] == self.written or not self.running:
+                    continue
+                self.wake.wait()
+                self.hurry.wait(self.interval)
+                self.hurry.clear()
+
+    def format(self, slot):
+        stamp = self.times[slot]
+        message = self.formats[slot]
+        if self.args[slot]:
+            try:
+                message = message % self.args[slot]
+            except (TypeError, ValueError) as e:
+                message = '%r %r (%s)' % (message, self.args[slot], e)
+        return '%s.%03d %s %s\n' % (time.strftime('%H:%M:%S', time.localtime(stamp)), int(stamp * 1000) % 1000,
+            LEVEL_NAMES.get(self.levels[slot], self.levels[slot]), message)
+
+    # Write out everything logged so far and stop the writer
+    def close(self):
+        self.running = False
+        self.hurry.set()
+        self.wake.set()
+        self.thread.join()
@@ -0,0 +1,307 @@
+#
+# ZX Raspberry Keyboard Scanner - macros
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Types a script of keys through the uinput device, for long BASIC lines
+# and tape loading incantations. Scripts are text, with anything in braces
+# a chord of Spectrum keys or a pause:
+#
+#   10 PRINT "HELLO"{ENTER}     typed character by character
+#   {J}{SS+P}{SS+P}{ENTER}      LOAD "" with the 48K's keyword entry
+#   {CS+SPACE}{pause 0.5}       BREAK, then half a second's wait
+#
+# Key names are the ones in the keymaps' Spectrum layout (A, ENTER, SPACE,
+# 1...) plus CS and SS for caps and symbol shift; {{ types a {. A script
+# compiles, once, to a tuple of steps: chords of key indexes (as zxmatrix
+# numbers them) and pauses in seconds. Which character needs which chord,
+# and which uinput events a chord of Spectrum keys comes out as, depends on
+# who's reading, so there are two of each:
+#
+#   spectrumCharacters()  the Spectrum's own legends, for FUSE: capitals
+#   spectrumRenderer()    with caps shift, " with symbol shift + P and so
+#                         on, sent as the Spectrum keymap's keys
+#   consoleCharacters()   what keyscanner's console keymaps type, read with
+#   consoleRenderer()     a US layout, sent as their chords
+#
+# renderMacro() turns the steps into uinput chords, also once, so a script
+# that can't be typed fails at startup.
+#
+# MacroPlayer then plays steps on the scan loop's clock, a chord at a time.
+# Nothing tells us when the reader has taken a key in, so each chord is
+# held for hold seconds and followed by gap seconds with nothing down: an
+# emulated Spectrum only looks at its keyboard once a frame, so it needs a
+# frame or two of each, while the console takes a chord pressed and
+# released in one report. The Spectrum ROM also takes a key that comes back
+# within 5 frames of going up for the same key still held, so the same key
+# twice in a row (the two Ps of "") gets repeatGap seconds in between
+# instead. Chords list their shifts first, so their last key is the one
+# that counts. Beyond those minimums the pace is the scan loop's: one step
+# per pass of the loop at most, and none while it has real key presses
+# waiting.
+#
+
+import re, time
+
+# The Spectrum's symbol shift characters, laid out as the keymaps (None for
+# keywords and keys with none)
+SYMBOLS = [
+    ['!', '@', '#', '$', '%'],
+    [None, None, None, '<', '>'],
+    [None, None, None, None, None],
+    ['_', ')', '(', "'", '&'],
+    ['"', ';', None, None, None],
+    [None, ':', u'\xa3', '?', '/'],
+    [None, '=', '+', '-', '^'],
+    [None, None, '.', ',', '*'],
+]
+
+# Characters a key types on a US layout, without and with shift
+US_CHARACTERS = {
+    'SPACE': (' ', ' '), 'ENTER': ('\n', '\n'), 'TAB': ('\t', None),
+    'MINUS': ('-', '_'), 'EQUAL': ('=', '+'), 'LEFTBRACE': ('[', '{'), 'RIGHTBRACE': (']', '}'),
+    'SEMICOLON': (';', ':'), 'APOSTROPHE': ("'", '"'), 'GRAVE': ('`', '~'), 'BACKSLASH': ('\\', '|'),
+    'COMMA': (',', '<'), 'DOT': ('.', '>'), 'SLASH': ('/', '?'),
+}
+US_CHARACTERS.update((digit, (digit, shifted)) for digit, shifted in zip('1234567890', '!@#$%^&*()'))
+US_CHARACTERS.update((letter, (letter.lower(), letter)) for letter in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+
+PAUSE = re.compile(r'pause\s+([0-9.]+)$', re.I)
+
+
+# Character to chord for typing into an emulated Spectrum
+#
+# keyNames: the flattened Spectrum keymap (zxkeymap.flattenKeys(keys))
+def spectrumCharacters(keyNames, shiftIndex, symbolIndex):
+    characters = {}
+    for index, name in enumerate(keyNames):
+        if name in US_CHARACTERS and index not in (shiftIndex, symbolIndex):
+            plain, shifted = US_CHARACTERS[name]
+            characters.setdefault(plain, (index,))
+            if name.isalpha() and len(name) == 1:
+                characters.setdefault(shifted, (shiftIndex, index))
+    for index, symbol in enumerate(key for row in SYMBOLS for key in row):
+        if symbol:
+            characters.setdefault(symbol, (symbolIndex, index))
+    return characters
+
+
+# Character to chord for typing into the console
+#
+# layers: the flattened normalKeys, shiftKeys and symbolKeys tables
+def consoleCharacters(layers, shiftIndex, symbolIndex):
+    characters = {}
+    for layer, names in enumerate(layers):
+        for index, chord in enumerate(names):
+            if not isinstance(chord, tuple):
+                continue
+            if len(chord) == 1 and chord[0] in US_CHARACTERS:
+                character = US_CHARACTERS[chord[0]][0]
+            elif len(chord) == 2 and chord[0] == 'LEFTSHIFT' and chord[1] in US_CHARACTERS:
+                character = US_CHARACTERS[chord[1]][1]
+            else:
+                continue
+            if character:
+                characters.setdefault(character, ((), (shiftIndex,), (symbolIndex,))[layer] + (index,))
+    return characters
+
+
+# Turn a script into steps: tuples of key indexes, and pauses in seconds
+#
+# keyIndexes maps key names (for braces) to indexes.
+def compileMacro(script, characters, keyIndexes):
+    steps = []
+    position = 0
+    while position < len(script):
+        character = script[position]
+        if character == '{' and script.startswith('{{', position):
+            character = '{'
+            position += 1
+        elif character == '{':
+            end = script.find('}', position)
+            if end < 0:
+                raise ValueError('Unclosed { at %d in macro %r' % (position, script))
+            token = script[position + 1:end].strip()
+            position = end + 1
+            pause = PAUSE.match(token)
+            if pause:
+                steps.append(float(pause.group(1)))
+                continue
+            chord = []
+            for name in token.upper().split('+'):
+                name = name.strip()
+                if name not in keyIndexes:
+                    raise ValueError('Unknown key %r in macro %r' % (name, script))
+                chord.append(keyIndexes[name])
+            steps.append(tuple(chord))
+            continue
+        if character not in characters:
+            raise ValueError('No key types %r in macro %r' % (character, script))
+        steps.append(characters[character])
+        position += 1
+    return tuple(steps)
+
+
+# Key names for compileMacro's braces
+def keyIndexNames(keyNames, shiftIndex, symbolIndex):
+    names = dict((name.upper(), index) for index, name in enumerate(keyNames))
+    names.update(CS=shiftIndex, SS=symbolIndex)
+    return names
+
+
+# Macros bound to keys (key name: macro name) by key index, and the key
+# names keyIndexes has nothing for
+def bindKeys(bindings, keyIndexes):
+    bound = {}
+    unknown = []
+    for key, name in bindings.items():
+        if key.upper() in keyIndexes:
+            bound[keyIndexes[key.upper()]] = name
+        else:
+            unknown.append(key)
+    return bound, sorted(unknown)
+
+
+# Chords of Spectrum keys as the Spectrum keymap's events (keyCodes)
+def spectrumRenderer(keyCodes):
+    def render(chord):
+        events = tuple(keyCodes[index] for index in chord)
+        if None in events:
+            raise ValueError('The keymap has nothing for keys %r' % (chord,))
+        return events
+    return render
+
+
+# Chords of Spectrum keys as the console keymaps' chords: caps shift or
+# symbol shift pick the layer and the one other key the chord in it
+#
+# layers: compiled normalKeys, shiftKeys and symbolKeys
+def consoleRenderer(layers, shiftIndex, symbolIndex):
+    def render(chord):
+        keys = [index for index in chord if index not in (shiftIndex, symbolIndex)]
+        shift = shiftIndex in chord
+        symbol = symbolIndex in chord
+        if len(keys) != 1 or (shift and symbol):
+            raise ValueError('The console has no chord for keys %r' % (chord,))
+        events = layers[2 if symbol else 1 if shift else 0][keys[0]]
+        if not events:
+            raise ValueError('The console has no chord for keys %r' % (chord,))
+        return events
+    return render
+
+
+# Steps with every chord turned into a tuple of uinput events
+def renderMacro(steps, render):
+    return tuple(step if isinstance(step, float) else render(step) for step in steps)
+
+
+class MacroPlayer(object):
+
+    # batch: zxoutput.EventBatch the chords go out through
+    # hold:  seconds each chord is held down (0 = pressed and released in
+    #        one report)
+    # gap:   seconds with nothing down between chords
+    # repeatGap: seconds with nothing down before the same key again
+    def __init__(self, batch, hold=.04, gap=.04, repeatGap=.12, clock=time.monotonic):
+        self.batch = batch
+        self.hold = hold
+        self.gap = gap
+        self.repeatGap = repeatGap
+        self.clock = clock
+        self.steps = ()
+        self.next = 0
+        self.playHold = hold
+        self.playGap = gap
+        self.playRepeatGap = repeatGap
+        self.held = None
+        # The last key typed and when it went up
+        self.lastKey = None
+        self.released = 0.0
+        self.due = None
+        self.started = 0.0
+        # Chords typed by the last (or current) macro and how long it took
+        self.typed = 0
+        self.elapsed = 0.0
+
+    def playing(self):
+        return self.due is not None
+
+    # Start typing steps from renderMacro, with this player's hold and gaps
+    # unless given others
+    def play(self, steps, hold=None, gap=None, repeatGap=None, now=None):
+        self.stop()
+        now = self.clock() if now is None else now
+        self.steps = steps
+        self.next = 0
+        self.playHold = self.hold if hold is None else hold
+        self.playGap = self.gap if gap is None else gap
+        self.playRepeatGap = self.repeatGap if repeatGap is None else repeatGap
+        self.lastKey = None
+        self.typed = 0
+        self.started = now
+        self.due = now
+
+    # Let go of anything held and forget the rest
+    def stop(self):
+        if self.held:
+            for event in reversed(self.held):
+                self.batch.release(event)
+            self.batch.flush()
+            self.held = None
+        self.due = None
+
+    # Seconds until the next step is due (0 = now), None if not playing
+    def timeout(self, now=None):
+        if self.due is None:
+            return None
+        now = self.clock() if now is None else now
+        return max(0.0, self.due - now)
+
+    # Take at most one step if it's due; False once the macro has finished
+    def poll(self, now=None):
+        if self.due is None:
+            return False
+        now = self.clock() if now is None else now
+        if now < self.due:
+            return True
+        batch = self.batch
+
+        if self.held:
+            for event in reversed(self.held):
+                batch.release(event)
+            batch.flush()
+            self.held = None
+            self.released = now
+            self.due = now + self.playGap
+            return True
+
+        if self.next >= len(self.steps):
+            self.due = None
+            self.elapsed = now - self.started
+            return False
+        step = self.steps[self.next]
+        if isinstance(step, float):
+            self.next += 1
+            self.due = now + step
+            return True
+
+        # The same key again has to wait until the reader has let go of it
+        events = step
+        if events[-1] == self.lastKey and now < self.released + self.playRepeatGap:
+            self.due = self.released + self.playRepeatGap
+            return True
+
+        self.next += 1
+        self.typed += 1
+        self.lastKey = events[-1]
+        if self.playHold:
+            for event in events:
+                batch.press(event)
+            batch.flush()
+            self.held = events
+            self.due = now + self.playHold
+        else:
+            batch.tap(events)
+            batch.flush()
+            self.released = now
+            self.due = now + self.playGap
+        return True
@@ -0,0 +1,94 @@
+#
+# ZX Raspberry Keyboard Scanner - matrix state
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# The whole 8x5 matrix is held as one 40 bit integer. Bit
+# addressLine * 5 + dataLine is set while that key is down, so the keys
+# that changed between two scans are just previous ^ current and the loop
+# only has to look at those.
+#
+
+ROWS = 8
+COLUMNS = 5
+KEYS = ROWS * COLUMNS
+# The first (the Spectrum's) matrix's bits when several are scanned together
+MASK = (1 << KEYS) - 1
+
+
+# Scan every address line and return the matrix as a 40 bit integer
+#
+# lines is one of the zxgpio line objects, settle (if given) is called
+# between selecting an address line and reading the data lines.
+def scanMatrix(lines, settle=None):
+    matrix = 0
+    for addressLine in range(ROWS):
+        lines.selectRow(addressLine)
+        if settle:
+            settle()
+        matrix |= lines.readRow() << (addressLine * COLUMNS)
+        lines.releaseRow(addressLine)
+    return matrix
+
+
+# Scan a group of matrices (zxgpio.GpioMemMatrices or WiringPiMatrices) and
+# return them as one integer, 40 bits a matrix
+def scanMatrices(lines, settle=None):
+    matrix = 0
+    for step in range(len(lines.steps)):
+        lines.selectRow(step)
+        if settle:
+            settle()
+        matrix |= lines.readRow()
+        lines.releaseRow(step)
+    return matrix
+
+
+# Key indexes of the bits set in mask, lowest first
+def keyIndexes(mask):
+    while mask:
+        lowest = mask & -mask
+        yield lowest.bit_length() - 1
+        mask ^= lowest
+
+
+# Mask with the bits for the given key indexes set
+def keyMask(indexes):
+    mask = 0
+    for keyIndex in indexes:
+        mask |= 1 << keyIndex
+    return mask
+
+
+# Debounce the whole matrix at once
+#
+# Keeps the last few raw scans. A key counts as pressed once it has read
+# down in each of the last `press` scans and as released once it has read
+# up in each of the last `release` scans; anything in between keeps its
+# previous state. All 40 keys are worked out together with a handful of
+# ANDs and ORs per scan.
+class Debouncer(object):
+
+    def __init__(self, press=2, release=5):
+        if press < 1 or release < 1:
+            raise ValueError('Debounce thresholds must be at least one scan')
+        self.press = press
+        self.release = release
+        self.history = [0] * max(press, release)
+        self.state = 0
+
+    # Feed in a raw scan, get the debounced matrix back
+    def update(self, raw):
+        history = self.history
+        history.pop()
+        history.insert(0, raw)
+
+        # Indexes rather than slices, so a scan allocates no lists
+        allDown = raw
+        for age in range(1, self.press):
+            allDown &= history[age]
+        anyDown = raw
+        for age in range(1, self.release):
+            anyDown |= history[age]
+
+        self.state = (self.state | allDown) & anyDown
+        return self.state
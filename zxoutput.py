@@ -0,0 +1,113 @@
+#
+# ZX Raspberry Keyboard Scanner - uinput output
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# device.emit() in python-uinput writes the event and then a SYN_REPORT,
+# two write()s for every key going up or down. EventBatch collects every
+# key event from one scan (or one console chord) and sends them followed
+# by a single SYN_REPORT, so the emulator sees them as one report.
+#
+# Given the uinput file descriptor the whole batch goes out as a single
+# write() of packed input_event structs; otherwise each event is emitted
+# with syn=False and one syn() at the end.
+#
+# Events are (type, code) tuples, so the same batch carries a gamepad's
+# axes (move()) as well as keys.
+#
+# The device can also be created with EV_REP so the kernel autorepeats
+# held keys; setRepeat() changes the delay and period (0 turns it off).
+#
+
+import fcntl, os, struct, time
+
+EV_SYN = 0x00
+EV_REP = 0x14
+SYN_REPORT = 0
+REP_DELAY = 0
+REP_PERIOD = 1
+
+# _IOW('U', 100, int)
+UI_SET_EVBIT = 0x40045564
+
+# struct input_event: struct timeval, __u16 type, __u16 code, __s32 value
+INPUT_EVENT = struct.Struct('llHHi')
+
+SYN_EVENT = INPUT_EVENT.pack(0, 0, EV_SYN, SYN_REPORT, 0)
+
+
+# Create the uinput device, keeping its file descriptor if python-uinput
+# will hand it over (returns device, fd or device, None). repeat turns on
+# kernel autorepeat, which needs the file descriptor. name is the device's
+# name (python-uinput's default if None).
+def openDevice(uinput, events, repeat=False, name=None):
+    named = {'name': name} if name else {}
+    if hasattr(uinput, 'fdopen'):
+        fd = uinput.fdopen()
+        if repeat:
+            fcntl.ioctl(fd, UI_SET_EVBIT, EV_REP)
+        return uinput.Device(events, fd=fd, **named), fd
+    return uinput.Device(events, **named), None
+
+
+class EventBatch(object):
+
+    # stats: zxstats.ScanStats to time each flush into, or None
+    def __init__(self, device, fd=None, stats=None):
+        self.device = device
+        self.fd = fd
+        self.stats = stats
+        self.events = []
+        self.reports = 0
+        self.writes = 0
+
+    def press(self, event):
+        self.events.append((event, 1))
+
+    def release(self, event):
+        self.events.append((event, 0))
+
+    # Press a chord in order and release it in reverse
+    def tap(self, chord):
+        for event in chord:
+            self.events.append((event, 1))
+        for event in reversed(chord):
+            self.events.append((event, 0))
+
+    # Set an absolute axis (a gamepad's ABS_X, say) to value
+    def move(self, event, value):
+        self.events.append((event, value))
+
+    # Kernel autorepeat timing in seconds, sent with the next flush (only
+    # for devices opened with repeat and a file descriptor)
+    def setRepeat(self, delay, period):
+        self.events.append(((EV_REP, REP_DELAY), int(delay * 1000)))
+        self.events.append(((EV_REP, REP_PERIOD), int(period * 1000)))
+
+    # Send everything collected so far with one SYN_REPORT
+    #
+    # since is when the scan that caused them happened (time.monotonic),
+    # for the press to emit statistics
+    def flush(self, since=None):
+        events = self.events
+        if not events:
+            return
+        if self.stats:
+            start = time.monotonic()
+        if self.fd is not None:
+            packed = [INPUT_EVENT.pack(0, 0, event[0], event[1], value) for event, value in events]
+            packed.append(SYN_EVENT)
+            os.write(self.fd, b''.join(packed))
+            self.writes += 1
+        else:
+            emit = self.device.emit
+            for event, value in events:
+                emit(event, value, syn=False)
+            self.device.syn()
+            self.writes += len(events) + 1
+        self.reports += 1
+        del events[:]
+        if self.stats:
+            end = time.monotonic()
+            self.stats.emitTime.add(end - start)
+            if since is not None:
+                self.stats.pressToEmit.add(end - since)
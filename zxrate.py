@@ -0,0 +1,75 @@
+#
+# ZX Raspberry Keyboard Scanner - adaptive scan rate
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Scanning at 1kHz all the time wastes CPU on a keyboard nobody is typing
+# on; scanning slowly all the time makes fast typists wait. AdaptiveRate
+# moves the FrameScheduler between a ladder of rates, fastest first:
+#
+#   - the moment a scan sees any key down (or the mode button held) it
+#     jumps to the fastest rate
+#   - after quietTime seconds at a rate with nothing down it drops to the
+#     next rate on the ladder, and so on down to the slowest
+#
+# Going up takes one frame and coming down takes quietTime at every step,
+# so a key being typed every so often can't make the rate bounce up and
+# down each time. Time is counted in scheduler periods rather than read
+# from the clock, and the time spent at each rate is kept in dwell.
+#
+
+import collections
+
+
+# Halve from fast until we reach slow
+def rateLadder(fast, slow):
+    rates = [fast]
+    while rates[-1] / 2.0 > slow:
+        rates.append(rates[-1] / 2.0)
+    if slow < fast:
+        rates.append(slow)
+    return rates
+
+
+class AdaptiveRate(object):
+
+    # scheduler: zxscheduler.FrameScheduler whose rate this sets
+    # rates:     scans a second, fastest first (see rateLadder)
+    # quietTime: seconds with nothing down before stepping down a rate
+    def __init__(self, scheduler, rates, quietTime=.1):
+        self.scheduler = scheduler
+        self.rates = tuple(rates)
+        self.quietTime = quietTime
+        self.level = 0
+        self.quiet = 0.0
+        self.dwell = collections.OrderedDict((rate, 0.0) for rate in self.rates)
+        self.changes = 0
+        scheduler.setRate(self.rates[0])
+
+    @property
+    def rate(self):
+        return self.rates[self.level]
+
+    # Call once a frame with whether anything was down in it
+    def update(self, active):
+        period = self.scheduler.period
+        self.dwell[self.rates[self.level]] += period
+        if active:
+            self.quiet = 0.0
+            if self.level:
+                self.setLevel(0)
+        else:
+            self.quiet += period
+            if self.quiet >= self.quietTime and self.level < len(self.rates) - 1:
+                self.quiet = 0.0
+                self.setLevel(self.level + 1)
+
+    # Straight back to the fastest rate (on waking from idle)
+    def wake(self):
+        self.quiet = 0.0
+        if self.level:
+            self.setLevel(0)
+
+    def setLevel(self, level):
+        self.level = level
+        self.changes += 1
+        self.scheduler.setRate(self.rates[level])
@@ -0,0 +1,123 @@
+#
+# ZX Raspberry Keyboard Scanner - low jitter mode
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# On a single core Pi Zero the scanner shares the CPU with FUSE and
+# EmulationStation, and Python's cyclic garbage collector can stop every
+# thread for milliseconds while it walks the heap. RealtimeMode takes those
+# pauses away, as far as the system allows:
+#
+#   schedule()    SCHED_FIFO (or SCHED_RR) priority and CPU affinity for the
+#                 calling thread. They're set with SCHED_RESET_ON_FORK, so
+#                 nothing it starts afterwards inherits them: not processes
+#                 (killall, mpg123) and not threads either. A thread that
+#                 should run at real-time priority too (the scan thread)
+#                 calls scheduleThread() itself.
+#   lockMemory()  mlockall() so nothing the scanner touches is ever paged
+#                 out and faulted back in mid scan
+#   freezeHeap()  collect once, gc.freeze() everything built during startup
+#                 so later collections never look at it, then turn the
+#                 collector off (or just raise its thresholds); and shorten
+#                 the interval after which a thread waiting for the GIL
+#                 asks for it, which is 5ms to start with
+#
+# Turning the collector off is safe because the steady state loops don't
+# build reference cycles: everything they allocate is freed by reference
+# counting as soon as it's done with. Anything that can't be applied (no
+# permission, not Linux) is skipped and noted; report() says which is which.
+#
+# Under SCHED_FIFO the scanner runs whenever it wants to, which is fine as
+# long as it keeps sleeping between frames; the kernel's real-time
+# throttling (sched_rt_runtime_us) leaves everything else 5% even if not.
+#
+
+import ctypes, gc, os, sys
+
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+
+POLICIES = {'fifo': 'SCHED_FIFO', 'rr': 'SCHED_RR'}
+
+
+class RealtimeMode(object):
+
+    # priority:    real-time priority, 1-99 (None = leave the scheduler alone)
+    # policy:      'fifo' or 'rr'
+    # cpus:        CPUs to run on, e.g. {0} (None = any)
+    # gcThreshold: gc.set_threshold() arguments to use once the heap is
+    #              frozen (None = turn the collector off)
+    # switchInterval: seconds for sys.setswitchinterval (None = leave it)
+    def __init__(self, priority=50, policy='fifo', cpus=None, gcThreshold=None, switchInterval=.0005):
+        if policy not in POLICIES:
+            raise ValueError('Unknown scheduling policy %r' % policy)
+        self.priority = priority
+        self.policy = policy
+        self.cpus = cpus
+        self.gcThreshold = gcThreshold
+        self.switchInterval = switchInterval
+        self.applied = []
+        self.skipped = []
+
+    def schedule(self):
+        for setting, error in self.scheduleThread():
+            if error is None:
+                self.applied.append(setting)
+            else:
+                self.skipped.append('%s (%s)' % (setting, error))
+
+    # Priority and CPUs for the calling thread, as (setting, error or None)
+    # for each
+    def scheduleThread(self):
+        results = []
+        if self.priority is not None:
+            name = POLICIES[self.policy]
+            setting = '%s priority %d' % (name, self.priority)
+            try:
+                policy = getattr(os, name) | getattr(os, 'SCHED_RESET_ON_FORK', 0)
+                os.sched_setscheduler(0, policy, os.sched_param(self.priority))
+                results.append((setting, None))
+            except (AttributeError, OSError) as e:
+                results.append((setting, e))
+        if self.cpus is not None:
+            setting = 'CPUs %s' % ','.join(str(cpu) for cpu in sorted(self.cpus))
+            try:
+                os.sched_setaffinity(0, self.cpus)
+                results.append((setting, None))
+            except (AttributeError, OSError) as e:
+                results.append((setting, e))
+        return results
+
+    def lockMemory(self):
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            if libc.mlockall(MCL_CURRENT | MCL_FUTURE) == 0:
+                self.applied.append('memory locked')
+                return
+            error = os.strerror(ctypes.get_errno())
+        except (AttributeError, OSError) as e:
+            error = e
+        self.skipped.append('mlockall (%s)' % error)
+
+    # Call once startup is over, just before the steady state loop
+    def freezeHeap(self):
+        gc.collect()
+        if hasattr(gc, 'freeze'):
+            gc.freeze()
+            self.applied.append('%d objects frozen' % gc.get_freeze_count())
+        else:
+            self.skipped.append('gc.freeze (needs Python 3.7)')
+        if self.gcThreshold is None:
+            gc.disable()
+            self.applied.append('GC off')
+        else:
+            gc.set_threshold(*self.gcThreshold)
+            self.applied.append('GC thresholds %s' % ', '.join(str(t) for t in self.gcThreshold))
+        if self.switchInterval is not None:
+            sys.setswitchinterval(self.switchInterval)
+            self.applied.append('GIL switch interval %gms' % (self.switchInterval * 1000))
+
+    def report(self):
+        report = 'Low jitter mode: ' + (', '.join(self.applied) or 'nothing applied')
+        if self.skipped:
+            report += '; unable to apply ' + ', '.join(self.skipped)
+        return report
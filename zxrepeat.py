@@ -0,0 +1,132 @@
+#
+# ZX Raspberry Keyboard Scanner - console autorepeat
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Console mode repeats the key being held. There are two ways of doing it:
+#
+#   kernel  the uinput device is created with EV_REP (see zxoutput), the
+#           key is held down and the input layer repeats it at REP_DELAY /
+#           REP_PERIOD. Only used for single keys.
+#   wheel   chords (shift + key and the like) are tapped again from here.
+#           Autorepeat keeps its deadlines on a timer wheel driven by the
+#           monotonic clock, and the scan loop polls it once per frame.
+#
+# Each repeat is due a fixed period after the last one was due rather than
+# after it actually went out, so a late frame doesn't push every repeat
+# after it back, and repeats missed altogether are skipped.
+#
+
+import math, time
+
+
+class TimerWheel(object):
+
+    # tick:  seconds per slot (how late a timer may fire)
+    # slots: slots in one turn of the wheel, longer delays go round again
+    def __init__(self, tick=.005, slots=256, clock=time.monotonic):
+        self.tick = tick
+        self.slots = [[] for slot in range(slots)]
+        self.clock = clock
+        self.current = int(clock() / tick)
+        self.count = 0
+
+    # item comes out of expire() delay seconds from now; returns the timer
+    def schedule(self, delay, item, now=None):
+        if now is None:
+            now = self.clock()
+        due = now + delay
+        tick = max(int(math.ceil(due / self.tick)), self.current)
+        timer = [tick, due, item]
+        self.slots[tick % len(self.slots)].append(timer)
+        self.count += 1
+        return timer
+
+    def cancel(self, timer):
+        slot = self.slots[timer[0] % len(self.slots)]
+        if timer in slot:
+            slot.remove(timer)
+            self.count -= 1
+
+    # Everything that's due, as a list of (due, item) oldest first
+    def expire(self, now=None):
+        if now is None:
+            now = self.clock()
+        end = int(now / self.tick)
+        expired = []
+        if self.count:
+            # Every slot is visited at most once however long it's been
+            slots = len(self.slots)
+            for tick in range(self.current, min(end, self.current + slots - 1) + 1):
+                slot = self.slots[tick % slots]
+                if slot:
+                    expired += [timer for timer in slot if timer[0] <= end]
+                    slot[:] = [timer for timer in slot if timer[0] > end]
+            self.count -= len(expired)
+            expired.sort()
+        if end >= self.current:
+            self.current = end + 1
+        return [(timer[1], timer[2]) for timer in expired]
+
+    # When the next timer will fire, None if there aren't any
+    def nextDue(self):
+        if not self.count:
+            return None
+        return min(timer[0] for slot in self.slots for timer in slot) * self.tick
+
+
+class Autorepeat(object):
+
+    # delay:  seconds from the key going down to the first repeat
+    # period: seconds between repeats after that
+    def __init__(self, delay=.7, period=.2, tick=.005, clock=time.monotonic):
+        self.delay = delay
+        self.period = period
+        self.clock = clock
+        self.wheel = TimerWheel(tick, clock=clock)
+        self.timer = None
+        self.key = None
+        self.repeats = 0
+        self.lastLateness = 0.0
+        self.worstLateness = 0.0
+
+    # key has just been typed, start repeating it
+    def start(self, key, now=None):
+        self.stop()
+        self.key = key
+        self.timer = self.wheel.schedule(self.delay, key, now)
+
+    def stop(self):
+        if self.timer:
+            self.wheel.cancel(self.timer)
+            self.timer = None
+        self.key = None
+
+    # Once a frame: the key if it's time to type it again, otherwise None
+    def poll(self, now=None):
+        if self.timer is None:
+            return None
+        if now is None:
+            now = self.clock()
+        expired = self.wheel.expire(now)
+        if not expired:
+            return None
+        due, key = expired[-1]
+
+        lateness = now - due
+        self.lastLateness = lateness
+        if lateness > self.worstLateness:
+            self.worstLateness = lateness
+        self.repeats += 1
+
+        missed = int(lateness / self.period)
+        self.timer = self.wheel.schedule(due + (missed + 1) * self.period - now, key, now)
+        return key
+
+    # Seconds until the next repeat, None if nothing is repeating
+    def timeout(self, now=None):
+        due = self.wheel.nextDue()
+        if due is None:
+            return None
+        if now is None:
+            now = self.clock()
+        return max(0.0, due - now)
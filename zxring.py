@@ -0,0 +1,70 @@
+#
+# ZX Raspberry Keyboard Scanner - frame ring buffer
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Hands scanned frames from the scan thread to the thread that turns them
+# into key events. One thread pushes, one thread pops; the slots are
+# allocated up front and neither side ever takes a lock. The writer fills
+# a slot before moving head on, the reader reads a slot before moving tail
+# on, so each only ever touches slots the other has finished with.
+#
+# When the ring is full the push is refused and counted as an overflow.
+# highWater is the most frames that have ever been waiting at once.
+#
+# Matrices wider than 64 bits (several keyboards scanned together) don't
+# fit an array, so a wide ring keeps them in lists instead.
+#
+
+import threading
+from array import array
+
+
+class FrameRing(object):
+
+    def __init__(self, size=256, wide=False):
+        self.size = size
+        self.times = array('d', [0.0] * size)
+        if wide:
+            self.matrices = [0] * size
+            self.changes = [0] * size
+        else:
+            self.matrices = array('Q', [0] * size)
+            self.changes = array('Q', [0] * size)
+        self.buttons = array('B', [0] * size)
+        self.head = 0
+        self.tail = 0
+        self.overflows = 0
+        self.highWater = 0
+        self.ready = threading.Event()
+
+    # Scan thread: add a frame, False if there was no room for it
+    def push(self, frameTime, matrix, changed, button):
+        waiting = self.head - self.tail
+        if waiting >= self.size:
+            self.overflows += 1
+            return False
+        slot = self.head % self.size
+        self.times[slot] = frameTime
+        self.matrices[slot] = matrix
+        self.changes[slot] = changed
+        self.buttons[slot] = button
+        self.head += 1
+        if waiting >= self.highWater:
+            self.highWater = waiting + 1
+        self.ready.set()
+        return True
+
+    # Consumer: the oldest frame as (time, matrix, changed, button), waiting
+    # up to timeout seconds (None = forever) for one; None if there isn't one
+    def pop(self, timeout=None):
+        if self.tail == self.head:
+            self.ready.clear()
+            if self.tail == self.head and not self.ready.wait(timeout):
+                return None
+        slot = self.tail % self.size
+        frame = (self.times[slot], self.matrices[slot], self.changes[slot], self.buttons[slot])
+        self.tail += 1
+        return frame
+
+    def __len__(self):
+        return self.head - self.tail
@@ -0,0 +1,131 @@
+#
+# ZX Raspberry Keyboard Scanner - ghost keys
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# The Spectrum membrane has no diode on each key, so three keys down on the
+# corners of a rectangle in the 8x5 matrix connect the fourth corner's
+# address and data lines and it reads as down too. Worse, once that
+# happens a scan can't tell which of the four are really down: any three
+# (or all four) read the same.
+#
+# With no diodes a scan always reads complete rectangles: take every row
+# and column joined by keys that are down, and every key where one of those
+# rows crosses one of those columns reads as down. So the keys that can't
+# be trusted are exactly the ones whose row has two or more keys down in
+# columns that also have two or more rows down. RolloverFilter finds them
+# with a couple of passes over the eight 5 bit rows, whatever is pressed:
+#
+#   once   columns down in at least one row
+#   twice  columns down in at least two rows
+#
+# and then, for each row, the keys it has in twice if there are two or
+# more of them.
+#
+# What happens to those keys is up to the policy, which the scanners set
+# per keymap:
+#
+#   PASS      nothing, everything read is passed on
+#   FLAG      everything is passed on; ambiguous keys are counted
+#   SUPPRESS  ambiguous keys that were already down stay down, new ones are
+#             held back until the rectangle is broken
+#
+# maxRollover is the most keys that have been down at once with nothing
+# ambiguous among them. With several matrices scanned together (40 bits
+# each, see zxgpio.GpioMemMatrices) each one is looked at on its own.
+#
+
+PASS = 0
+FLAG = 1
+SUPPRESS = 2
+POLICY_NAMES = {PASS: 'pass', FLAG: 'flag', SUPPRESS: 'suppress'}
+
+ROWS = 8
+COLUMNS = 5
+KEYS = ROWS * COLUMNS
+ROW_MASK = (1 << COLUMNS) - 1
+MATRIX_MASK = (1 << KEYS) - 1
+
+
+# Keys that are part of a rectangle of keys read as down
+def ambiguousKeys(matrix):
+    # Two keys or fewer can't make a rectangle (most scans stop here)
+    fewer = matrix & (matrix - 1)
+    if not fewer & (fewer - 1):
+        return 0
+    if matrix >> KEYS:
+        ambiguous = 0
+        for offset in range(0, matrix.bit_length(), KEYS):
+            ambiguous |= ambiguousKeys((matrix >> offset) & MATRIX_MASK) << offset
+        return ambiguous
+    once = twice = 0
+    rows = matrix
+    for row in range(ROWS):
+        keys = rows & ROW_MASK
+        twice |= once & keys
+        once |= keys
+        rows >>= COLUMNS
+    if not twice & (twice - 1):
+        return 0
+    ambiguous = 0
+    rows = matrix
+    for shift in range(0, ROWS * COLUMNS, COLUMNS):
+        shared = rows & twice
+        if shared & (shared - 1):
+            ambiguous |= shared << shift
+        rows >>= COLUMNS
+    return ambiguous
+
+
+class RolloverFilter(object):
+
+    def __init__(self, policy=SUPPRESS):
+        self.policy = policy
+        self.last = None
+        self.filtered = 0
+        # Ambiguous keys in the last scan, and the ones of those held back
+        self.ambiguous = 0
+        self.held = 0
+        # Times a rectangle has formed, and keys held back because of one
+        self.rectangles = 0
+        self.suppressed = 0
+        # Ambiguous keys of the last rectangle to form, kept after it's
+        # broken for whoever logs it
+        self.rectangle = 0
+        self.maxRollover = 0
+
+    # Change policy (the scan thread picks it up on its next scan)
+    def setPolicy(self, policy):
+        self.policy = policy
+        self.last = None
+
+    # Feed in a raw scan, get back what to pass on
+    #
+    # Only does any work when the scan differs from the last one.
+    def update(self, raw):
+        if raw != self.last:
+            self.last = raw
+            self.filtered = self.resolve(raw)
+        return self.filtered
+
+    def resolve(self, raw):
+        if self.policy == PASS:
+            self.ambiguous = self.held = 0
+            return raw
+        ambiguous = ambiguousKeys(raw)
+        if not ambiguous:
+            self.ambiguous = self.held = 0
+            keys = bin(raw).count('1')
+            if keys > self.maxRollover:
+                self.maxRollover = keys
+            return raw
+
+        if not self.ambiguous:
+            self.rectangle = ambiguous
+            self.rectangles += 1
+        self.ambiguous = ambiguous
+        if self.policy != SUPPRESS:
+            return raw
+        held = ambiguous & ~self.filtered
+        self.suppressed += bin(held & ~self.held).count('1')
+        self.held = held
+        return raw & ~held
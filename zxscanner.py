@@ -4,184 +4,468 @@
 # MIT License (https://opensource.org/licenses/MIT) see LICENSE
 #
 
-import time, sys, wiringpi, uinput, os
+import sys, os, zxhardware, zxkeycodes, zxkeymap, zxmatrix, zxscheduler, zxidle, zxengine, zxoutput, zxfeedback, zxaudio, zxbutton, zxstats, zxlog, zxrealtime, zxshm, zxrate, zxrollover, zxmacro, zxkeyfile, zxjoystick
 
-#
-# MagPi Article Mappings
-#
-
-# KB1 (BCOM GPIO pins)
-dataLines = [26,19,13,6,5]
-
-# KB1 (BCOM GPIO pins)
-addressLines = [25,24,23,22,27,18,17,4]
-
-#
-# Original Mappings
-#
-
-# KB1 (BCOM GPIO pins)
-#dataLines = [17,27,22,18,23]
-
-# KB1 (BCOM GPIO pins)
-#addressLines = [5,6,13,19,26,16,20,21]
-
-# The ZX Spectrum Keyboard Matrix (Mapped to modern keyboard )
-keys = [
-	['1','2','3','4','5'],
-	['Q','W','E','R','T'],
-	['A','S','D','F','G'],
-	['0','9','8','7','6'],
-	['P','O','I','U','Y'],
-	['LEFTSHIFT','Z','X','C','V'],
-	['ENTER','L','K','J','H'],
-	['SPACE','LEFTCTRL','M','N','B']
-]
-
-# Function key mode
-funcKeys = [
-	['F1','F2','F3','F4','LEFT'],
-	['Q','W','E','R','T'],
-	['A','S','D','F','G'],
-	['ESC','9','RIGHT','UP','DOWN'],
-	['P','O','I','U','Y'],
-	['LEFTSHIFT','Z','X','C','V'],
-	['ENTER','L','K','J','H'],
-	['SPACE','LEFTCTRL','M','N','B']
-]
-
-# Track keypresses so we can support multiple keys
-keyTrack = [
-	[False, False, False, False, False],
-	[False, False, False, False, False],
-	[False, False, False, False, False],
-	[False, False, False, False, False],
-	[False, False, False, False, False],
-	[False, False, False, False, False],
-	[False, False, False, False, False],
-	[False, False, False, False, False]
-]
+# Keymaps and GPIO wiring (see zxkeyfile.py), relative to this script
+keymapFile = 'keymaps/zxscanner.keymap'
+watchKeymaps = True  # pick up changes to the keymaps without restarting
 
 # Keyboard mode and reset button
-buttonPressed = -1
 buttonGPIO = 12
-buttonTime = 0
 
 # 0 = Spectrum, 1 = Function Keys
 keyboardMode = 0
 
+# Scan timing
+scanRate = 1000      # full matrix scans per second while the keyboard is in use
+slowScanRate = 250   # scans per second once nothing has been pressed for a while (scanRate = never slow down)
+rateQuietTime = 0.1  # seconds with nothing pressed before halving the rate, down to slowScanRate
+rowSettle = 10e-6    # seconds between setting an address line low and reading it
+idleFrames = 250     # scans with nothing pressed before waiting for a key (0 = never)
+debouncePress = 2    # scans a key must read down before it counts as pressed
+debounceRelease = 5  # scans a key must read up before it counts as released
+# What to do with keys that might be ghosts, for each keyboardMode (Spectrum, Function Keys):
+# zxrollover.SUPPRESS, FLAG (pass them on and log them) or PASS (see zxrollover.py)
+ghostPolicies = [zxrollover.SUPPRESS, zxrollover.SUPPRESS]
+statsSocket = zxstats.socketPath(__file__)  # where zxstats.py can ask for timings and counts (None = nowhere)
+logLevel = zxlog.INFO         # zxlog.DEBUG to log every key press and release
+matrixExport = None           # file to publish the matrix to for emulators, e.g. zxshm.PATH (see zxshm.py)
+
+# Macros (see zxmacro.py for the script syntax)
+macros = {
+	'load': '{J}{SS+P}{SS+P}{ENTER}',  # LOAD ""
+}
+macroHold = 0.04       # seconds each key of a macro is held (FUSE looks at the keyboard once a frame)
+macroGap = 0.04        # seconds with nothing down between keys
+macroRepeatGap = 0.12  # seconds with nothing down before the same key again (the ROM needs it up for 5 frames)
+gestureMacros = {}     # button gesture: macro, e.g. {zxbutton.DOUBLE_TAP: 'load'} (makes taps wait to see if they're double)
+functionMacros = {}    # Spectrum key: macro to type when it's pressed in Function Keys mode, e.g. {'J': 'load'}
+
+# Low jitter mode (see zxrealtime.py)
+lowJitter = False      # real-time priority, locked memory and no garbage collector pauses
+realtimePriority = 50  # SCHED_FIFO priority for the scan loops (1-99)
+realtimeCpus = None    # CPUs to keep the scanner on, e.g. {0} (None = any)
+
 # Local path
 myDir = os.path.dirname(os.path.realpath(__file__));
 
+# Messages are written out by a thread of their own so a slow journal can't
+# hold up the scan loop
+log = zxlog.Logger(logLevel)
+
+# GPIO and the uinput device, or a simulation of them (see zxhardware.py)
+hardware = zxhardware.openBackend()
+
 # Well this is annoying
-device = uinput.Device([
-        uinput.KEY_A, uinput.KEY_B, uinput.KEY_C, uinput.KEY_D, uinput.KEY_E, uinput.KEY_F, uinput.KEY_G, uinput.KEY_H,
-        uinput.KEY_I, uinput.KEY_J, uinput.KEY_K, uinput.KEY_L, uinput.KEY_M, uinput.KEY_N, uinput.KEY_O, uinput.KEY_P,
-		uinput.KEY_Q, uinput.KEY_R, uinput.KEY_S, uinput.KEY_T, uinput.KEY_U, uinput.KEY_V, uinput.KEY_W, uinput.KEY_X,
-        uinput.KEY_Y, uinput.KEY_Z, uinput.KEY_0, uinput.KEY_1, uinput.KEY_2, uinput.KEY_3, uinput.KEY_4, uinput.KEY_5,
-        uinput.KEY_6, uinput.KEY_7, uinput.KEY_8, uinput.KEY_9,
-        uinput.KEY_LEFTSHIFT, uinput.KEY_ENTER, uinput.KEY_SPACE, uinput.KEY_LEFTCTRL,
-        uinput.KEY_F1, uinput.KEY_F2, uinput.KEY_F3, uinput.KEY_F4, uinput.KEY_F5,
-        uinput.KEY_UP, uinput.KEY_DOWN, uinput.KEY_LEFT, uinput.KEY_RIGHT,
-        uinput.KEY_ESC
-        ])
+deviceEvents = [
+        zxkeycodes.KEY_A, zxkeycodes.KEY_B, zxkeycodes.KEY_C, zxkeycodes.KEY_D, zxkeycodes.KEY_E, zxkeycodes.KEY_F, zxkeycodes.KEY_G, zxkeycodes.KEY_H,
+        zxkeycodes.KEY_I, zxkeycodes.KEY_J, zxkeycodes.KEY_K, zxkeycodes.KEY_L, zxkeycodes.KEY_M, zxkeycodes.KEY_N, zxkeycodes.KEY_O, zxkeycodes.KEY_P,
+		zxkeycodes.KEY_Q, zxkeycodes.KEY_R, zxkeycodes.KEY_S, zxkeycodes.KEY_T, zxkeycodes.KEY_U, zxkeycodes.KEY_V, zxkeycodes.KEY_W, zxkeycodes.KEY_X,
+        zxkeycodes.KEY_Y, zxkeycodes.KEY_Z, zxkeycodes.KEY_0, zxkeycodes.KEY_1, zxkeycodes.KEY_2, zxkeycodes.KEY_3, zxkeycodes.KEY_4, zxkeycodes.KEY_5,
+        zxkeycodes.KEY_6, zxkeycodes.KEY_7, zxkeycodes.KEY_8, zxkeycodes.KEY_9,
+        zxkeycodes.KEY_LEFTSHIFT, zxkeycodes.KEY_ENTER, zxkeycodes.KEY_SPACE, zxkeycodes.KEY_LEFTCTRL,
+        zxkeycodes.KEY_F1, zxkeycodes.KEY_F2, zxkeycodes.KEY_F3, zxkeycodes.KEY_F4, zxkeycodes.KEY_F5,
+        zxkeycodes.KEY_UP, zxkeycodes.KEY_DOWN, zxkeycodes.KEY_LEFT, zxkeycodes.KEY_RIGHT,
+        zxkeycodes.KEY_ESC
+        ]
+device, deviceFd = hardware.openDevice(deviceEvents)
+
+# Timings and counts for zxstats.py
+stats = zxstats.ScanStats()
+
+# Key events for a whole scan go out together with one sync
+batch = zxoutput.EventBatch(device, deviceFd, stats)
+
+# Keymaps and wiring from the keymap file, resolved to uinput events
+# indexed by addressLine * 5 + dataLine (or straight from its cache)
+keymapPath = os.path.join(myDir, keymapFile)
+keymapTables = {'keys': zxkeyfile.KEYS, 'funcKeys': zxkeyfile.KEYS}
+
+def loadKeymaps():
+	return zxkeyfile.loadKeymaps(keymapPath, keymapTables, deviceEvents, zxkeycodes, matrixCapabilities=zxkeycodes.KEYS)
+
+keymaps = loadKeymaps()
+dataLines = keymaps.dataLines
+addressLines = keymaps.addressLines
+
+# Other keyboards in the keymap file ([matrix name]), scanned along with
+# the Spectrum's, each sending its keys through a uinput device of its own
+extraMatrices = keymaps.matrices
+extraBatches = []
+for matrixName, matrixAddressLines, matrixDataLines in extraMatrices:
+	extraDevice, extraDeviceFd = hardware.openDevice(zxkeycodes.KEYS, name='ZX %s' % matrixName)
+	extraBatches.append(zxoutput.EventBatch(extraDevice, extraDeviceFd, stats))
+extraMask = ((1 << (zxmatrix.KEYS * len(extraMatrices))) - 1) << zxmatrix.KEYS
+
+# Joysticks in the keymap file ([joystick name]), read with every scan, their
+# switches following on from the matrices' keys. Those that aren't on
+# Spectrum keys get a gamepad device each.
+joystickPins = [pin for joystickName, switchPins, joystickKeys in keymaps.joysticks for pin in switchPins]
+joystickShift = zxmatrix.KEYS * (1 + len(extraMatrices))
+gamepadBatches = []
+for joystickName, switchPins, joystickKeys in keymaps.joysticks:
+	if joystickKeys is None:
+		gamepadDevice, gamepadDeviceFd = hardware.openDevice(zxjoystick.GAMEPAD_EVENTS, name='ZX joystick %s' % joystickName)
+		gamepadBatches.append(zxoutput.EventBatch(gamepadDevice, gamepadDeviceFd, stats))
+	else:
+		gamepadBatches.append(None)
+gamepads = zxjoystick.GamepadOutput(gamepadBatches, joystickShift)
+
+# Caps shift and symbol shift
+shiftIndex = zxkeymap.keyIndex(5, 0)
+symbolIndex = zxkeymap.keyIndex(7, 1)
+
+# Take a set of keymaps into use, compiling the macros against them so a
+# bad one shows up now
+def useKeymaps(new):
+	global keymaps, keyNames, keyCodes, funcKeyNames, funcKeyCodes, extraNames, extraCodes, macroSteps, functionMacroKeys
+	keymaps = new
+	keyNames = new.names['keys']
+	keyCodes = new.codes['keys']
+	funcKeyNames = new.names['funcKeys']
+	funcKeyCodes = new.codes['funcKeys']
+
+	# Other matrices' keys, 40 a matrix, following on from the Spectrum's
+	extraNames = sum((new.names[matrixName] for matrixName, matrixAddressLines, matrixDataLines in extraMatrices), ())
+	extraCodes = sum((new.codes[matrixName] for matrixName, matrixAddressLines, matrixDataLines in extraMatrices), ())
+
+	macroCharacters = zxmacro.spectrumCharacters(keyNames, shiftIndex, symbolIndex)
+	macroKeyIndexes = zxmacro.keyIndexNames(keyNames, shiftIndex, symbolIndex)
+	macroRenderer = zxmacro.spectrumRenderer(keyCodes)
+	macroSteps = {}
+	for macroName, script in macros.items():
+		try:
+			macroSteps[macroName] = zxmacro.renderMacro(zxmacro.compileMacro(script, macroCharacters, macroKeyIndexes), macroRenderer)
+		except ValueError as e:
+			log.warning('Macro %s: %s', macroName, e)
+
+	# Function Keys mode keys that type macros instead, by key index
+	functionMacroKeys, unknownKeys = zxmacro.bindKeys(functionMacros, macroKeyIndexes)
+	for key in unknownKeys:
+		log.warning('Function macro %s: the keymap has no key %s', functionMacros[key], key)
+
+useKeymaps(keymaps)
+
+# Load the keymap file again whenever it changes, for the main loop to
+# swap in between frames
+pendingKeymaps = keymaps
+keymapDevices = keymaps.devices()
+
+# functionMacros keys a set of keymaps has no key for
+def unboundMacroKeys(keymaps):
+	return zxmacro.bindKeys(functionMacros, zxmacro.keyIndexNames(keymaps.names['keys'], shiftIndex, symbolIndex))[1]
+
+def keymapsChanged(new):
+	global pendingKeymaps
+	if new.devices() != keymapDevices:
+		log.warning('Keeping the keymaps in use: other matrices and joysticks only change on restart')
+		return
+	lostKeys = [key for key in unboundMacroKeys(new) if key not in unboundMacroKeys(pendingKeymaps)]
+	if lostKeys:
+		log.warning('Keeping the keymaps in use: they have no key %s for functionMacros', ', '.join(lostKeys))
+		return
+	pendingKeymaps = new
+
+def keymapsFailed(error):
+	log.warning('Keeping the keymaps in use: %s', error)
+
+keymapWatcher = None
+if watchKeymaps:
+	keymapWatcher = zxkeyfile.KeymapWatcher(keymapPath, loadKeymaps, keymapsChanged, keymapsFailed)
 
 # Setup GPIO
-wiringpi.wiringPiSetupGpio()
+
+# Every matrix's address and data lines (matrices can share data lines)
+allAddressLines = list(addressLines)
+allDataLines = list(dataLines)
+for matrixName, matrixAddressLines, matrixDataLines in extraMatrices:
+	allAddressLines += matrixAddressLines
+	allDataLines += [dataLine for dataLine in matrixDataLines if dataLine not in allDataLines]
 
 # Set all address lines high
-for addressLine in addressLines:
-	wiringpi.pinMode(addressLine, 1)
-	wiringpi.digitalWrite(addressLine, 1)
+for addressLine in allAddressLines:
+	hardware.pinMode(addressLine, 1)
+	hardware.digitalWrite(addressLine, 1)
 
 # Set all data lines for input
-for dataLine in dataLines:
-	wiringpi.pullUpDnControl(dataLine, 2)
+for dataLine in allDataLines:
+	hardware.pullUpDnControl(dataLine, 2)
+
+# Joystick switches pull their pins low
+for pin in joystickPins:
+	hardware.pinMode(pin, 0)
+	hardware.pullUpDnControl(pin, 2)
 
 # Setup Button
-wiringpi.pullUpDnControl(buttonGPIO, 2)
+hardware.pullUpDnControl(buttonGPIO, 2)
+
+# Mode change sounds, decoded once and played from a background thread
+player = zxaudio.Player(zxaudio.openSink(), {
+	'ding1': myDir + '/ding1.mp3',
+	'ding2': myDir + '/ding2.mp3'
+})
+feedback = zxfeedback.Feedback(sound=player.play)
+
+# Fast access to the matrix lines, all the matrices' in one scan if there
+# are others
+if extraMatrices:
+	matrixLines = hardware.matrixGroup([(addressLines, dataLines)] + [(matrixAddressLines, matrixDataLines) for matrixName, matrixAddressLines, matrixDataLines in extraMatrices])
+else:
+	matrixLines = hardware.matrixLines(addressLines, dataLines)
+
+# Report frames that miss their deadline, a line a second at most
+scheduler = zxscheduler.FrameScheduler(scanRate, rowSettle, zxscheduler.OverrunLog(log))
+
+# Report how long we slept and how quickly we woke up
+def reportWake(idleTime, latency):
+	log.info('Waking after %.1fs idle: %.2fms to wake, %.2f%% CPU while idle', idleTime, latency * 1000, idle.cpuUse() * 100)
+
+# Stop scanning when nothing is pressed and wait for an edge on a data line or the button
+idle = None
+if idleFrames:
+	idle = zxidle.IdleMode(hardware.edgeSource(allDataLines + joystickPins + [buttonGPIO]), idleFrames, onWake=reportWake)
+
+# Ignore contact bounce
+debouncer = zxmatrix.Debouncer(debouncePress, debounceRelease)
+
+# Scan fast while keys are in use and slow down when they aren't
+rate = None
+if slowScanRate < scanRate:
+	rate = zxrate.AdaptiveRate(scheduler, zxrate.rateLadder(scanRate, slowScanRate), rateQuietTime)
+
+# Keep ghost keys out (the membrane has no diodes)
+rollover = zxrollover.RolloverFilter(ghostPolicies[keyboardMode])
+
+# Read the joysticks in the same frame, debounced with the keys
+joysticks = None
+if joystickPins:
+	joysticks = zxjoystick.Joysticks(hardware.switchLines(joystickPins), joystickShift, [joystickKeys for joystickName, switchPins, joystickKeys in keymaps.joysticks])
+
+engine = zxengine.ScanEngine(matrixLines, scheduler, idle, debouncer, stats, rate, rollover, joysticks)
+
+# In low jitter mode the scan thread and this one run at real-time
+# priority (the scan thread takes it on itself; no other thread, like the
+# log writer or the stats server, inherits it)
+realtime = None
+if lowJitter:
+	realtime = zxrealtime.RealtimeMode(realtimePriority, cpus=realtimeCpus)
+	realtime.schedule()
+	realtime.lockMemory()
+
+# Scan in a thread of its own so nothing below can hold it up
+def buttonDown():
+	return hardware.digitalRead(buttonGPIO) == False
+
+# Emulators can read the keyboard straight from shared memory as well
+export = None
+if matrixExport:
+	export = zxshm.MatrixExport(matrixExport)
+
+scanThread = zxengine.ScanThread(engine, buttonDown, export=export, realtime=realtime)
+scanThread.start()
+
+stats.gauge('overruns', lambda: scheduler.overruns)
+stats.gauge('ringOverflows', lambda: scanThread.ring.overflows)
+stats.gauge('maxRollover', lambda: rollover.maxRollover)
+stats.gauge('ghostRectangles', lambda: rollover.rectangles)
+stats.gauge('ghostsSuppressed', lambda: rollover.suppressed)
+stats.gauge('joystickMoves', lambda: gamepads.moves)
+if rate:
+	for dwellRate in rate.rates:
+		stats.gauge('dwell%gHz' % dwellRate, lambda dwellRate=dwellRate: rate.dwell[dwellRate])
+statsServer = None
+if statsSocket:
+	statsServer = zxstats.StatsServer(stats, statsSocket)
+
+# Tap the button to switch keymaps, hold it for 3 seconds to kill FUSE
+def switchMode(held):
+	global keyboardMode
+	stats.modeSwitches += 1
+	if(keyboardMode == 0):
+		log.info('Switching to Function Keys')
+		keyboardMode = 1;
+		feedback.play('ding2')
+	else:
+		log.info('Switching to Spectrum Keys')
+		keyboardMode = 0;
+		feedback.play('ding1')
+	rollover.setPolicy(ghostPolicies[keyboardMode])
+	macro.stop()
+
+def killFuse(held):
+	log.info('Killing FUSE')
+	os.system('sudo killall fuse')
+
+def buttonHeld(held):
+	if(held == 0):
+		log.info('Button pressed')
+
+# Type macros a key at a time from the main loop
+macro = zxmacro.MacroPlayer(batch, macroHold, macroGap, macroRepeatGap)
+stats.gauge('macroKeys', lambda: macro.typed)
+
+def startMacro(name):
+	if name not in macroSteps:
+		log.warning('No macro %s', name)
+		return
+	log.info('Typing macro %s', name)
+	macro.play(macroSteps[name])
+
+gestures = zxbutton.ButtonGestures()
+gestures.on(zxbutton.TAP, switchMode)
+gestures.on(zxbutton.LONG_PRESS, killFuse)
+gestures.on(zxbutton.HOLD, buttonHeld)
+for gesture, name in gestureMacros.items():
+	gestures.on(gesture, lambda held, name=name: startMacro(name))
+
+# Ghost key rectangles logged so far
+rectangles = 0
+
+# Event sent for each key that's down, released whatever the keymap is by
+# the time it comes up
+pressedCodes = {}
+
+# Release the keys in pressedCodes: the Spectrum's, and the other
+# matrices' too if extras
+def releasePressed(extras):
+	for keyIndex in sorted(pressedCodes):
+		if keyIndex < zxmatrix.KEYS:
+			batch.release(pressedCodes.pop(keyIndex))
+		elif extras:
+			extraBatches[keyIndex // zxmatrix.KEYS - 1].release(pressedCodes.pop(keyIndex))
+		else:
+			continue
+		stats.releases += 1
+	for pressedBatch in [batch] + extraBatches:
+		pressedBatch.flush()
+
+# Last frame from the scan thread
+button = False
+frameTime = 0
+
+# Startup is over: take everything built so far out of the garbage
+# collector's way
+if realtime:
+	realtime.freezeHeap()
+	log.info('%s', realtime.report())
 
 # Announce
-print("Running")
+log.info('Running')
 
 try:
 
 	# Loop forever
 	while True:
-		
-		# Button check
-		if(wiringpi.digitalRead(buttonGPIO) == False):
-
-			# Record time the button was pressed
-			if(buttonPressed == -1):
-				buttonPressed = int(time.time())
-				print('Button pressed')
-
-		elif(buttonPressed != -1):
-
-			# Button released - but how long was it pressed for?
-			buttonTime = int(time.time()) - buttonPressed
-
-			# If over 3 secs, switch keyboard mode
-			if(buttonTime < 3):
-
-				# Switch modes
-				if(keyboardMode == 0):
-					print("Switching to Function Keys")
-					keyboardMode = 1;
-					os.system('mpg123 -q ' + myDir +'/ding2.mp3 &')
-				else:
-					print("Switching to Spectrum Keys")
-					keyboardMode = 0;
-					os.system('mpg123 -q ' + myDir +'/ding1.mp3 &')
-
-			else:
-
-				print('Killing FUSE')
-				os.system('sudo killall fuse')
-
-			# Reset
-			buttonPressed = -1
-			
-		# Individually set each address line low
-		for addressLine in range(8):
-			
-			# Set low
-			wiringpi.digitalWrite(addressLines[addressLine], 0)
-			
-			# Scan data lines
-			for dataLine in range(5):
-
-				# Get state and details for this button
-				isFree = wiringpi.digitalRead(dataLines[dataLine])
-				if(keyboardMode == 0):
-					keyPressed = keys[addressLine][dataLine]
-				else:
-					keyPressed = funcKeys[addressLine][dataLine]
-				keyCode = getattr(uinput, 'KEY_' + keyPressed)
-
-				# If pressed for the first time
-				if(isFree == False and keyTrack[addressLine][dataLine] == False):
-
-					# Press the key and make a note
-					print('Pressing ' + keyPressed)
-					device.emit(keyCode, 1)
-					keyTrack[addressLine][dataLine] = True
-
-				# If not pressed now but was pressed on last check
-				elif(isFree == True and keyTrack[addressLine][dataLine] == True):
-					
-					# Release the key and make a note
-					print('Releasing ' + keyPressed)
-					device.emit(keyCode, 0)
-					keyTrack[addressLine][dataLine] = False
-
-			# Set high
-			wiringpi.digitalWrite(addressLines[addressLine], 1)
-
-			# Have a quick snooze (suggested by Keef)
-			time.sleep(.01)
+
+		# Wait for the scan thread to see something change (or for the
+		# button to be due a gesture, or a macro its next key)
+		timeouts = [t for t in (gestures.timeout(), macro.timeout()) if t is not None]
+		frame = scanThread.ring.pop(min(timeouts) if timeouts else None)
+		if frame:
+			frameTime, matrix, changed, button = frame
+			gestures.update(button, int(frameTime * zxbutton.SECOND))
+		else:
+			changed = 0
+			gestures.update(button)
+
+		# New keymaps from the watcher
+		newKeymaps = pendingKeymaps
+		if newKeymaps is not keymaps:
+			log.info('Keymaps reloaded from %s', keymapPath)
+			if newKeymaps.dataLines != dataLines or newKeymaps.addressLines != addressLines:
+				log.warning('Wiring %s takes effect on restart', newKeymaps.wiring)
+			useKeymaps(newKeymaps)
+			if joysticks:
+				joysticks.setKeys([joystickKeys for joystickName, switchPins, joystickKeys in newKeymaps.joysticks])
+
+		# Say when keys might be ghosts
+		if rollover.rectangles != rectangles:
+			rectangles = rollover.rectangles
+			allNames = keyNames + extraNames
+			log.info('Possible ghost keys: %s', ' '.join(str(allNames[i]) for i in zxmatrix.keyIndexes(rollover.rectangle)))
+
+		# Next key of a macro, once real key presses have caught up
+		if macro.playing() and not len(scanThread.ring):
+			if not macro.poll():
+				log.info('Macro typed %d keys in %.2fs', macro.typed, macro.elapsed)
+
+		# Other matrices' keys go straight out through their own devices,
+		# whatever the mode
+		if changed & extraMask:
+			for keyIndex in zxmatrix.keyIndexes(changed & extraMask):
+				extraIndex = keyIndex - zxmatrix.KEYS
+				extraBatch = extraBatches[extraIndex // zxmatrix.KEYS]
+				if((matrix >> keyIndex) & 1):
+					if extraCodes[extraIndex] is None:
+						continue
+					log.debug('Pressing %s', extraNames[extraIndex])
+					stats.presses += 1
+					pressedCodes[keyIndex] = extraCodes[extraIndex]
+					extraBatch.press(extraCodes[extraIndex])
+				elif keyIndex in pressedCodes:
+					log.debug('Releasing %s', extraNames[extraIndex])
+					stats.releases += 1
+					extraBatch.release(pressedCodes.pop(keyIndex))
+			for extraBatch in extraBatches:
+				extraBatch.flush(frameTime)
+
+		# Joysticks not on keys go out through their gamepad devices
+		gamepads.update(matrix, changed, frameTime)
+		changed &= zxmatrix.MASK
+
+		# Keymap for this pass
+		if(keyboardMode == 0):
+			modeNames = keyNames
+			modeCodes = keyCodes
+		else:
+			modeNames = funcKeyNames
+			modeCodes = funcKeyCodes
+
+		for keyIndex in zxmatrix.keyIndexes(changed):
+
+			# Pressed since the last check
+			if((matrix >> keyIndex) & 1):
+
+				# Keys bound to macros in Function Keys mode type them instead
+				if(keyboardMode == 1 and keyIndex in functionMacroKeys):
+					startMacro(functionMacroKeys[keyIndex])
+					continue
+
+				# Keys the keymap leaves out (-)
+				if modeCodes[keyIndex] is None:
+					continue
+
+				# Press the key
+				log.debug('Pressing %s', modeNames[keyIndex])
+				stats.presses += 1
+				pressedCodes[keyIndex] = modeCodes[keyIndex]
+				batch.press(modeCodes[keyIndex])
+
+			# Released since the last check
+			elif keyIndex in pressedCodes:
+
+				# Release the key
+				log.debug('Releasing %s', modeNames[keyIndex])
+				stats.releases += 1
+				batch.release(pressedCodes.pop(keyIndex))
+
+		# Send this scan's key events
+		batch.flush(frameTime)
 		
 
 except KeyboardInterrupt:
+	log.info('Frame ring: %d overflows, high water %d', scanThread.ring.overflows, scanThread.ring.highWater)
+	if log.dropped:
+		log.warning('Log: %d messages dropped', log.dropped)
+	macro.stop()
+	releasePressed(True)
+	if keymapWatcher:
+		keymapWatcher.close()
+	feedback.close()
+	player.close()
+	if statsServer:
+		statsServer.close()
+	if export:
+		export.close()
+	log.close()
 	sys.exit(0)
\ No newline at end of file
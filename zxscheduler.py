@@ -0,0 +1,108 @@
+#
+# ZX Raspberry Keyboard Scanner - scan timing
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Runs matrix scans at a fixed rate instead of sleeping 10ms after every
+# address line (which capped us at about 12 scans a second).
+#
+# Frame start times are kept on a fixed grid of the monotonic clock: each
+# deadline is the previous one plus the period, not "now" plus the period,
+# so time spent scanning and emitting doesn't make the rate drift. When a
+# frame runs past the next deadline it is counted as an overrun and the
+# schedule skips ahead to the next slot rather than trying to catch up.
+#
+
+import time
+
+
+class FrameScheduler(object):
+
+    # rate:      full matrix scans per second
+    # settle:    seconds to wait between driving an address line low and
+    #            reading the data lines (microseconds, so busy-waited)
+    # onOverrun: called with the lateness in seconds when a frame is late
+    def __init__(self, rate=500, settle=10e-6, onOverrun=None, clock=time.monotonic, sleep=time.sleep):
+        self.period = 1.0 / rate
+        self.settleTime = settle
+        self.onOverrun = onOverrun
+        self.clock = clock
+        self.sleep = sleep
+        self.nextFrame = None
+        self.frames = 0
+        self.overruns = 0
+        self.worstLateness = 0.0
+
+    # Wait for the data lines to settle after selecting an address line
+    #
+    # Far too short for sleep() to be any use, so spin on the clock.
+    def settle(self):
+        if self.settleTime > 0:
+            end = self.clock() + self.settleTime
+            while self.clock() < end:
+                pass
+
+    # Wait for the start of the next frame
+    #
+    # Call at the top of the scan loop; the first call starts the schedule.
+    def waitNextFrame(self):
+        now = self.clock()
+        if self.nextFrame is None:
+            self.nextFrame = now
+        elif now < self.nextFrame:
+            self.sleep(self.nextFrame - now)
+        else:
+            lateness = now - self.nextFrame
+            if lateness > 0:
+                self.overruns += 1
+                if lateness > self.worstLateness:
+                    self.worstLateness = lateness
+                if self.onOverrun:
+                    self.onOverrun(lateness)
+
+                # Drop the slots we missed and start on the next one
+                self.nextFrame += int(lateness / self.period) * self.period
+        self.nextFrame += self.period
+        self.frames += 1
+
+    # Change the rate, starting with the frame we're waiting for next
+    def setRate(self, rate):
+        period = 1.0 / rate
+        if self.nextFrame is not None:
+            self.nextFrame += period - self.period
+        self.period = period
+
+    # Start the schedule again from now (after a pause in scanning)
+    def restart(self):
+        self.nextFrame = None
+
+
+# onOverrun for FrameScheduler that logs at most one line every interval
+# seconds, so a slow machine missing deadlines doesn't flood the log (from
+# the scan thread) with a line a frame: the first overrun is logged as it
+# happens, later ones as a count once interval has gone by since the last
+# line. The scheduler's overruns count has every one.
+class OverrunLog(object):
+
+    # log: zxlog.Logger (or anything with warning())
+    def __init__(self, log, interval=1.0, clock=time.monotonic):
+        self.log = log
+        self.interval = interval
+        self.clock = clock
+        self.logged = None
+        self.count = 0
+        self.worst = 0.0
+
+    def __call__(self, lateness):
+        self.count += 1
+        if lateness > self.worst:
+            self.worst = lateness
+        now = self.clock()
+        if self.logged is not None and now - self.logged < self.interval:
+            return
+        if self.count == 1:
+            self.log.warning('Scan overrun: %.1fms late', lateness * 1000)
+        else:
+            self.log.warning('Scan overruns: %d in %.1fs, worst %.1fms late', self.count, now - self.logged, self.worst * 1000)
+        self.logged = now
+        self.count = 0
+        self.worst = 0.0
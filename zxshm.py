@@ -0,0 +1,137 @@
+#
+# ZX Raspberry Keyboard Scanner - shared memory matrix export
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# Going through uinput an emulator gets PC key codes and has to map them
+# back onto the Spectrum's keyboard, which loses things (symbol shift
+# arrives as left control, chords arrive one key at a time) and adds the
+# kernel's input layer on the way. MatrixExport publishes the keyboard as
+# the Spectrum itself sees it instead, every scan, in a 32 byte file that
+# readers map into memory (by default in /dev/shm, so it is the POSIX
+# shared memory object "/zxkeyboard" to shm_open()):
+#
+#   offset  size
+#   0       4     magic 'ZXKB'
+#   4       4     layout version (1)
+#   8       4     sequence number (odd while the writer is part way through)
+#   12      4     reserved (0)
+#   16      8     time of the scan, CLOCK_MONOTONIC seconds (a double)
+#   24      8     the half rows, in Spectrum order: byte n is what IN from
+#                 port 0xFE reads with address line A(8+n) low, so bits 0-4
+#                 are 0 for keys down and bits 5-7 are always 1
+#
+# All numbers are native endian. Readers never take a lock; they use the
+# sequence number as a seqlock:
+#
+#   1. read the sequence number; if it's odd, start again
+#   2. copy the time and the half rows
+#   3. read the sequence number again; if it has changed, start again
+#
+# The writer makes the sequence odd, writes, then makes it even, so a copy
+# that started and ended on the same even number can't have been torn.
+# Python can't issue memory barriers, which doesn't matter on a single core
+# Pi Zero; readers in C on a multicore board should use acquire loads.
+# Nothing is published while the scanner is idle (nothing is pressed then).
+#
+# MatrixReader is all an emulator written in Python needs.
+#
+
+import mmap, os, struct, time
+
+PATH = '/dev/shm/zxkeyboard'
+MAGIC = b'ZXKB'
+VERSION = 1
+SIZE = 32
+HEADER = struct.Struct('=4sII')
+
+# Spectrum half row for each address line of the 8x5 keymaps (row 0 is
+# 1-5, which the Spectrum reads with A11 low, and so on)
+HALF_ROWS = (3, 2, 1, 4, 5, 0, 6, 7)
+
+
+class MatrixExport(object):
+
+    def __init__(self, path=PATH, halfRows=HALF_ROWS, columns=5):
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, SIZE)
+            self.mem = mmap.mmap(fd, SIZE, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)
+        HEADER.pack_into(self.mem, 0, MAGIC, VERSION, 0)
+        self.words = memoryview(self.mem).cast('I')
+        self.doubles = memoryview(self.mem).cast('d')
+        # (half row, shift) for each address line
+        self.lines = tuple((halfRow, line * columns) for line, halfRow in enumerate(halfRows))
+        self.rows = bytearray(b'\xff' * 8)
+        self.sequence = 0
+        self.mem[24:32] = self.rows
+
+    # Publish one scan's (debounced) zxmatrix bitmask
+    def publish(self, matrix, frameTime):
+        rows = self.rows
+        for halfRow, shift in self.lines:
+            rows[halfRow] = 0xFF ^ ((matrix >> shift) & 0x1F)
+        words = self.words
+        words[2] = self.sequence + 1
+        self.doubles[2] = frameTime
+        self.mem[24:32] = rows
+        self.sequence = (self.sequence + 2) & 0xFFFFFFFF
+        words[2] = self.sequence
+
+    # Take the file away so no new readers find it; the mapping itself goes
+    # with the process, as the scan thread may be publishing right up to exit
+    def close(self):
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class MatrixReader(object):
+
+    def __init__(self, path=PATH):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            self.mem = mmap.mmap(fd, SIZE, mmap.MAP_SHARED, mmap.PROT_READ)
+        finally:
+            os.close(fd)
+        magic, version, sequence = HEADER.unpack_from(self.mem, 0)
+        if magic != MAGIC or version != VERSION:
+            self.mem.close()
+            raise ValueError('%s is not a version %d keyboard export' % (path, VERSION))
+        self.words = memoryview(self.mem).cast('I')
+        self.doubles = memoryview(self.mem).cast('d')
+        # Snapshots that had to be taken again because the writer was busy
+        self.retries = 0
+
+    # A consistent snapshot: (sequence, scan time, 8 half row bytes)
+    def read(self):
+        words = self.words
+        while True:
+            sequence = words[2]
+            if not sequence & 1:
+                frameTime = self.doubles[2]
+                rows = self.mem[24:32]
+                if words[2] == sequence:
+                    return sequence, frameTime, rows
+            self.retries += 1
+            # let a writer we've interrupted finish
+            time.sleep(0)
+
+    # What IN from port 0xFE reads with the given high address byte
+    # (every half row whose address line is low, ANDed together)
+    def port(self, high, rows=None):
+        if rows is None:
+            rows = self.read()[2]
+        value = 0xFF
+        for halfRow in range(8):
+            if not (high >> halfRow) & 1:
+                value &= rows[halfRow]
+        return value
+
+    def close(self):
+        self.words.release()
+        self.doubles.release()
+        self.mem.close()
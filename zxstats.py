@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+#
+# ZX Raspberry Keyboard Scanner - live statistics
+# MIT License (https://opensource.org/licenses/MIT) see LICENSE
+#
+# The scanners keep fixed bucket histograms of
+#
+#   framePeriod  time from one scan to the next
+#   rowRead      time to read one row (each scan's read time / 8)
+#   pressToEmit  time from the scan that saw a key change to its events
+#                having been written
+#   emitTime     time taken writing one scan's events
+#
+# and count presses, releases and mode switches. Adding a sample is a
+# bisect and an increment; each histogram only ever has one thread adding
+# to it so none of this takes a lock.
+#
+# StatsServer answers connections on a Unix socket with a JSON snapshot
+# (everything above plus any gauges, like the scheduler's overrun count)
+# and nothing else, so nothing is spent on it until someone asks. Each
+# scanner has a socket of its own, named after its script, so both can run
+# at once: /tmp/zxscanner.sock and /tmp/keyscanner.sock. Run this file to
+# ask (zxscanner.py unless -s says otherwise):
+#
+#   python3 zxstats.py [-s socket] [-w seconds] [--json]
+#
+
+import argparse, bisect, json, os, socket, sys, threading, time
+from array import array
+
+
+# Stats socket for a scanner script: /tmp/<script name>.sock
+def socketPath(script):
+    return os.path.join('/tmp', os.path.splitext(os.path.basename(script))[0] + '.sock')
+
+
+SOCKET = socketPath('zxscanner.py')
+
+# Bucket upper bounds in seconds: 1, 1.5, 2, 3, 5, 7, 10... microseconds up
+# to 1 second, then everything slower
+BOUNDS = tuple(m * 10 ** e / 1e6 for e in range(6) for m in (1, 1.5, 2, 3, 5, 7)) + (1.0,)
+
+
+class Histogram(object):
+
+    def __init__(self, bounds=BOUNDS):
+        self.bounds = bounds
+        self.counts = array('L', [0] * (len(bounds) + 1))
+        self.total = 0.0
+        self.worst = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.total += seconds
+        if seconds > self.worst:
+            self.worst = seconds
+
+    # Upper bound of the bucket holding the given fraction of samples (or
+    # the slowest sample, if that's lower)
+    def percentile(self, fraction, counts=None):
+        counts = counts or self.counts
+        wanted = sum(counts) * fraction
+        seen = 0
+        for bucket, count in enumerate(counts):
+            seen += count
+            if count and seen >= wanted:
+                if bucket < len(self.bounds):
+                    return min(self.bounds[bucket], self.worst)
+                return self.worst
+        return 0.0
+
+    def snapshot(self):
+        counts = list(self.counts)
+        samples = sum(counts)
+        return {
+            'bounds': self.bounds,
+            'counts': counts,
+            'samples': samples,
+            'mean': self.total / samples if samples else 0.0,
+            'p50': self.percentile(.5, counts),
+            'p99': self.percentile(.99, counts),
+            'max': self.worst,
+        }
+
+
+class ScanStats(object):
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.framePeriod = Histogram()
+        self.rowRead = Histogram()
+        self.pressToEmit = Histogram()
+        self.emitTime = Histogram()
+        self.presses = 0
+        self.releases = 0
+        self.modeSwitches = 0
+        self.gauges = {}
+
+    # Report read() under name in every snapshot
+    def gauge(self, name, read):
+        self.gauges[name] = read
+
+    def snapshot(self):
+        snapshot = {
+            'uptime': time.monotonic() - self.started,
+            'histograms': dict((name, getattr(self, name).snapshot())
+                for name in ('framePeriod', 'rowRead', 'pressToEmit', 'emitTime')),
+            'counters': {
+                'presses': self.presses,
+                'releases': self.releases,
+                'modeSwitches': self.modeSwitches,
+            },
+        }
+        for name, read in self.gauges.items():
+            snapshot['counters'][name] = read()
+        return snapshot
+
+
+class StatsServer(object):
+
+    def __init__(self, stats, path=SOCKET):
+        self.stats = stats
+        self.path = path
+        if os.path.exists(path):
+            os.unlink(path)
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.bind(path)
+        self.socket.listen(4)
+        self.thread = threading.Thread(target=self.run, name='stats')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while True:
+            try:
+                connection, address = self.socket.accept()
+            except OSError:
+                return
+            try:
+                connection.sendall(json.dumps(self.stats.snapshot()).encode())
+            except OSError:
+                pass
+            finally:
+                connection.close()
+
+    def close(self):
+        self.socket.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+# Ask a running scanner for its statistics
+def query(path=SOCKET):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+        chunks = []
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        client.close()
+    return json.loads(b''.join(chunks).decode())
+
+
+def formatSnapshot(snapshot):
+    lines = ['up %.0fs' % snapshot['uptime']]
+    lines.append('  '.join('%s %d' % item for item in sorted(snapshot['counters'].items())))
+    lines.append('%-12s %9s %9s %9s %9s %9s' % ('', 'samples', 'mean', 'p50', 'p99', 'max'))
+    for name, histogram in sorted(snapshot['histograms'].items()):
+        lines.append('%-12s %9d %7.3fms %7.3fms %7.3fms %7.3fms' % (name, histogram['samples'],
+            histogram['mean'] * 1000, histogram['p50'] * 1000, histogram['p99'] * 1000, histogram['max'] * 1000))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show a running scanner\'s statistics')
+    parser.add_argument('-s', '--socket', default=SOCKET,
+        help='the scanner\'s stats socket (default %s, zxscanner.py\'s; keyscanner.py\'s is %s)' % (SOCKET, socketPath('keyscanner.py')))
+    parser.add_argument('-w', '--watch', type=float, help='show them again every this many seconds')
+    parser.add_argument('--json', action='store_true', help='print the raw JSON snapshot')
+    args = parser.parse_args()
+    while True:
+        try:
+            snapshot = query(args.socket)
+        except OSError as e:
+            sys.exit('Unable to reach the scanner at %s: %s' % (args.socket, e))
+        print(json.dumps(snapshot, indent=1) if args.json else formatSnapshot(snapshot))
+        if not args.watch:
+            break
+        time.sleep(args.watch)
+        print()
+
+
+if __name__ == '__main__':
+    main()